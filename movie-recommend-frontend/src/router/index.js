@@ -102,8 +102,11 @@ router.beforeEach((to, from, next) => {
     }
 
     // 已登录：调用后端接口验证是否为管理员
+    // 有登录令牌时放在请求头中（后端直接校验令牌，不查数据库）；旧的登录状态只有用户ID
+    const token = localStorage.getItem('token')
     axios.get('http://localhost:5000/api/user/is-admin', { 
-      params: { uid: userId } // 传用户ID给后端
+      params: { uid: userId }, // 传用户ID给后端
+      headers: token ? { Authorization: token } : {}
     })
     .then(res => {
       if (res.data.code === 1 && res.data.data.is_admin) {
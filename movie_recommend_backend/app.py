@@ -1,5 +1,5 @@
 # 后端主程序入口，启动后端服务，定义接口
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, request, jsonify, Response, send_file, stream_with_context, g
 from flask_cors import CORS  # 解决跨域问题（前端和后端端口不同导致的访问限制）
 from config import Config  # 导入配置文件
 from models import db  # 导入数据库对象
@@ -7,36 +7,122 @@ from models.user import User
 from models.movie import Movie
 from models.history import UserHistory
 from models.rating import UserRating
-from services import user_service, movie_service, recommend_service
-from utils.auth import admin_required
+from models.recommendation import UserRecommendation
+from models.genre import Genre, MovieGenre
+from models.person import Person, MoviePerson
+from models.import_progress import ImportProgress
+from services import user_service, movie_service, recommend_service, recommend_model, item_model, als_model, ann_index, history_buffer, poster_cache, search_index, browse_service
+from utils.auth import admin_required, get_identity
+from utils.poster import sniff_mimetype
+from utils.schema import missing_columns, missing_indexes
+from utils import cache, metrics
 
 import traceback  # 新增：打印详细错误日志
 import base64  # 重新添加：用于Base64解码
+import datetime
+import os
 
-# 1. 初始化Flask应用
-app = Flask(__name__)
-# 2. 加载配置（数据库连接等）
-app.config.from_object(Config)
-# 3. 初始化数据库（将db与app关联）
-db.init_app(app)
-# 4. 解决跨域问题（允许前端访问后端接口）
-# 关键修改1：精细化跨域配置，适配前端5173端口+管理员接口权限
-CORS(app, resources={
-    r"/api/*": {
-        "origins": "http://localhost:5173",  # 仅允许前端5173端口访问
-        "methods": ["GET", "POST", "PUT", "DELETE"],  # 支持前端所有请求方式
-        "allow_headers": ["Authorization", "Content-Type"],  # 允许前端传的请求头
-        "supports_credentials": True  # 允许携带凭证（如token）
-    }
-})
+# 所有接口注册在蓝图上，由create_app()挂到应用
+api = Blueprint("api", __name__)
+
+
+def create_app(config=None, start_background=True):
+    """
+    创建并初始化应用（每个进程调用一次；开发服务器、gunicorn（wsgi.py）、asgi.py、manage.py共用）
+    :param config: 覆盖Config的配置项（dict），如 {"SQLALCHEMY_DATABASE_URI": "sqlite:///..."}
+    :param start_background: 是否启动后台线程（推荐模型构建、缺失索引的构建、浏览记录缓冲写入）；
+        离线命令和基准测试传False，只加载磁盘上已有的模型/索引，避免与命令本身重复计算、争抢CPU和数据库
+    """
+    # 1. 初始化Flask应用
+    app = Flask(__name__)
+    # 2. 加载配置（数据库连接等）
+    app.config.from_object(Config)
+    if config:
+        app.config.update(config)
+    if not os.environ.get("SECRET_KEY") and not (config or {}).get("SECRET_KEY"):
+        print("警告：未设置环境变量SECRET_KEY，使用随机生成的密钥：重启后已签发的登录令牌全部失效，"
+              "多进程部署时各进程的令牌互不认可")
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
+    # 3. 初始化数据库（将db与app关联）
+    db.init_app(app)
+    # 4. 解决跨域问题（允许前端访问后端接口）
+    # 关键修改1：精细化跨域配置，适配前端5173端口+管理员接口权限
+    CORS(app, resources={
+        r"/api/*": {
+            "origins": "http://localhost:5173",  # 仅允许前端5173端口访问
+            "methods": ["GET", "POST", "PUT", "DELETE"],  # 支持前端所有请求方式
+            "allow_headers": ["Authorization", "Content-Type"],  # 允许前端传的请求头
+            "supports_credentials": True  # 允许携带凭证（如token）
+        }
+    })
+    app.register_blueprint(api)
+    # 请求监控：接口延迟、SQL条数/耗时、响应大小（/metrics）
+    metrics.init_app(app)
+
+    # 5. 创建数据库表（首次启动时执行，确保表存在）
+    with app.app_context():
+        db.create_all()  # 如果表不存在，自动创建（已通过SQL脚本创建，这里是双重保障）
+        models = [User, Movie, UserHistory, UserRating, UserRecommendation,
+                  Genre, MovieGenre, Person, MoviePerson, ImportProgress]
+        # create_all不会给已有表加字段：缺字段时查询会直接报错，服务拒绝启动；
+        # 离线命令只提示（manage.py migrate 本身也要先创建应用）
+        missing = missing_columns(db, models)
+        if missing:
+            message = f"数据库缺少字段 {missing}，请先执行 python manage.py migrate"
+            if start_background:
+                raise RuntimeError(message)
+            print(f"警告：{message}")
+        # 同样不会给已有表加索引：检查模型中声明的索引是否都已存在，缺失时提示执行迁移
+        missing = missing_indexes(db, models)
+        if missing:
+            print(f"警告：数据库缺少索引 {missing}，热点查询会全表扫描，请执行 python manage.py migrate")
+
+    # 6. 初始化接口结果缓存、海报缩略图缓存、浏览记录缓冲写入
+    cache.init_app(app)
+    poster_cache.init_app(app)
+    if start_background:
+        history_buffer.init_app(app)  # 不启用时浏览记录逐条同步写入
+
+    # 7. 加载/构建电影搜索索引
+    search_index.init_app(app, build_missing=start_background)
+
+    # 8. 后台构建推荐模型（构建完成前推荐接口自动走实时计算）
+    if start_background:
+        recommend_model.start_background_build(app, interval=app.config["RECOMMEND_MODEL_REFRESH_SECONDS"],
+                                               sync_interval=app.config["RECOMMEND_MODEL_SYNC_SECONDS"],
+                                               apply_delay=app.config["RECOMMEND_MODEL_APPLY_DELAY"])
 
-# 5. 创建数据库表（首次启动时执行，确保表存在）
-with app.app_context():
-    db.create_all()  # 如果表不存在，自动创建（已通过SQL脚本创建，这里是双重保障）
+    # 9. 加载电影相似度表（基于物品的推荐，mode=item）
+    item_model.init_app(app, build_missing=start_background)
+
+    # 10. 加载ALS矩阵分解模型（mode=als，由 manage.py train-als 离线训练）
+    als_model.init_app(app)
+
+    # 11. 加载相似电影索引（近似最近邻）
+    ann_index.init_app(app, build_missing=start_background)
+    return app
+
+
+def engine_options(config):
+    """
+    数据库连接池参数（来自配置/环境变量）
+    SQLite（本地压测用）不是连接池意义上的服务器，只保留通用参数
+    """
+    options = {
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+    }
+    if not config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+        options.update({
+            "pool_size": config["DB_POOL_SIZE"],
+            "max_overflow": config["DB_MAX_OVERFLOW"],
+            "pool_timeout": config["DB_POOL_TIMEOUT"],
+        })
+    return options
 
 # ---------------------- 1. 用户相关接口 ----------------------
 # 接口1：用户注册（前端通过POST请求调用）
-@app.route("/api/user/register", methods=["POST"])
+@api.route("/api/user/register", methods=["POST"])
 def api_user_register():
     # 获取前端传入的JSON数据
     data = request.get_json()
@@ -46,45 +132,51 @@ def api_user_register():
     return jsonify(result)
 
 # 接口2：用户登录（前端通过POST请求调用）
-@app.route("/api/user/login", methods=["POST"])
+@api.route("/api/user/login", methods=["POST"])
 def api_user_login():
     data = request.get_json()
     result = user_service.login(db, data)
     return jsonify(result)
 
 # 接口3：添加浏览记录（用户看电影后调用）
-@app.route("/api/user/history/add", methods=["POST"])
+@api.route("/api/user/history/add", methods=["POST"])
 def api_add_history():
     data = request.get_json()
     result = user_service.add_history(db, data)
     return jsonify(result)
 
 # 接口4：添加评分（用户评分电影后调用）
-@app.route("/api/user/rating/add", methods=["POST"])
+@api.route("/api/user/rating/add", methods=["POST"])
 def api_add_rating():
     data = request.get_json()
     result = user_service.add_rating(db, data)
     return jsonify(result)
 
+# 接口4-1：批量添加评分（新用户引导页一次提交多部电影的评分）
+@api.route("/api/user/rating/batch", methods=["POST"])
+def api_add_ratings():
+    data = request.get_json() or {}
+    result = user_service.add_ratings(db, data)
+    return jsonify(result)
+
 # 【新增】接口：验证用户是否为管理员（给前端路由守卫用）
-@app.route("/api/user/is-admin", methods=["GET"])
+@api.route("/api/user/is-admin", methods=["GET"])
 def api_check_admin():
     try:
-        # 获取前端传入的用户ID参数
-        user_id = request.args.get("uid")
-        if not user_id:
+        # 优先校验请求头中的登录令牌（不查数据库）；旧前端只传uid参数时按用户ID查询（带缓存）
+        credential = request.headers.get("Authorization") or request.args.get("uid")
+        if not credential:
             return jsonify({"code": 0, "msg": "缺少用户ID", "data": {}})
         
-        # 查询用户信息
-        user = User.query.get(int(user_id))
-        if not user:
-            return jsonify({"code": 0, "msg": "用户不存在", "data": {}})
+        identity = get_identity(credential)
+        if identity is None:
+            return jsonify({"code": 0, "msg": "用户不存在或登录已失效", "data": {}})
         
         # 返回是否为管理员的结果
         return jsonify({
             "code": 1,
             "msg": "验证管理员权限成功",
-            "data": {"is_admin": user.is_admin}
+            "data": {"is_admin": identity[1]}
         })
     except Exception as e:
         # 捕获异常并返回错误信息
@@ -92,85 +184,198 @@ def api_check_admin():
 
 # ---------------------- 2. 电影相关接口 ----------------------
 # 接口5：获取电影列表（支持分页）
-@app.route("/api/movie/list", methods=["GET"])
+@api.route("/api/movie/list", methods=["GET"])
 def api_get_movie_list():
-    # 获取前端传入的分页参数（page=当前页，page_size=每页数量）
+    # 获取前端传入的分页参数（page=当前页，page_size=每页数量；传cursor时使用游标分页，首页传空字符串）
     page = request.args.get("page", 1, type=int)
     page_size = request.args.get("page_size", 10, type=int)
-    result = movie_service.get_movie_list(db, page, page_size)
+    cursor = request.args.get("cursor")
+    result = movie_service.get_movie_list(db, page, page_size, cursor)
     return jsonify(result)
 
 # 接口6：获取电影详情（根据电影ID）
-@app.route("/api/movie/detail/<int:movie_id>", methods=["GET"])
+@api.route("/api/movie/detail/<int:movie_id>", methods=["GET"])
 def api_get_movie_detail(movie_id):
     result = movie_service.get_movie_detail(db, movie_id)
     return jsonify(result)
 
 # 接口7：获取热门电影
-@app.route("/api/movie/hot", methods=["GET"])
+@api.route("/api/movie/hot", methods=["GET"])
 def api_get_hot_movies():
     limit = request.args.get("limit", 10, type=int)
     hot_movies = movie_service.get_hot_movies(db, limit)
     return jsonify({"code": 1, "msg": "获取热门电影成功", "data": hot_movies})
 
+# 接口：电影搜索（q=关键词，可按style/language/year筛选，支持分页）
+@api.route("/api/movie/search", methods=["GET"])
+def api_search_movies():
+    keyword = request.args.get("q", "")
+    style = request.args.get("style") or None
+    language = request.args.get("language") or None
+    year = request.args.get("year", type=int)
+    page = request.args.get("page", 1, type=int)
+    page_size = request.args.get("page_size", 10, type=int)
+    result = movie_service.search_movies(db, keyword, style, language, year, page, page_size)
+    return jsonify(result)
+
+# 接口：相似电影（详情页“相似推荐”，基于近似最近邻索引）
+@api.route("/api/movie/similar/<int:movie_id>", methods=["GET"])
+def api_get_similar_movies(movie_id):
+    limit = request.args.get("limit", 10, type=int)
+    result = recommend_service.get_similar_movies(db, movie_id, limit)
+    return jsonify(result)
+
+# 接口：分类统计（每个类别的电影数、作品最多的导演/演员，limit=导演/演员各返回多少名）
+@api.route("/api/movie/facets", methods=["GET"])
+def api_get_movie_facets():
+    limit = request.args.get("limit", 50, type=int)
+    result = browse_service.get_facets(db, limit)
+    return jsonify(result)
+
+# 接口：按类别浏览电影（附带这些电影的类别分布，用于继续筛选）
+@api.route("/api/movie/genre/<name>", methods=["GET"])
+def api_browse_genre(name):
+    page = request.args.get("page", 1, type=int)
+    page_size = request.args.get("page_size", 10, type=int)
+    result = browse_service.browse_by_genre(db, name, page, page_size)
+    return jsonify(result)
+
+# 接口：按导演/演员浏览电影（role=director|actor）
+@api.route("/api/movie/<any(director, actor):role>/<name>", methods=["GET"])
+def api_browse_person(role, name):
+    page = request.args.get("page", 1, type=int)
+    page_size = request.args.get("page_size", 10, type=int)
+    result = browse_service.browse_by_person(db, name, role, page, page_size)
+    return jsonify(result)
+
+# 接口：获取电影海报（二进制图片，支持ETag/Last-Modified协商缓存）
+# size参数：card=列表卡片缩略图，detail=详情页缩略图，不传=原图
+@api.route("/api/movie/<int:movie_id>/poster", methods=["GET"])
+def api_get_movie_poster(movie_id):
+    meta = movie_service.get_poster_meta(db, movie_id)
+    if not meta:
+        return jsonify({"code": 0, "msg": "该电影暂无海报", "data": {}}), 404
+    picture_hash, update_time = meta
+    size = request.args.get("size", "")
+    etag = f"{picture_hash}-{size}" if size in poster_cache.POSTER_SIZES else picture_hash
+    
+    def with_cache_headers(response, etag=etag, fallback=False):
+        response.set_etag(etag)
+        if update_time:
+            response.last_modified = update_time
+        response.cache_control.public = True
+        response.cache_control.no_cache = None  # send_file默认带no-cache，会让下面的max-age失效
+        if fallback:
+            # 要的是缩略图但返回了原图：只短期缓存，缩略图生成后浏览器能换成缩略图
+            response.cache_control.max_age = poster_cache.FALLBACK_MAX_AGE
+        elif request.args.get("v") == picture_hash[:12]:
+            # URL带内容版本号：海报变了URL也会变，可以长期缓存
+            response.cache_control.max_age = 31536000
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.max_age = 3600
+        return response
+    
+    # 浏览器缓存仍有效：直接返回304，不读取海报二进制
+    if request.if_none_match.contains(etag):
+        return with_cache_headers(Response(status=304))
+    
+    # 缩略图已生成：直接从磁盘缓存发送
+    variant = poster_cache.find_variant(picture_hash, size)
+    if variant:
+        return with_cache_headers(send_file(variant, mimetype="image/jpeg", etag=False, conditional=False)).make_conditional(request)
+    
+    # 没有缩略图（未安装Pillow/仍在生成/旧海报未回填）：返回原图（ETag用原图的摘要），同时补一次生成任务
+    picture = movie_service.get_poster_data(db, movie_id)
+    fallback = size in poster_cache.POSTER_SIZES
+    if fallback:
+        poster_cache.submit(picture_hash, picture)  # 同一海报已在生成中时不会重复提交
+    response = with_cache_headers(Response(picture, mimetype=sniff_mimetype(picture)), picture_hash, fallback)
+    return response.make_conditional(request)
+
 # ---------------------- 3. 推荐相关接口 ----------------------
 # 接口8：获取个性化推荐（根据用户ID）
-@app.route("/api/recommend/<int:user_id>", methods=["GET"])
+@api.route("/api/recommend/<int:user_id>", methods=["GET"])
 def api_get_recommend(user_id):
-    result = recommend_service.get_recommend_movies(db, user_id)
+    # mode=user（默认）基于用户的协同过滤，mode=item 基于物品的协同过滤，mode=als 矩阵分解
+    mode = request.args.get("mode", "user")
+    if mode not in recommend_service.RECOMMEND_MODES:
+        return jsonify({"code": 0, "msg": f"不支持的推荐模式：{mode}", "data": []})
+    result = recommend_service.recommend(db, user_id, mode)
     return jsonify(result)
 
 # ---------------------- 4. 管理员接口 ----------------------
 # 接口9：获取所有用户信息（管理员）
-@app.route("/api/admin/users", methods=["GET"])
+@api.route("/api/admin/users", methods=["GET"])
 @admin_required
 def api_get_all_users():
+    # 分页 + 过滤（is_admin、start_date、end_date、email前缀）
+    page = request.args.get("page", 1, type=int)
+    page_size = request.args.get("page_size", user_service.USER_PAGE_SIZE, type=int)
+    result = user_service.get_user_list(db, request.args, page, page_size)
+    return jsonify(result)
+
+# 接口：流式导出用户（format=csv/ndjson，过滤参数同用户列表）
+@api.route("/api/admin/users/export", methods=["GET"])
+@admin_required
+def api_export_users():
+    fmt = request.args.get("format", "csv")
     try:
-        users = User.query.all()
-        user_list = [{
-            "id": user.id,
-            "name": user.name,
-            "email": user.email,
-            "sex": "男" if user.sex else "女" if user.sex is not None else "未设置",
-            "create_time": user.create_time.strftime("%Y-%m-%d %H:%M:%S"),
-            "is_admin": user.is_admin
-        } for user in users]
-        return jsonify({"code": 1, "msg": "获取用户列表成功", "data": user_list})
-    except Exception as e:
-        return jsonify({"code": 0, "msg": f"获取失败：{str(e)}", "data": []})
+        rows = user_service.export_users(db, request.args, fmt)
+    except ValueError as e:
+        return jsonify({"code": 0, "msg": str(e), "data": {}})
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    filename = f"users_{datetime.datetime.now():%Y%m%d%H%M%S}.{fmt}"
+    # stream_with_context：生成器在响应发送期间执行，需要保留请求上下文（数据库会话）
+    return Response(stream_with_context(rows), mimetype=f"{mimetype}; charset=utf-8",
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+# 接口：设置/取消管理员身份（该用户需重新登录）
+@api.route("/api/admin/user/<int:user_id>/admin", methods=["PUT"])
+@admin_required
+def api_set_admin(user_id):
+    data = request.get_json() or {}
+    result = user_service.set_admin(db, user_id, data.get("is_admin"), operator_id=g.user_id)
+    return jsonify(result)
 
 # 接口10：获取用户行为记录（浏览+评分）
-@app.route("/api/admin/user/behavior/<int:user_id>", methods=["GET"])
+@api.route("/api/admin/user/behavior/<int:user_id>", methods=["GET"])
 @admin_required
 def api_get_user_behavior(user_id):
-    try:
-        # 浏览记录
-        histories = UserHistory.query.filter_by(uid=user_id).order_by(UserHistory.time.desc()).all()
-        history_list = [{
-            "mid": h.mid,
-            "movie_name": Movie.query.get(h.mid).name if Movie.query.get(h.mid) else "未知电影",
-            "time": h.time.strftime("%Y-%m-%d %H:%M:%S"),
-            "type": "浏览"
-        } for h in histories]
-        
-        # 评分记录
-        ratings = UserRating.query.filter_by(uid=user_id).order_by(UserRating.time.desc()).all()
-        rating_list = [{
-            "mid": r.mid,
-            "movie_name": Movie.query.get(r.mid).name if Movie.query.get(r.mid) else "未知电影",
-            "score": r.score,
-            "time": r.time.strftime("%Y-%m-%d %H:%M:%S"),
-            "type": "评分"
-        } for r in ratings]
-        
-        # 合并并按时间排序
-        behavior_list = sorted(history_list + rating_list, key=lambda x: x["time"], reverse=True)
-        return jsonify({"code": 1, "msg": "获取行为记录成功", "data": behavior_list})
-    except Exception as e:
-        return jsonify({"code": 0, "msg": f"获取失败：{str(e)}", "data": []})
+    # 浏览+评分合并的时间线，游标分页（首页不传cursor，之后传上一页返回的next_cursor）
+    page_size = request.args.get("page_size", user_service.BEHAVIOR_PAGE_SIZE, type=int)
+    cursor = request.args.get("cursor")
+    result = user_service.get_user_behavior(db, user_id, page_size, cursor)
+    return jsonify(result)
+
+# 接口：接口缓存统计（命中率、淘汰次数等）
+@api.route("/api/admin/cache/stats", methods=["GET"])
+@admin_required
+def api_get_cache_stats():
+    return jsonify({"code": 1, "msg": "获取缓存统计成功", "data": cache.get_stats()})
+
+# 接口：监控指标（Prometheus文本格式；多进程部署时为处理本次请求的worker的数据）
+@api.route("/metrics", methods=["GET"])
+def api_get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+# 接口：浏览记录缓冲写入统计（队列深度、批大小、写库耗时、丢弃数）
+@api.route("/api/admin/history-buffer/stats", methods=["GET"])
+@admin_required
+def api_get_history_buffer_stats():
+    return jsonify({"code": 1, "msg": "获取缓冲统计成功", "data": history_buffer.get_stats()})
+
+# 接口：管理员电影列表（完整简介，用于编辑回显）
+@api.route("/api/admin/movie/list", methods=["GET"])
+@admin_required
+def api_get_admin_movie_list():
+    page = request.args.get("page", 1, type=int)
+    page_size = request.args.get("page_size", 10, type=int)
+    result = movie_service.get_admin_movie_list(db, page, page_size)
+    return jsonify(result)
 
 # 关键修改2：添加电影接口（处理Base64转二进制）
-@app.route("/api/admin/movie/add", methods=["POST"])
+@api.route("/api/admin/movie/add", methods=["POST"])
 @admin_required
 def api_add_movie():
     try:
@@ -200,7 +405,7 @@ def api_add_movie():
         return jsonify({"code": 0, "msg": f"添加失败：{str(e)}", "data": {}})
 
 # 关键修改3：编辑电影接口（处理Base64转二进制）
-@app.route("/api/admin/movie/update/<int:movie_id>", methods=["PUT"])
+@api.route("/api/admin/movie/update/<int:movie_id>", methods=["PUT"])
 @admin_required
 def api_update_movie(movie_id):
     try:
@@ -228,6 +433,7 @@ def api_update_movie(movie_id):
         return jsonify({"code": 0, "msg": f"更新失败：{str(e)}", "data": {}})
 
 # ---------------------- 启动后端服务 ----------------------
+# 开发环境：python app.py（Flask开发服务器）；生产环境：gunicorn -c gunicorn.conf.py wsgi:app
 if __name__ == "__main__":
     # 启动服务：host=0.0.0.0（允许其他设备访问），port=5000（端口号），debug=True（调试模式）
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+    create_app().run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
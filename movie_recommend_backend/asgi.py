@@ -0,0 +1,10 @@
+# ASGI入口（需安装asgiref和ASGI服务器）：uvicorn asgi:app --workers 4
+# Flask是WSGI应用，这里用asgiref把它包装成ASGI应用，每个请求在线程池中执行
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:  # 未安装asgiref时只能用WSGI方式部署（wsgi.py）
+    raise RuntimeError("使用ASGI方式部署需要安装asgiref（pip install asgiref uvicorn），或改用 gunicorn -c gunicorn.conf.py wsgi:app")
+
+from app import create_app
+
+app = WsgiToAsgi(create_app())
@@ -0,0 +1,80 @@
+# 近似最近邻（LSH）与精确余弦相似度的对比：召回率（recall@k）、单次查询耗时、候选比例
+# 精确路径即推荐算法原来的做法：目标与所有用户/电影逐个算余弦相似度再排序
+# 用法（在 movie_recommend_backend 目录下执行）：
+#   python benchmarks/bench_ann.py [--csv ratings.csv] [--tables 8 16] [--bits N] [--queries 200]
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eval_recommend import load_ratings
+from services.ann_index import LSHIndex, ANN_TABLES
+from services.rating_matrix import build_rating_matrix
+from services.als_model import ALSModel
+
+
+def exact_top(vectors, pos, k):
+    """精确余弦Top-K（vectors已归一化），返回位置集合"""
+    sims = vectors @ vectors[pos].T
+    sims = np.asarray(sims.toarray() if hasattr(sims, "toarray") else sims).ravel()
+    sims[pos] = -np.inf
+    return set(np.argsort(-sims, kind="stable")[:k])
+
+
+def bench(name, ids, vectors, tables, bits, queries, k, seed):
+    start = time.perf_counter()
+    index = LSHIndex(ids, vectors, n_tables=tables, n_bits=bits)
+    build_seconds = time.perf_counter() - start
+    positions = np.random.default_rng(seed).choice(len(ids), size=min(queries, len(ids)), replace=False)
+    recalls, ann_ms, exact_ms, candidates = [], [], [], []
+    for pos in positions:
+        start = time.perf_counter()
+        expected = exact_top(index.vectors, pos, k)
+        exact_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        got = index.query_id(ids[pos], k)
+        ann_ms.append((time.perf_counter() - start) * 1000)
+        got_positions = {index._id_pos[id_] for id_, _ in got}
+        recalls.append(len(expected & got_positions) / max(len(expected), 1))
+        candidates.append(len(index.candidates(index.vectors[pos])))
+    return {
+        "vectors": name, "n": len(ids), "tables": tables, "bits": index.n_bits,
+        f"recall@{k}": float(np.mean(recalls)), "candidates": float(np.mean(candidates) / len(ids)),
+        "ann_ms": float(np.mean(ann_ms)), "exact_ms": float(np.mean(exact_ms)), "build_s": build_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LSH近似最近邻 vs 精确余弦相似度")
+    parser.add_argument("--csv", help="评分CSV文件（uid,mid,score），不指定时读数据库")
+    parser.add_argument("--tables", type=int, nargs="+", default=[ANN_TABLES], help="哈希表数量（可传多个做对比）")
+    parser.add_argument("--bits", type=int, default=None, help="每张表的超平面数（默认按数据量自动选择）")
+    parser.add_argument("--queries", type=int, default=200, help="抽样查询次数")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--als-factors", type=int, default=0, help="大于0时另外训练ALS，测试电影隐因子向量")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    ratings = load_ratings(args.csv)
+    rating_matrix = build_rating_matrix(ratings)
+    vector_sets = [
+        ("user-ratings", rating_matrix.users.ids, rating_matrix.matrix),
+        ("movie-ratings", rating_matrix.movies.ids, rating_matrix.matrix.T.tocsr()),
+    ]
+    if args.als_factors:
+        model = ALSModel.train(ratings, factors=args.als_factors, iterations=5)
+        vector_sets.append(("movie-als", model.movies.ids, np.asarray(model.item_factors)))
+
+    results = [bench(name, ids, vectors, tables, args.bits, args.queries, args.k, args.seed)
+               for tables in args.tables for name, ids, vectors in vector_sets]
+    columns = list(results[0])
+    print("\t".join(columns))
+    for row in results:
+        print("\t".join(f"{row[c]:.4f}" if isinstance(row[c], float) else str(row[c]) for c in columns))
+
+
+if __name__ == "__main__":
+    main()
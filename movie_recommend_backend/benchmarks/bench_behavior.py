@@ -0,0 +1,132 @@
+# 管理员“用户行为记录”接口的SQL条数/耗时对比：原实现（全量读取，每条记录按电影ID单独查询电影）
+# 与游标分页实现（每页：浏览一页 + 评分一页 + 电影名称一次IN查询）
+# 使用独立的临时SQLite库造数据，不连接业务数据库；同时逐页翻完校验分页结果与全量排序一致
+# 用法（在 movie_recommend_backend 目录下执行）：
+#   python benchmarks/bench_behavior.py [--sizes 100 1000 5000] [--page-size 50]
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+from flask import Flask
+from sqlalchemy import event, insert
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db
+from models.movie import Movie
+from models.history import UserHistory
+from models.rating import UserRating
+from services import user_service
+
+USER_ID = 1
+
+
+def legacy_behavior(user_id):
+    """原接口实现（逐条查电影，用于对比）"""
+    histories = UserHistory.query.filter_by(uid=user_id).order_by(UserHistory.time.desc()).all()
+    history_list = [{
+        "mid": h.mid,
+        "movie_name": db.session.get(Movie, h.mid).name if db.session.get(Movie, h.mid) else "未知电影",
+        "time": h.time.strftime("%Y-%m-%d %H:%M:%S"),
+        "type": "浏览"
+    } for h in histories]
+    ratings = UserRating.query.filter_by(uid=user_id).order_by(UserRating.time.desc()).all()
+    rating_list = [{
+        "mid": r.mid,
+        "movie_name": db.session.get(Movie, r.mid).name if db.session.get(Movie, r.mid) else "未知电影",
+        "score": r.score,
+        "time": r.time.strftime("%Y-%m-%d %H:%M:%S"),
+        "type": "评分"
+    } for r in ratings]
+    return sorted(history_list + rating_list, key=lambda x: x["time"], reverse=True)
+
+
+def seed(n_records, n_movies, seed_value):
+    """造数据：一个用户n_records条行为（浏览约占2/3），时间有大量重复以覆盖并列排序"""
+    rnd = random.Random(seed_value)
+    db.drop_all()
+    db.create_all()
+    db.session.execute(insert(Movie), [
+        {"id": i, "name": f"电影{i}", "description": ""} for i in range(1, n_movies + 1)
+    ])
+    start = datetime.datetime(2024, 1, 1)
+    n_ratings = min(n_records // 3, n_movies)
+    rated = rnd.sample(range(1, n_movies + 1), n_ratings)
+    db.session.execute(insert(UserRating), [
+        {"uid": USER_ID, "mid": mid, "score": rnd.choice([1.0, 2.0, 3.0, 4.0, 5.0]),
+         "time": start + datetime.timedelta(minutes=rnd.randint(0, n_records))}
+        for mid in rated
+    ])
+    db.session.execute(insert(UserHistory), [
+        {"uid": USER_ID, "mid": rnd.randint(1, n_movies), "time": start + datetime.timedelta(minutes=rnd.randint(0, n_records))}
+        for _ in range(n_records - n_ratings)
+    ])
+    db.session.commit()
+
+
+def measure(func):
+    """执行一次，返回 (结果, SQL条数, 毫秒)"""
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+
+    db.session.expire_all()
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        start = time.perf_counter()
+        result = func()
+        return result, len(statements), (time.perf_counter() - start) * 1000
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+
+
+def walk_pages(page_size):
+    """从头翻到最后一页，返回 (全部记录, 页数, 每页SQL条数的最大值)"""
+    rows, cursor, pages, max_queries = [], None, 0, 0
+    while True:
+        result, n_queries, _ = measure(lambda: user_service.get_user_behavior(db, USER_ID, page_size, cursor))
+        assert result["code"] == 1, result["msg"]
+        rows.extend(result["data"]["behavior_list"])
+        pages += 1
+        max_queries = max(max_queries, n_queries)
+        cursor = result["data"]["next_cursor"]
+        if not cursor:
+            return rows, pages, max_queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用户行为记录接口：原实现 vs 游标分页")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000], help="该用户的行为记录条数")
+    parser.add_argument("--movies", type=int, default=2000, help="电影数量")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_behavior.db")
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{path}"
+    db.init_app(app)
+
+    columns = ["records", "legacy_queries", "legacy_ms", "page_queries", "page_ms", "pages", "max_page_queries"]
+    print("\t".join(columns))
+    with app.app_context():
+        for size in args.sizes:
+            seed(size, args.movies, args.seed)
+            legacy, legacy_queries, legacy_ms = measure(lambda: legacy_behavior(USER_ID))
+            _, page_queries, page_ms = measure(lambda: user_service.get_user_behavior(db, USER_ID, args.page_size))
+            rows, pages, max_queries = walk_pages(args.page_size)
+            # 翻完所有页：条数一致、时间非递增、没有重复或遗漏
+            assert len(rows) == len(legacy) == size, (len(rows), len(legacy), size)
+            assert all(a["time"] >= b["time"] for a, b in zip(rows, rows[1:]))
+            assert sorted((r["time"], r["mid"], r["type"]) for r in rows) == \
+                sorted((r["time"], r["mid"], r["type"]) for r in legacy)
+            print("\t".join(str(v) for v in [size, legacy_queries, f"{legacy_ms:.1f}", page_queries,
+                                             f"{page_ms:.1f}", pages, max_queries]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# 基准测试套件：在几种数据规模下分别生成合成数据（datagen.py），测量各接口和推荐算法的耗时、SQL条数、内存峰值
+# 结果输出为JSON（含提交号、数据规模、随机种子），不同提交的结果可以用 --compare 直接对比
+# - 接口通过Flask测试客户端调用（不经过网络），默认关闭接口结果缓存，测的是每次真实计算的开销
+# - 内存峰值用tracemalloc统计（numpy数组计入在内），每项单独执行一次测量，不影响耗时统计
+# - dense_baseline 复现最初的稠密算法（用户×电影稠密矩阵 + 全量用户相似度矩阵），用来量化稠密矩阵的内存膨胀
+# 用法（在 movie_recommend_backend 目录下执行）：
+#   python benchmarks/bench_suite.py --scales small medium --json bench_$(git rev-parse --short HEAD).json
+#   python benchmarks/bench_suite.py --scales small --only recommend_live dense_baseline
+#   python benchmarks/bench_suite.py --compare bench_old.json bench_new.json
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from sqlalchemy import event
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from datagen import PRESETS, generate, preset_counts
+from app import create_app
+from models import db
+from models.movie import Movie
+from models.rating import UserRating
+from services import recommend_model, recommend_service, item_model, ann_index, search_index
+from services.recommend_model import RecommendModel
+
+def make_endpoint_cases(rng, n_users, n_movies, poster_ids):
+    """接口基准：名称 → 生成请求路径的函数（请求参数按随机种子抽取，每次运行相同）"""
+    cases = {
+        "movie_list": lambda: f"/api/movie/list?page={rng.randint(1, 50)}&page_size=10",
+        "movie_list_cursor": lambda: "/api/movie/list?cursor=&page_size=10",
+        "movie_detail": lambda: f"/api/movie/detail/{rng.randint(1, n_movies)}",
+        "movie_hot": lambda: "/api/movie/hot",
+        "movie_search": lambda: f"/api/movie/search?q=%E7%94%B5%E5%BD%B1{rng.randint(1, n_movies)}",
+        "movie_similar": lambda: f"/api/movie/similar/{rng.randint(1, n_movies)}",
+        "movie_facets": lambda: "/api/movie/facets",
+        "movie_genre": lambda: f"/api/movie/genre/{rng.choice(['剧情', '喜剧', '科幻', '纪录片'])}?page={rng.randint(1, 5)}",
+        "recommend": lambda: f"/api/recommend/{rng.randint(1, n_users)}",
+        "recommend_item": lambda: f"/api/recommend/{rng.randint(1, n_users)}?mode=item",
+        "admin_users": lambda: f"/api/admin/users?page={rng.randint(1, 10)}",
+        "admin_behavior": lambda: f"/api/admin/user/behavior/{rng.randint(1, n_users)}",
+    }
+    if poster_ids:
+        cases["movie_poster"] = lambda: f"/api/movie/{rng.choice(poster_ids)}/poster"
+    return cases
+
+
+def dense_recommend(ratings, user_id, limit=10):
+    """最初的稠密实现（pivot_table + cosine_similarity 的numpy等价写法），仅用于对比内存和耗时"""
+    uids = np.fromiter((r[0] for r in ratings), dtype=np.int64, count=len(ratings))
+    mids = np.fromiter((r[1] for r in ratings), dtype=np.int64, count=len(ratings))
+    scores = np.fromiter((r[2] for r in ratings), dtype=np.float64, count=len(ratings))
+    users, rows = np.unique(uids, return_inverse=True)
+    movies, cols = np.unique(mids, return_inverse=True)
+    matrix = np.zeros((len(users), len(movies)))
+    matrix[rows, cols] = scores
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    normalized = matrix / norms
+    similarity = normalized @ normalized.T  # 全量用户×用户相似度
+    target = int(np.searchsorted(users, user_id))
+    if target >= len(users) or users[target] != user_id:
+        return []
+    neighbors = [n for n in np.argsort(-similarity[target], kind="stable") if n != target][:5]
+    rated = matrix[target] > 0
+    liked = (matrix[neighbors] >= 3.5).any(axis=0) & ~rated
+    return movies[liked][:limit].tolist()
+
+
+def dense_bytes(n_users, n_movies):
+    """稠密实现的主要内存：评分矩阵 + 归一化副本 + 用户相似度矩阵（float64）"""
+    return 8 * (2 * n_users * n_movies + n_users * n_users)
+
+
+def measure(func, repeat, warmup=1):
+    """
+    执行func：预热warmup次后计时repeat次，再单独执行一次统计内存峰值
+    :return: {"n", "p50_ms", "p95_ms", "mean_ms", "queries", "peak_mb", "errors"}
+    """
+    statements = []
+
+    def count(*args):
+        statements.append(1)
+
+    errors = 0
+    for _ in range(warmup):
+        func()
+    latencies = []
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ok = func()
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += ok is False
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    latencies = np.asarray(latencies)
+    return {
+        "n": repeat,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "queries": round(len(statements) / repeat, 2),
+        "peak_mb": round(peak / 1024 / 1024, 3),
+        "errors": errors,
+    }
+
+
+def run_scale(name, counts, args, work_dir):
+    """生成一个规模的数据并执行全部基准，返回结果行列表"""
+    n_users, n_movies, n_ratings = counts
+    scale_dir = os.path.join(work_dir, name)
+    os.makedirs(scale_dir, exist_ok=True)
+    url = args.database_url or f"sqlite:///{os.path.join(scale_dir, 'bench.db')}"
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": url,
+        "CACHE_ENABLED": args.cache,
+        "METRICS_ENABLED": False,
+        "HISTORY_BUFFER_ENABLED": False,
+        "RECOMMEND_MODEL_REFRESH_SECONDS": 0,
+        "AUTH_ALLOW_USER_ID": True,
+        "POSTER_CACHE_DIR": os.path.join(scale_dir, "poster_cache"),
+        "SEARCH_INDEX_PATH": os.path.join(scale_dir, "movie_index.pkl"),
+        "ITEM_NEIGHBORS_PATH": os.path.join(scale_dir, "item_neighbors.npz"),
+        "ALS_MODEL_DIR": os.path.join(scale_dir, "als"),
+        "MOVIE_ANN_PATH": os.path.join(scale_dir, "movie_ann.npz"),
+    }, start_background=False)  # 不启动后台构建线程，数据写入后在下面同步构建，计时期间没有后台任务
+    with app.app_context():
+        if args.database_url:
+            db.drop_all()
+            db.create_all()
+        data = generate(n_users, n_movies, n_ratings, args.alpha, args.posters, args.poster_kb, args.history, args.seed)
+        # 数据写入后重建各模型/索引（与服务启动时看到的状态一致）
+        recommend_model.rebuild(db)
+        item_model.rebuild(db)
+        ann_index.rebuild_movie_index(db)
+        search_index.rebuild(db)
+        poster_ids = [mid for mid, in db.session.query(Movie.id).filter(Movie.picture_hash.isnot(None))]
+        ratings = db.session.query(UserRating.uid, UserRating.mid, UserRating.score).all()
+
+    rng = random.Random(args.seed)
+    client = app.test_client()
+    headers = {"Authorization": "1"}  # 用户1为管理员（datagen生成）
+    rows = []
+
+    def record(bench, result):
+        row = dict({"scale": name, "benchmark": bench}, **result)
+        rows.append(row)
+        print("\t".join(str(row[c]) for c in COLUMNS), flush=True)
+
+    for bench, make_path in make_endpoint_cases(rng, n_users, n_movies, poster_ids).items():
+        if args.only and bench not in args.only:
+            continue
+
+        def call():
+            response = client.get(make_path(), headers=headers)
+            response.close()
+            return response.status_code == 200
+        with app.app_context():
+            record(bench, measure(call, args.repeat))
+
+    # 推荐算法本身（不经过接口和缓存）
+    with app.app_context():
+        target_users = [rng.randint(1, n_users) for _ in range(64)]
+        model = recommend_model.get_model()
+        pick = iter(target_users * (args.repeat + 8))
+        if not args.only or "recommend_model" in args.only:
+            record("recommend_model", measure(lambda: recommend_service.recommend_from_model(db, model, next(pick))["code"] is not None, args.repeat))
+        if not args.only or "recommend_live" in args.only:
+            recommend_model._model = None  # 模型未就绪时的实时计算路径（每次读取全部评分）
+            try:
+                record("recommend_live", measure(lambda: recommend_service.get_recommend_movies(db, next(pick))["code"] is not None,
+                                                 args.heavy_repeat))
+            finally:
+                recommend_model._model = model
+        if not args.only or "model_build" in args.only:
+            record("model_build", measure(lambda: RecommendModel.build(ratings) is not None, args.heavy_repeat, warmup=0))
+        if not args.only or "dense_baseline" in args.only:
+            if dense_bytes(n_users, n_movies) > args.dense_max_mb * 1024 * 1024:
+                print(f"跳过dense_baseline：预计需要{dense_bytes(n_users, n_movies) / 1024 / 1024:.0f}MB，超过--dense-max-mb")
+            else:
+                record("dense_baseline", measure(lambda: dense_recommend(ratings, next(pick)) is not None,
+                                                 args.heavy_repeat, warmup=0))
+    for row in rows:
+        row["data"] = data
+    return rows
+
+
+COLUMNS = ["scale", "benchmark", "n", "p50_ms", "p95_ms", "mean_ms", "queries", "peak_mb", "errors"]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path):
+    """对比两次结果：按 (规模, 基准) 输出p50耗时、内存峰值、SQL条数的变化"""
+    def load(path):
+        with open(path, encoding="utf-8") as f:
+            report = json.load(f)
+        return report, {(r["scale"], r["benchmark"]): r for r in report["results"]}
+
+    old_report, old = load(old_path)
+    new_report, new = load(new_path)
+    print(f"旧：{old_report['meta'].get('commit')}  新：{new_report['meta'].get('commit')}")
+    print("\t".join(["scale", "benchmark", "p50_old", "p50_new", "p50_ratio", "peak_old", "peak_new", "queries_old", "queries_new"]))
+    for key in sorted(old.keys() & new.keys()):
+        a, b = old[key], new[key]
+        ratio = b["p50_ms"] / a["p50_ms"] if a["p50_ms"] else float("nan")
+        print("\t".join(str(v) for v in [*key, a["p50_ms"], b["p50_ms"], f"{ratio:.2f}", a["peak_mb"], b["peak_mb"],
+                                         a["queries"], b["queries"]]))
+    for key in sorted(old.keys() ^ new.keys()):
+        print(f"仅在{'旧' if key in old else '新'}结果中：{key}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="接口与推荐算法基准测试（合成数据，多种规模）")
+    parser.add_argument("--scales", nargs="+", default=["small", "medium"],
+                        help=f"规模预设（{'/'.join(PRESETS)}），或 用户数x电影数x评分数，如 3000x8000x200000")
+    parser.add_argument("--only", nargs="+", help="只运行这些基准")
+    parser.add_argument("--repeat", type=int, default=50, help="每个接口基准的计时次数")
+    parser.add_argument("--heavy-repeat", type=int, default=3, help="实时推荐、模型构建、稠密对照的计时次数")
+    parser.add_argument("--alpha", type=float, default=1.0, help="幂律指数（电影热度、用户活跃度）")
+    parser.add_argument("--posters", type=float, default=0.2, help="带海报的电影比例")
+    parser.add_argument("--poster-kb", type=int, default=60, help="海报大小（KB）")
+    parser.add_argument("--history", type=int, default=5, help="每个用户的平均浏览记录条数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cache", action="store_true", help="开启接口结果缓存（默认关闭）")
+    parser.add_argument("--dense-max-mb", type=int, default=2048, help="稠密对照预计内存超过该值时跳过")
+    parser.add_argument("--database-url", help="使用指定数据库（如MySQL）而不是临时SQLite：每个规模都会清空重建该库！")
+    parser.add_argument("--json", help="结果保存为JSON文件")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="对比两个JSON结果文件（不运行基准）")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="bench_suite_")
+    started = datetime.datetime.now()
+    results = []
+    print("\t".join(COLUMNS))
+    try:
+        for scale in args.scales:
+            if scale in PRESETS:
+                counts = preset_counts(scale)
+            else:
+                counts = tuple(int(x) for x in scale.split("x"))
+            results.extend(run_scale(scale, counts, args, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "started": started.isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "database": "sqlite" if not args.database_url else args.database_url.split(":")[0],
+            "args": {k: v for k, v in vars(args).items() if k not in ("json", "compare", "database_url")},
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
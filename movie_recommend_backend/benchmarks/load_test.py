@@ -0,0 +1,206 @@
+# 本地压测：并发请求主要的读接口，按接口统计 请求数/秒、p50/p99延迟、错误数
+# 可以压测已经启动的服务（--url），也可以由脚本启动服务后再压测（--serve），依次对比多种部署方式：
+#   dev      = python app.py（Flask开发服务器，单进程，原来的启动方式）
+#   gunicorn = gunicorn -c gunicorn.conf.py wsgi:app（多进程 + 多线程，需要安装gunicorn）
+# 用法（在 movie_recommend_backend 目录下执行）：
+#   python benchmarks/load_test.py --serve dev gunicorn --database-url sqlite:////tmp/load_test.db --seed
+#   python benchmarks/load_test.py --url http://127.0.0.1:5000 --concurrency 32 --duration 20
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+ENDPOINTS = {
+    "movie_list": "/api/movie/list?page={page}&page_size=10",
+    "movie_detail": "/api/movie/detail/{mid}",
+    "movie_hot": "/api/movie/hot",
+    "movie_search": "/api/movie/search?q=%E7%94%B5%E5%BD%B1{mid}",
+    "similar": "/api/movie/similar/{mid}",
+    "recommend": "/api/recommend/{uid}",
+}
+SERVE_COMMANDS = {
+    "dev": [sys.executable, "app.py"],
+    "gunicorn": ["gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+}
+PORT = 5000
+
+
+def seed(database_url, n_users, n_movies, n_ratings, seed_value=42):
+    """向空库写入压测数据（库中已有电影时跳过；数据由datagen.py按幂律分布生成）"""
+    from flask import Flask
+    from models import db
+    from models.movie import Movie
+    from datagen import generate
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        if Movie.query.first() is not None:
+            return
+        generate(n_users, n_movies, n_ratings, seed=seed_value)
+
+
+def start_server(mode, database_url):
+    """在子进程中启动服务并等待就绪，返回进程对象"""
+    env = dict(os.environ, WEB_BIND=f"127.0.0.1:{PORT}")
+    if database_url:
+        env["DATABASE_URL"] = database_url
+    process = subprocess.Popen(SERVE_COMMANDS[mode], cwd=BACKEND_DIR, env=env, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{mode}服务启动失败（退出码{process.returncode}）")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", PORT, timeout=2)
+            connection.request("GET", "/api/movie/hot")
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.5)
+    stop_server(process)
+    raise RuntimeError(f"{mode}服务启动超时")
+
+
+def stop_server(process):
+    """结束服务（连同开发服务器的重载子进程、gunicorn的worker）"""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def run_load(base_url, endpoints, concurrency, duration, n_users, n_movies, warmup):
+    """
+    concurrency个线程各用一个keep-alive连接循环请求，轮流访问各接口
+    :return: {接口名: {"latencies": [...], "errors": n}}, 实际压测秒数
+    """
+    parsed = urllib.parse.urlparse(base_url)
+    results = {name: {"latencies": [], "errors": 0} for name in endpoints}
+    lock = threading.Lock()
+    start_at = time.perf_counter() + warmup
+    stop_at = start_at + duration
+
+    def worker(index):
+        rnd = random.Random(index)
+        connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+        local = {name: ([], 0) for name in endpoints}
+        names = list(endpoints)
+        i = index
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            name = names[i % len(names)]
+            i += 1
+            path = ENDPOINTS[name].format(page=rnd.randint(1, 50), mid=rnd.randint(1, n_movies),
+                                          uid=rnd.randint(1, n_users))
+            begin = time.perf_counter()
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                ok = False
+                connection.close()
+                connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+            elapsed = time.perf_counter() - begin
+            if begin < start_at:
+                continue  # 预热阶段不计入
+            latencies, errors = local[name]
+            if ok:
+                latencies.append(elapsed)
+            else:
+                local[name] = (latencies, errors + 1)
+        connection.close()
+        with lock:
+            for name, (latencies, errors) in local.items():
+                results[name]["latencies"].extend(latencies)
+                results[name]["errors"] += errors
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, duration
+
+
+def summarize(label, results, duration):
+    """每个接口一行：请求数/秒、p50、p99（毫秒）、错误数"""
+    rows = []
+    for name, data in list(results.items()) + [("ALL", {
+        "latencies": [x for d in results.values() for x in d["latencies"]],
+        "errors": sum(d["errors"] for d in results.values()),
+    })]:
+        latencies = np.asarray(data["latencies"]) * 1000
+        rows.append({
+            "setup": label, "endpoint": name, "requests": len(latencies),
+            "rps": len(latencies) / duration,
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else float("nan"),
+            "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else float("nan"),
+            "errors": data["errors"],
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="读接口本地压测：p50/p99延迟、每秒请求数")
+    parser.add_argument("--url", help="压测已启动的服务（如 http://127.0.0.1:5000）")
+    parser.add_argument("--serve", nargs="+", choices=sorted(SERVE_COMMANDS), help="由脚本依次启动这些部署方式并压测")
+    parser.add_argument("--database-url", help="--serve时服务使用的数据库（传给环境变量DATABASE_URL）")
+    parser.add_argument("--seed", action="store_true", help="数据库为空时先写入压测数据")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--movies", type=int, default=5000)
+    parser.add_argument("--ratings", type=int, default=100000)
+    parser.add_argument("--endpoints", nargs="+", choices=sorted(ENDPOINTS), default=sorted(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, default=16, help="并发连接数")
+    parser.add_argument("--duration", type=float, default=10, help="每种部署方式的压测秒数")
+    parser.add_argument("--warmup", type=float, default=2, help="预热秒数（不计入结果）")
+    parser.add_argument("--json", help="结果另存为JSON文件")
+    args = parser.parse_args()
+    if not args.url and not args.serve:
+        parser.error("需要指定 --url 或 --serve")
+
+    if args.seed:
+        seed(args.database_url or os.environ.get("DATABASE_URL"), args.users, args.movies, args.ratings)
+
+    rows = []
+    targets = [(args.url, args.url)] if args.url else [(mode, f"http://127.0.0.1:{PORT}") for mode in args.serve]
+    for label, base_url in targets:
+        process = start_server(label, args.database_url) if args.serve else None
+        try:
+            results, duration = run_load(base_url, args.endpoints, args.concurrency, args.duration,
+                                         args.users, args.movies, args.warmup)
+        finally:
+            if process is not None:
+                stop_server(process)
+        rows.extend(summarize(label, results, duration))
+
+    columns = ["setup", "endpoint", "requests", "rps", "p50_ms", "p99_ms", "errors"]
+    print("\t".join(columns))
+    for row in rows:
+        print("\t".join(f"{row[c]:.1f}" if isinstance(row[c], float) else str(row[c]) for c in columns))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
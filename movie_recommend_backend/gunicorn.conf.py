@@ -0,0 +1,38 @@
+# gunicorn配置：gunicorn -c gunicorn.conf.py wsgi:app
+# 参数都可以用环境变量覆盖，例如 CACHE_REDIS_URL=redis://localhost:6379/0 WEB_WORKERS=4 gunicorn -c gunicorn.conf.py wsgi:app
+# - 默认单进程：推荐模型、搜索索引和接口缓存都保存在进程内，多个进程之间互不可见
+# - 多进程（WEB_WORKERS>1）：绕开GIL，利用多核，但必须配置CACHE_REDIS_URL，让各进程共享接口缓存及其失效，
+#   以及SECRET_KEY，让各进程用同一个密钥签发/校验登录令牌；
+#   推荐模型由各进程的后台线程每RECOMMEND_MODEL_SYNC_SECONDS秒从数据库补上其他进程写入的评分；
+#   相似度表、ALS模型、相似电影索引、搜索索引文件被某个进程（或manage.py）重新写入后，其他进程按修改时间重新加载；
+#   内存随进程数线性增长
+# - 多线程（threads，gthread）：接口大多在等数据库，一个进程内用线程并发处理这些I/O等待
+# - 每个进程一个数据库连接池，DB_POOL_SIZE应不小于threads，workers×(DB_POOL_SIZE+DB_MAX_OVERFLOW)不能超过MySQL的max_connections
+import os
+
+bind = os.environ.get("WEB_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_WORKERS", 1))
+if workers > 1 and not os.environ.get("CACHE_REDIS_URL"):
+    raise RuntimeError("WEB_WORKERS>1时必须配置CACHE_REDIS_URL（进程内缓存在多个worker之间不会同步失效）")
+if workers > 1 and not os.environ.get("SECRET_KEY"):
+    raise RuntimeError("WEB_WORKERS>1时必须配置SECRET_KEY（否则各worker随机生成的密钥不同，登录令牌互不认可）")
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 8))
+timeout = int(os.environ.get("WEB_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
+# 不preload：后台线程（推荐模型构建、浏览记录写入）不会跟随fork，必须在每个worker中启动
+preload_app = False
+# 定期重启worker，回收长时间运行后积累的内存碎片
+max_requests = int(os.environ.get("WEB_MAX_REQUESTS", 10000))
+max_requests_jitter = 1000
+accesslog = "-"
+
+
+def worker_exit(server, worker):
+    """worker退出前把缓冲中的浏览记录写完，并写回尚未保存的搜索索引"""
+    from services import history_buffer, search_index
+    buffer = history_buffer.get_buffer()
+    if buffer is not None:
+        buffer.stop()
+    search_index.flush()
@@ -0,0 +1,323 @@
+# 后端命令行工具：离线任务入口（与app.py共用配置和数据库）
+# 用法：python manage.py <命令> [参数]，例如 python manage.py precompute-recommend --workers 4
+import argparse
+import sys
+import time
+from app import create_app
+from models import db
+
+# 离线命令不启动后台线程（推荐模型构建、索引构建、浏览记录缓冲），需要的模型/索引由各命令自己构建
+app = create_app(start_background=False)
+
+
+def cmd_precompute_recommend(args):
+    """为所有用户批量计算推荐结果，写入user_recommendation表"""
+    from services import recommend_batch
+    stats = recommend_batch.precompute(db, workers=args.workers, block_size=args.block_size)
+    print(f"推荐结果已生成：{stats}")
+
+
+def cmd_build_item_neighbors(args):
+    """离线构建基于物品推荐的电影相似度表（每部电影保留Top-K相似电影），写入磁盘"""
+    from services import item_model
+    path = app.config["ITEM_NEIGHBORS_PATH"]
+    start = time.time()
+    model = item_model.rebuild(db, k=args.k or item_model.ITEM_TOP_K, path=path)
+    print(f"电影相似度表已生成：{model.n_movies}部电影，{model.neighbors.nnz}条相似关系，"
+          f"耗时{time.time() - start:.1f}秒，文件：{path}")
+
+
+def cmd_train_als(args):
+    """训练ALS矩阵分解模型并保存；打印每轮耗时和RMSE，--holdout 时另外报告留出集RMSE"""
+    import random
+    from services import als_model
+    ratings, views = als_model.load_training_data(db, use_views=args.use_views)
+    ratings = list(ratings)
+    holdout = []
+    if args.holdout:
+        random.Random(0).shuffle(ratings)
+        n_holdout = int(len(ratings) * args.holdout)
+        holdout, ratings = ratings[:n_holdout], ratings[n_holdout:]
+    print(f"训练数据：评分{len(ratings)}条，浏览记录{len(views) if views else 0}条，留出{len(holdout)}条")
+
+    start = time.time()
+
+    def report(iteration, model):
+        line = f"第{iteration}轮：累计{time.time() - start:.1f}秒，训练RMSE {als_model.rmse(model, ratings):.4f}"
+        if holdout:
+            line += f"，留出RMSE {als_model.rmse(model, holdout):.4f}"
+        print(line)
+
+    model = als_model.ALSModel.train(
+        ratings, views, factors=args.factors, reg=args.reg, iterations=args.iterations,
+        workers=args.workers, callback=report,
+    )
+    model.save(app.config["ALS_MODEL_DIR"])
+    print(f"ALS模型已保存：{model.n_users}个用户，{len(model.movies)}部电影，"
+          f"训练耗时{time.time() - start:.1f}秒，目录：{app.config['ALS_MODEL_DIR']}")
+
+
+def cmd_build_ann(args):
+    """重建相似电影的近似最近邻索引（训练ALS之后执行可改用隐因子）"""
+    from services import als_model, ann_index
+    als_model.init_app(app)
+    start = time.time()
+    index = ann_index.rebuild_movie_index(db, path=app.config["MOVIE_ANN_PATH"])
+    print(f"相似电影索引已生成：{len(index)}部电影，{index.n_tables}张哈希表×{index.n_bits}位，"
+          f"耗时{time.time() - start:.1f}秒")
+
+
+def cmd_import_movielens(args):
+    """流式批量导入MovieLens格式的CSV（movies.csv / ratings.csv / tags.csv），可断点续传"""
+    from services import movielens_import
+    importer = movielens_import.Importer(
+        db, args.directory, chunk_size=args.chunk_size,
+        movie_id_offset=args.movie_id_offset, user_id_offset=args.user_id_offset,
+    )
+    if args.restart:
+        importer.reset()
+    steps = []
+    if not args.skip_movies:
+        steps.append(("movies.csv", importer.import_movies))
+    if not args.skip_ratings:
+        steps.append(("ratings.csv", importer.import_ratings))
+    if args.tags:
+        steps.append(("tags.csv", importer.import_tags))
+    for filename, step in steps:
+        rows, seconds = step()
+        speed = f"{rows / seconds:.0f}行/秒" if seconds else "-"
+        print(f"{filename}导入完成：本次{rows}行，耗时{seconds:.1f}秒，{speed}")
+    print(f"峰值内存：{movielens_import.peak_memory_mb():.0f}MB")
+
+    if args.rebuild_aggregates:
+        from services import movie_service, browse_service, search_index, item_model
+        start = time.time()
+        print(f"评分统计已重算：{movie_service.rebuild_rating_stats(db)}部电影")
+        print(f"类别/影人关联已重建：{browse_service.rebuild_facets(db)}部电影")
+        index = search_index.rebuild(db)
+        print(f"搜索索引已重建：{len(index)}部电影")
+        model = item_model.rebuild(db, path=app.config["ITEM_NEIGHBORS_PATH"])
+        print(f"电影相似度表已重建：{model.n_movies}部电影")
+        print(f"派生数据重建耗时{time.time() - start:.1f}秒；"
+              f"如使用ALS推荐，请再执行 python manage.py train-als 和 python manage.py build-ann")
+    else:
+        print("提示：导入评分后请执行 python manage.py rebuild-rating-stats 和 build-facets，"
+              "或重新执行本命令并加上 --rebuild-aggregates")
+
+
+def cmd_migrate(args):
+    """给已存在的数据库补齐模型中新增的表、字段和索引"""
+    from utils.schema import migrate
+    from models.user import User
+    from models.movie import Movie
+    from models.history import UserHistory
+    from models.rating import UserRating
+    from models.recommendation import UserRecommendation
+    from models.genre import Genre, MovieGenre
+    from models.person import Person, MoviePerson
+    from models.import_progress import ImportProgress
+    if args.dedupe:
+        from utils.schema import delete_duplicates
+        from services import movie_service
+        db.create_all()
+        removed = delete_duplicates(db, UserRating, ["uid", "mid"])
+        print(f"已删除重复评分：{removed}条")
+        if removed:
+            print(f"评分统计已重算：{movie_service.rebuild_rating_stats(db)}部电影")
+    report = migrate(db, [User, Movie, UserHistory, UserRating, UserRecommendation,
+                          Genre, MovieGenre, Person, MoviePerson, ImportProgress])
+    print(f"数据库迁移完成：{report or '结构已是最新'}")
+    if any("跳过" in name for name in report.get("user_rating", [])):
+        print("提示：user_rating表存在重复评分，唯一索引未创建，请执行 python manage.py migrate --dedupe")
+    if "picture_hash" in report.get("movie", []):
+        print("提示：请执行 python manage.py backfill-posters 为已有海报生成摘要")
+    if Movie.query.first() is not None and MovieGenre.query.first() is None:
+        print("提示：请执行 python manage.py build-facets 回填电影类别/影人关联")
+
+
+def cmd_check_indexes(args):
+    """检查索引是否齐全，并用EXPLAIN确认热点查询走索引；有问题时以状态码1退出（可放进部署检查）"""
+    from sqlalchemy import select, func
+    from utils.schema import missing_indexes, explain
+    from models.user import User
+    from models.movie import Movie
+    from models.history import UserHistory
+    from models.rating import UserRating
+    missing = missing_indexes(db, [User, Movie, UserHistory, UserRating])
+    if missing:
+        print(f"缺少索引：{missing}")
+
+    uid, mid = args.uid, args.mid
+    queries = [
+        ("重复评分检查", select(UserRating.id).where(UserRating.uid == uid, UserRating.mid == mid)),
+        ("用户已评分电影", select(UserRating.mid, UserRating.score).where(UserRating.uid == uid)),
+        ("电影评分统计", select(func.sum(UserRating.score), func.count(UserRating.id)).where(UserRating.mid == mid)),
+        ("用户评分记录（按时间倒序）",
+         select(UserRating).where(UserRating.uid == uid).order_by(UserRating.time.desc())),
+        ("用户浏览记录（按时间倒序）",
+         select(UserHistory).where(UserHistory.uid == uid).order_by(UserHistory.time.desc())),
+        ("热门电影", select(Movie.id).where(Movie.rating_count > 0).order_by(Movie.rating_count.desc(), Movie.id).limit(10)),
+    ]
+    failed = bool(missing)
+    for name, statement in queries:
+        ok, plan = explain(db, statement)
+        failed |= not ok
+        print(f"[{'OK' if ok else '未走索引'}] {name}")
+        for line in plan:
+            print(f"    {line}")
+    if failed:
+        sys.exit(1)
+
+
+# 各接口查询在关闭缓存时应执行的SQL条数（列表 = 一页数据 + 总数）
+QUERY_BUDGETS = {
+    "电影列表（页码分页）": 2,
+    "电影列表（游标分页）": 2,
+    "电影详情": 1,
+    "热门电影": 1,
+    "批量电影详情": 1,
+}
+
+
+def cmd_check_queries(args):
+    """
+    在两种数量下执行电影列表/详情/热门/批量详情，统计各自的SQL条数（关闭接口缓存，结果不受命中影响）；
+    条数随数量变化（出现N+1查询）或超过QUERY_BUDGETS时以状态码1退出（可放进部署检查或CI）
+    """
+    from sqlalchemy import event
+    from utils import cache
+    from services import movie_service
+    from models.movie import Movie
+    app.config["CACHE_ENABLED"] = False
+    cache.init_app(app)
+
+    small, large = args.sizes
+    movie_ids = [movie_id for movie_id, in db.session.query(Movie.id).order_by(Movie.id).limit(large)]
+    if len(movie_ids) < large:
+        sys.exit(f"电影数量不足{large}部，无法检查（先导入数据或用 benchmarks/datagen.py 生成）")
+    calls = {
+        "电影列表（页码分页）": lambda n: movie_service.get_movie_list(db, page=1, page_size=n),
+        "电影列表（游标分页）": lambda n: movie_service.get_movie_list(db, page_size=n, cursor=""),
+        "电影详情": lambda n: movie_service.get_movie_detail(db, movie_ids[n - 1]),
+        "热门电影": lambda n: movie_service.get_hot_movies(db, limit=n),
+        "批量电影详情": lambda n: movie_service.get_movie_details(db, movie_ids[:n]),
+    }
+
+    def count_statements(call, n):
+        statements = []
+
+        def on_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", on_execute)
+        try:
+            call(n)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", on_execute)
+        return len(statements)
+
+    failed = False
+    for name, call in calls.items():
+        counts = [count_statements(call, n) for n in (small, large)]
+        ok = counts[0] == counts[1] and counts[1] <= QUERY_BUDGETS[name]
+        failed |= not ok
+        print(f"[{'OK' if ok else 'SQL条数异常'}] {name}：数量{small}时{counts[0]}条，数量{large}时{counts[1]}条"
+              f"（预算{QUERY_BUDGETS[name]}条）")
+    if failed:
+        sys.exit(1)
+
+
+def cmd_rebuild_rating_stats(args):
+    """根据user_rating表全量重算电影表上的评分统计字段"""
+    from services import movie_service
+    updated = movie_service.rebuild_rating_stats(db)
+    print(f"评分统计已重算：{updated}部电影")
+
+
+def cmd_backfill_posters(args):
+    """为已有海报补齐内容摘要（迁移后执行一次，否则列表中旧海报没有URL），并生成缺失的缩略图"""
+    from services import movie_service, poster_cache
+    updated = movie_service.backfill_picture_hashes(db)
+    print(f"海报摘要已补齐：{updated}部电影")
+    if not args.skip_thumbnails:
+        generated = poster_cache.backfill(db, batch_size=args.batch_size)
+        print(f"海报缩略图已生成：{generated}张海报")
+
+
+def cmd_build_facets(args):
+    """从movie表的类别、演员、导演字段回填genre/person及关联表（可重复执行）"""
+    from services import browse_service
+    processed = browse_service.rebuild_facets(db, batch_size=args.batch_size)
+    print(f"类别/影人关联已重建：{processed}部电影")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="电影推荐系统后端命令行工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("precompute-recommend", help="批量计算所有用户的推荐结果")
+    p.add_argument("--workers", type=int, default=None, help="并行进程数（默认CPU核数）")
+    p.add_argument("--block-size", type=int, default=None, help="每块计算的用户数")
+    p.set_defaults(func=cmd_precompute_recommend)
+
+    p = subparsers.add_parser("build-item-neighbors", help="离线构建基于物品推荐的电影相似度表")
+    p.add_argument("--k", type=int, default=None, help="每部电影保留的相似电影数量（默认50）")
+    p.set_defaults(func=cmd_build_item_neighbors)
+
+    p = subparsers.add_parser("train-als", help="训练ALS矩阵分解推荐模型")
+    p.add_argument("--factors", type=int, default=32, help="隐因子维数")
+    p.add_argument("--reg", type=float, default=0.1, help="正则化系数")
+    p.add_argument("--iterations", type=int, default=10, help="迭代轮数")
+    p.add_argument("--workers", type=int, default=None, help="并行线程数（默认CPU核数）")
+    p.add_argument("--use-views", action="store_true", help="把浏览记录作为隐式反馈加入训练")
+    p.add_argument("--holdout", type=float, default=0.0, help="留出评估的评分比例（如0.1），0表示不留出")
+    p.set_defaults(func=cmd_train_als)
+
+    p = subparsers.add_parser("build-ann", help="重建相似电影的近似最近邻索引")
+    p.set_defaults(func=cmd_build_ann)
+
+    p = subparsers.add_parser("import-movielens", help="批量导入MovieLens格式的CSV数据")
+    p.add_argument("directory", help="CSV所在目录（movies.csv、ratings.csv，可选tags.csv）")
+    p.add_argument("--chunk-size", type=int, default=5000, help="每批（每个事务）导入的行数")
+    p.add_argument("--tags", action="store_true", help="同时导入tags.csv，把常见标签写入空的电影简介")
+    p.add_argument("--skip-movies", action="store_true", help="不导入movies.csv")
+    p.add_argument("--skip-ratings", action="store_true", help="不导入ratings.csv")
+    p.add_argument("--movie-id-offset", type=int, default=0, help="电影ID偏移量（与已有电影ID错开）")
+    p.add_argument("--user-id-offset", type=int, default=0, help="用户ID偏移量（与已有用户ID错开）")
+    p.add_argument("--restart", action="store_true", help="忽略已记录的进度，从头导入")
+    p.add_argument("--rebuild-aggregates", action="store_true", help="导入后重算评分统计、类别关联、搜索索引等派生数据")
+    p.set_defaults(func=cmd_import_movielens)
+
+    p = subparsers.add_parser("migrate", help="补齐数据库中缺失的表、字段和索引")
+    p.add_argument("--dedupe", action="store_true", help="先删除重复评分（每个用户对每部电影只保留最新一条），再建唯一索引")
+    p.set_defaults(func=cmd_migrate)
+
+    p = subparsers.add_parser("check-indexes", help="检查索引，并用EXPLAIN确认热点查询走索引")
+    p.add_argument("--uid", type=int, default=1, help="EXPLAIN时使用的用户ID")
+    p.add_argument("--mid", type=int, default=1, help="EXPLAIN时使用的电影ID")
+    p.set_defaults(func=cmd_check_indexes)
+
+    p = subparsers.add_parser("check-queries", help="检查电影列表/详情/热门等查询的SQL条数不随数量增长")
+    p.add_argument("--sizes", type=int, nargs=2, default=[5, 50], metavar=("SMALL", "LARGE"),
+                   help="对比的两种数量（每页条数/电影数）")
+    p.set_defaults(func=cmd_check_queries)
+
+    p = subparsers.add_parser("rebuild-rating-stats", help="全量重算电影的评分总和/评分数量")
+    p.set_defaults(func=cmd_rebuild_rating_stats)
+
+    p = subparsers.add_parser("backfill-posters", help="为已有海报补齐内容摘要并生成缩略图")
+    p.add_argument("--batch-size", type=int, default=50, help="每批读取的海报数量")
+    p.add_argument("--skip-thumbnails", action="store_true", help="只补齐摘要，不生成缩略图")
+    p.set_defaults(func=cmd_backfill_posters)
+
+    p = subparsers.add_parser("build-facets", help="回填电影的类别/影人关联表")
+    p.add_argument("--batch-size", type=int, default=500, help="每批处理的电影数量")
+    p.set_defaults(func=cmd_build_facets)
+
+    args = parser.parse_args()
+    with app.app_context():
+        args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+# 电影类别表及电影-类别关联表模型，对应数据库中的genre、movie_genre表
+# 由movie.style拆分而来（manage.py build-facets回填，新增/编辑电影时同步）
+from . import db  # 导入models/__init__.py中的db对象
+
+class Genre(db.Model):
+    __tablename__ = "genre"
+    
+    id = db.Column(db.Integer, primary_key=True, comment="类别编号")
+    name = db.Column(db.String(50), unique=True, nullable=False, comment="类别名称")
+
+class MovieGenre(db.Model):
+    __tablename__ = "movie_genre"
+    
+    # 主键 (gid, mid)：按类别查电影直接走主键；按电影删除关联走mid索引
+    gid = db.Column(db.Integer, primary_key=True, autoincrement=False, comment="类别编号")
+    mid = db.Column(db.Integer, primary_key=True, autoincrement=False, index=True, comment="电影编号")
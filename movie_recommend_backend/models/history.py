@@ -1,10 +1,16 @@
 # 用户历史记录表模型，对应数据库中的user_history表
 from . import db  # 导入models/__init__.py中的db对象
+import datetime
 
 class UserHistory(db.Model):
     __tablename__ = "user_history"
+    __table_args__ = (
+        # 用户行为记录：按用户取浏览记录并按时间倒序
+        db.Index("ix_user_history_uid_time", "uid", "time"),
+    )
     
     id = db.Column(db.Integer, primary_key=True, comment="记录编号")
     uid = db.Column(db.Integer, nullable=False, comment="用户编号")
     mid = db.Column(db.Integer, nullable=False, comment="电影编号")
-    time = db.Column(db.DateTime, default=db.func.current_timestamp(), comment="浏览时间")
\ No newline at end of file
+    # 用应用服务器的时钟（与评分表、浏览记录缓冲一致），合并时间线按时间排序时不会因两边时钟不同而错序
+    time = db.Column(db.DateTime, default=datetime.datetime.now, comment="浏览时间")
\ No newline at end of file
@@ -0,0 +1,10 @@
+# 数据导入进度表模型，对应数据库中的import_progress表
+# 批量导入（manage.py import-movielens）每提交一批就在同一事务里更新已导入的行数，中断后从断点继续
+from . import db  # 导入models/__init__.py中的db对象
+
+class ImportProgress(db.Model):
+    __tablename__ = "import_progress"
+    
+    source = db.Column(db.String(255), primary_key=True, comment="数据来源（导入类型:文件名）")
+    rows = db.Column(db.Integer, nullable=False, default=0, comment="已导入的行数（不含表头）")
+    update_time = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp(), comment="最后更新时间")
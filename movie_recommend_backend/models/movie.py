@@ -4,11 +4,17 @@ from . import db  # 导入models/__init__.py中的db对象
 
 class Movie(db.Model):
     __tablename__ = "movie"
+    __table_args__ = (
+        # 电影列表按 (发行日期, ID) 倒序分页，游标分页直接沿该索引定位
+        db.Index("ix_movie_release_date_id", "release_date", "id"),
+    )
     
     id = db.Column(db.Integer, primary_key=True, comment="电影编号")
     name = db.Column(db.String(50), nullable=False, comment="电影名称")
     release_date = db.Column(db.Date, comment="发行日期")
-    picture = db.Column(db.LargeBinary, comment="电影图片（暂不使用）")  # 已有字段，无需改
+    # 海报二进制较大，设为延迟加载：Movie.query 默认不读取，只有访问 movie.picture 时才单独查询
+    picture = db.deferred(db.Column(db.LargeBinary, comment="电影图片"))
+    picture_hash = db.Column(db.String(64), comment="海报内容SHA-256（用作ETag和海报URL版本号）")
     director = db.Column(db.String(100), comment="导演")
     actors = db.Column(db.Text, comment="主要演员")
     language = db.Column(db.String(50), comment="语言类别")
@@ -16,6 +22,20 @@ class Movie(db.Model):
     style = db.Column(db.Text, comment="电影类别")
     duration = db.Column(db.Text, comment="电影时长")
     description = db.Column(db.Text, comment="电影介绍")
+    # 评分统计（冗余字段，由评分接口在同一事务内维护，可用 manage.py rebuild-rating-stats 全量重算）
+    rating_sum = db.Column(db.Float, nullable=False, default=0, server_default="0", comment="评分总和")
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default="0", index=True, comment="评分数量")
+    update_time = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp(), comment="最后修改时间")
+
+    @property
+    def avg_score(self):
+        """平均评分（保留1位小数，无评分时为0.0）"""
+        return average_score(self.rating_sum, self.rating_count)
+
+    @property
+    def poster_url(self):
+        """海报接口地址（带内容版本号，海报不变则URL不变，可被浏览器长期缓存）；无海报时为空字符串"""
+        return make_poster_url(self.id, self.picture_hash)
 
     # 新增：序列化方法（处理海报+兼容原有字段）
     def to_dict(self, with_picture=True, trunc_desc=True):
@@ -47,4 +67,63 @@ class Movie(db.Model):
         else:
             data["picture"] = ""
         
-        return data
\ No newline at end of file
+        return data
+
+
+def average_score(rating_sum, rating_count):
+    """平均评分（保留1位小数，无评分时为0.0）"""
+    return round(rating_sum / rating_count, 1) if rating_count else 0.0
+
+
+def make_poster_url(movie_id, picture_hash):
+    """海报接口地址（带内容版本号）；无海报时为空字符串"""
+    if not picture_hash:
+        return ""
+    return f"/api/movie/{movie_id}/poster?v={picture_hash[:12]}"
+
+
+# ---------------------- 列投影：列表/详情/管理只查需要的列 ----------------------
+# 用法：db.session.query(*MOVIE_PROJECTIONS["card"])，结果是Row元组（不创建ORM实体、不进identity map），
+# 再用movie_row_to_dict统一转成接口格式；海报二进制只由海报接口单独读取
+DESCRIPTION_SNIPPET_LENGTH = 80  # 列表卡片中简介的截取长度
+_BASE_COLUMNS = (
+    Movie.id, Movie.name, Movie.release_date, Movie.director, Movie.actors, Movie.language, Movie.company,
+    Movie.style, Movie.duration, Movie.picture_hash, Movie.rating_sum, Movie.rating_count,
+)
+MOVIE_PROJECTIONS = {
+    # 列表卡片（电影列表、热门、推荐、搜索、相似电影、分类浏览）：简介在SQL中截取，多取1个字符用来判断是否加省略号
+    "card": _BASE_COLUMNS + (db.func.substr(Movie.description, 1, DESCRIPTION_SNIPPET_LENGTH + 1).label("description"),),
+    # 电影详情：完整简介
+    "detail": _BASE_COLUMNS + (Movie.description,),
+    # 管理员电影列表：完整简介（编辑表单回显）+ 最后修改时间
+    "admin": _BASE_COLUMNS + (Movie.description, Movie.update_time),
+}
+
+
+def movie_row_to_dict(row, projection="card", split_lists=False):
+    """
+    把MOVIE_PROJECTIONS查询出的一行转成接口返回的字典
+    :param projection: 查询时使用的投影名（card时截取简介，admin时附带修改时间）
+    :param split_lists: 演员、类别是否拆成列表（详情页、推荐卡片使用），否则保持原字符串
+    """
+    description = row.description or ""
+    if projection == "card" and len(description) > DESCRIPTION_SNIPPET_LENGTH:
+        description = description[:DESCRIPTION_SNIPPET_LENGTH] + "..."
+    data = {
+        "id": row.id,
+        "name": row.name,
+        "release_date": row.release_date.strftime("%Y-%m-%d") if row.release_date else "",
+        "director": row.director or "",
+        "actors": (row.actors.split(" ") if row.actors else []) if split_lists else (row.actors or ""),
+        "language": row.language or "",
+        "company": row.company or "",
+        "style": (row.style.split(",") if row.style else []) if split_lists else (row.style or ""),
+        "duration": row.duration or "",
+        "description": description,
+        "poster_url": make_poster_url(row.id, row.picture_hash),  # 海报通过单独接口获取
+        "avg_score": average_score(row.rating_sum, row.rating_count),
+        "rating_count": row.rating_count,
+    }
+    if projection == "admin":
+        data["update_time"] = row.update_time.strftime("%Y-%m-%d %H:%M:%S") if row.update_time else ""
+    return data
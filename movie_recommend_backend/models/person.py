@@ -0,0 +1,17 @@
+# 影人表及电影-影人关联表模型，对应数据库中的person、movie_person表
+# 由movie.actors、movie.director拆分而来（manage.py build-facets回填，新增/编辑电影时同步）
+from . import db  # 导入models/__init__.py中的db对象
+
+class Person(db.Model):
+    __tablename__ = "person"
+    
+    id = db.Column(db.Integer, primary_key=True, comment="影人编号")
+    name = db.Column(db.String(100), unique=True, nullable=False, comment="姓名")
+
+class MoviePerson(db.Model):
+    __tablename__ = "movie_person"
+    
+    # 主键 (pid, role, mid)：按影人+角色查电影直接走主键；按电影删除关联走mid索引
+    pid = db.Column(db.Integer, primary_key=True, autoincrement=False, comment="影人编号")
+    role = db.Column(db.String(10), primary_key=True, comment="角色（actor=演员，director=导演）")
+    mid = db.Column(db.Integer, primary_key=True, autoincrement=False, index=True, comment="电影编号")
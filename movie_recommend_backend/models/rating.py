@@ -1,12 +1,22 @@
 # 用户评分表模型，对应数据库中的user_rating表
 from . import db  # 导入models/__init__.py中的db对象
+import datetime
 
 class UserRating(db.Model):
     __tablename__ = "user_rating"
+    __table_args__ = (
+        # 每个用户对每部电影只能评一次分；同时覆盖“按用户查评分”（最左前缀uid）和重复评分检查
+        db.Index("uq_user_rating_uid_mid", "uid", "mid", unique=True),
+        # 按电影统计评分总和/数量（rebuild_rating_stats），score在索引内，不用回表
+        db.Index("ix_user_rating_mid_score", "mid", "score"),
+        # 用户行为记录：按用户取评分并按时间倒序
+        db.Index("ix_user_rating_uid_time", "uid", "time"),
+    )
     
     id = db.Column(db.Integer, primary_key=True, comment="评分编号")
     uid = db.Column(db.Integer, nullable=False, comment="用户编号")
     mid = db.Column(db.Integer, nullable=False, comment="电影编号")
     score = db.Column(db.Float, nullable=False, comment="评分值（1.0-5.0）")
     description = db.Column(db.Text, comment="用户评论")
-    time = db.Column(db.DateTime, default=db.func.current_timestamp(), comment="评论时间")
\ No newline at end of file
+    # 用应用服务器的时钟（与浏览记录一致，见history.py）
+    time = db.Column(db.DateTime, default=datetime.datetime.now, comment="评论时间")
\ No newline at end of file
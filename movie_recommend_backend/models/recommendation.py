@@ -0,0 +1,13 @@
+# 用户推荐结果表模型，对应数据库中的user_recommendation表（由离线批量任务生成）
+from . import db  # 导入models/__init__.py中的db对象
+
+class UserRecommendation(db.Model):
+    __tablename__ = "user_recommendation"
+    
+    uid = db.Column(db.Integer, primary_key=True, autoincrement=False, comment="用户编号")
+    mids = db.Column(db.Text, nullable=False, default="", comment="推荐电影编号（逗号分隔，按推荐顺序）")
+    update_time = db.Column(db.DateTime, default=db.func.current_timestamp(), comment="生成时间")
+
+    def movie_ids(self):
+        """推荐电影ID列表"""
+        return [int(mid) for mid in self.mids.split(",") if mid]
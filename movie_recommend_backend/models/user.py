@@ -14,6 +14,8 @@ class User(db.Model):
     sex = db.Column(db.Boolean, comment="性别（1=男，0=女）")
     create_time = db.Column(db.DateTime, default=db.func.current_timestamp(), comment="创建时间")
     is_admin = db.Column(db.Boolean, default=False, comment="是否为管理员（默认普通用户）")  # 新增字段
+    # 登录令牌版本号：令牌中带签发时的版本号，+1即撤销之前签发的全部令牌（已有库执行 manage.py migrate 补齐）
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default="0", comment="登录令牌版本号")
 
     # 静态方法：密码加密（将明文密码转为MD5密文）
     @staticmethod
@@ -0,0 +1,289 @@
+# 矩阵分解推荐（ALS，交替最小二乘）：把评分矩阵分解为用户隐因子×电影隐因子
+# 训练：固定一侧因子，另一侧每一行都是一个带权重的岭回归，分块批量求解并在线程池中并行（numpy求解时释放GIL）
+# 服务：因子矩阵保存为.npy，启动时以内存映射方式加载；给一个用户打分只需一次矩阵-向量乘法 + argpartition取Top-N
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import scipy.sparse as sp
+from models.rating import UserRating
+from models.history import UserHistory
+from utils.file_watch import FileWatcher
+from .rating_matrix import IndexMap, LIKE_THRESHOLD
+
+ALS_FACTORS = 32  # 隐因子维数
+ALS_REG = 0.1  # 正则化系数（按每行的观测权重之和缩放）
+ALS_ITERATIONS = 10
+VIEW_WEIGHT = 0.2  # 浏览记录作为隐式反馈时的权重（显式评分权重为1）
+VIEW_SCORE = LIKE_THRESHOLD  # 浏览过但未评分的电影，视为“有点喜欢”
+BLOCK_NNZ = 8192  # 分块求解时每块最多的观测数（控制外积张量的内存）
+FORMAT_VERSION = 1
+CURRENT_FILE = "CURRENT"  # 指针文件：内容为当前版本所在的子目录名
+KEEP_VERSIONS = 2  # 保留的版本数（旧版本可能仍被其他进程内存映射，不立即删除）
+
+
+class _Observations:
+    """按行（用户或电影）分组的观测：indptr分段，other=另一侧的位置，values=评分，weights=权重"""
+
+    def __init__(self, keys, other, values, weights, n_rows):
+        order = np.argsort(keys, kind="stable")
+        self.other = other[order]
+        self.values = values[order]
+        self.weights = weights[order]
+        self.indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=n_rows), out=self.indptr[1:])
+
+    @property
+    def n_rows(self):
+        return len(self.indptr) - 1
+
+    def blocks(self):
+        """按观测数切分行区间，每块不超过BLOCK_NNZ个观测（单行超过时单独成块）"""
+        start = 0
+        while start < self.n_rows:
+            end = int(np.searchsorted(self.indptr, self.indptr[start] + BLOCK_NNZ, side="right")) - 1
+            end = min(max(end, start + 1), self.n_rows)
+            yield start, end
+            start = end
+
+
+def _solve_block(obs, fixed, reg, mean, start, end):
+    """
+    求解 [start, end) 这些行的因子：(Σ w·q·qᵀ + reg·Σw·I) x = Σ w·(r-均值)·q
+    所有行的正规方程一次性批量构造、批量求解
+    """
+    lo, hi = obs.indptr[start], obs.indptr[end]
+    factors = fixed.shape[1]
+    result = np.zeros((end - start, factors), dtype=np.float32)
+    if hi == lo:
+        return start, result
+    q = fixed[obs.other[lo:hi]]
+    w = obs.weights[lo:hi, None]
+    counts = np.diff(obs.indptr[start:end + 1])
+    nonempty = np.nonzero(counts)[0]
+    seg_starts = (obs.indptr[start:end] - lo)[nonempty]
+
+    wq = q * w
+    a = np.add.reduceat(np.einsum("ni,nj->nij", wq, q), seg_starts, axis=0)
+    b = np.add.reduceat(wq * (obs.values[lo:hi, None] - mean), seg_starts, axis=0)
+    weight_sums = np.add.reduceat(w[:, 0], seg_starts)
+    a += (reg * weight_sums)[:, None, None] * np.eye(factors, dtype=a.dtype)
+    result[nonempty] = np.linalg.solve(a, b[:, :, None])[:, :, 0]
+    return start, result
+
+
+def _solve_side(obs, fixed, reg, mean, pool):
+    out = np.zeros((obs.n_rows, fixed.shape[1]), dtype=np.float32)
+    for start, block in pool.map(lambda se: _solve_block(obs, fixed, reg, mean, *se), obs.blocks()):
+        out[start:start + len(block)] = block
+    return out
+
+
+def rmse(model, ratings):
+    """在 (uid, mid, score) 上计算RMSE（跳过模型中不存在的用户/电影）"""
+    if not len(ratings):
+        return float("nan")
+    uid_col, mid_col, score_col = (np.asarray(col) for col in zip(*ratings))
+    rows, cols = model.users.get_many(uid_col), model.movies.get_many(mid_col)
+    known = (rows >= 0) & (cols >= 0)
+    if not known.any():
+        return float("nan")
+    predicted = model.mean + np.einsum(
+        "ij,ij->i", model.user_factors[rows[known]], model.item_factors[cols[known]]
+    )
+    return float(np.sqrt(np.mean(np.square(predicted - score_col[known].astype(np.float32)))))
+
+
+class ALSModel:
+    """
+    ALS模型（构建后只读）
+    - users / movies: ID与因子矩阵行号的映射
+    - user_factors / item_factors: float32 因子矩阵（加载时为只读内存映射）
+    - rated: 用户×电影的稀疏“已评分”掩码，推荐时排除
+    - mean: 全局平均分（预测值 = 均值 + 用户因子·电影因子）
+    """
+
+    def __init__(self, users, movies, user_factors, item_factors, rated, mean, built_at=None):
+        self.users = users
+        self.movies = movies
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.rated = rated
+        self.mean = float(mean)
+        self.built_at = built_at or time.time()
+
+    @property
+    def n_users(self):
+        return len(self.users)
+
+    @classmethod
+    def train(cls, ratings, views=None, factors=ALS_FACTORS, reg=ALS_REG, iterations=ALS_ITERATIONS,
+              workers=None, view_weight=VIEW_WEIGHT, seed=0, callback=None):
+        """
+        训练模型
+        :param ratings: (uid, mid, score) 显式评分
+        :param views: (uid, mid) 浏览记录（可选），未评分的电影以VIEW_SCORE、view_weight作为弱观测加入
+        :param workers: 并行线程数（默认CPU核数）
+        :param callback: 每轮迭代后调用 callback(第几轮, 模型)，用于打印进度/RMSE
+        """
+        ratings = list(ratings)
+        rated_pairs = {(int(uid), int(mid)) for uid, mid, _ in ratings}
+        implicit = sorted({(int(uid), int(mid)) for uid, mid in (views or [])} - rated_pairs)
+
+        uid_col = np.array([r[0] for r in ratings] + [v[0] for v in implicit], dtype=np.int32)
+        mid_col = np.array([r[1] for r in ratings] + [v[1] for v in implicit], dtype=np.int32)
+        values = np.array([r[2] for r in ratings] + [VIEW_SCORE] * len(implicit), dtype=np.float32)
+        weights = np.array([1.0] * len(ratings) + [view_weight] * len(implicit), dtype=np.float32)
+        uids, rows = np.unique(uid_col, return_inverse=True)
+        mids, cols = np.unique(mid_col, return_inverse=True)
+        rows, cols = rows.astype(np.int32), cols.astype(np.int32)
+        mean = float(values[:len(ratings)].mean()) if ratings else 0.0
+
+        by_user = _Observations(rows, cols, values, weights, len(uids))
+        by_item = _Observations(cols, rows, values, weights, len(mids))
+        n_explicit = len(ratings)
+        rated = sp.csr_matrix(
+            (np.ones(n_explicit, dtype=np.bool_), (rows[:n_explicit], cols[:n_explicit])),
+            shape=(len(uids), len(mids)),
+        )
+
+        rng = np.random.default_rng(seed)
+        user_factors = np.zeros((len(uids), factors), dtype=np.float32)
+        item_factors = (rng.standard_normal((len(mids), factors)) * 0.1).astype(np.float32)
+        model = cls(IndexMap(uids), IndexMap(mids), user_factors, item_factors, rated, mean)
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            for iteration in range(1, iterations + 1):
+                model.user_factors = _solve_side(by_user, model.item_factors, reg, mean, pool)
+                model.item_factors = _solve_side(by_item, model.user_factors, reg, mean, pool)
+                if callback:
+                    callback(iteration, model)
+        return model
+
+    def recommend(self, user_id, limit=10, exclude=()):
+        """
+        一次矩阵-向量乘法给所有电影打分，排除已评分电影后用argpartition取Top-N
+        :param exclude: 额外排除的电影ID（如训练之后新评分的电影）
+        :return: 电影ID列表；用户不在模型中时返回None
+        """
+        row = self.users.get(int(user_id))
+        if row is None:
+            return None
+        scores = self.item_factors @ self.user_factors[row]
+        scores[self.rated.indices[self.rated.indptr[row]:self.rated.indptr[row + 1]]] = -np.inf
+        if len(exclude):
+            cols = self.movies.get_many(list(exclude))
+            scores[cols[cols >= 0]] = -np.inf
+        n = min(limit, int(np.isfinite(scores).sum()))
+        if n <= 0:
+            return []
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.lexsort((self.movies.ids[top], -scores[top]))]
+        return [int(mid) for mid in self.movies.ids[top]]
+
+    def save(self, directory):
+        """
+        因子矩阵各存一个.npy（便于内存映射），其余元数据存meta.npz
+        每次保存写到一个新的版本子目录，全部写完后原子替换指针文件CURRENT切换版本，
+        读取方不会看到新旧文件混在一起的中间状态
+        """
+        version = f"v{int(time.time() * 1000)}-{os.getpid()}"
+        version_dir = os.path.join(directory, version)
+        os.makedirs(version_dir)
+        files = {
+            "user_factors.npy": lambda f: np.save(f, np.ascontiguousarray(self.user_factors)),
+            "item_factors.npy": lambda f: np.save(f, np.ascontiguousarray(self.item_factors)),
+            "meta.npz": lambda f: np.savez(
+                f, format=FORMAT_VERSION, mean=self.mean, built_at=self.built_at,
+                user_ids=self.users.ids, movie_ids=self.movies.ids,
+                rated_indptr=self.rated.indptr, rated_indices=self.rated.indices,
+            ),
+        }
+        for name, write in files.items():
+            with open(os.path.join(version_dir, name), "wb") as f:
+                write(f)
+        tmp_path = os.path.join(directory, CURRENT_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(version)
+        os.replace(tmp_path, os.path.join(directory, CURRENT_FILE))
+        _remove_old_versions(directory, version)
+
+    @staticmethod
+    def load(directory):
+        """
+        加载指针文件指向的版本，因子矩阵以只读内存映射打开（多进程部署时共享页缓存）
+        文件不存在或因子矩阵与元数据的行数对不上时返回None
+        """
+        try:
+            with open(os.path.join(directory, CURRENT_FILE)) as f:
+                directory = os.path.join(directory, f.read().strip())
+        except FileNotFoundError:
+            pass  # 旧的目录结构：文件直接放在directory下
+        meta_path = os.path.join(directory, "meta.npz")
+        if not os.path.exists(meta_path):
+            return None
+        with np.load(meta_path) as meta:
+            if int(meta["format"]) != FORMAT_VERSION:
+                return None
+            users, movies = IndexMap(meta["user_ids"]), IndexMap(meta["movie_ids"])
+            rated = sp.csr_matrix(
+                (np.ones(len(meta["rated_indices"]), dtype=np.bool_), meta["rated_indices"], meta["rated_indptr"]),
+                shape=(len(users), len(movies)),
+            )
+            mean, built_at = float(meta["mean"]), float(meta["built_at"])
+        user_factors = np.load(os.path.join(directory, "user_factors.npy"), mmap_mode="r")
+        item_factors = np.load(os.path.join(directory, "item_factors.npy"), mmap_mode="r")
+        if user_factors.shape[0] != len(users) or item_factors.shape[0] != len(movies):
+            print(f"ALS模型文件不一致（因子矩阵与元数据的行数不同），忽略：{directory}")
+            return None
+        return ALSModel(users, movies, user_factors, item_factors, rated, mean, built_at)
+
+
+def _remove_old_versions(directory, current):
+    """删除较旧的版本子目录，只保留最近KEEP_VERSIONS个（含当前版本）"""
+    versions = sorted(
+        (name for name in os.listdir(directory)
+         if name.startswith("v") and os.path.isdir(os.path.join(directory, name))),
+        key=lambda name: os.path.getmtime(os.path.join(directory, name)),
+    )
+    for name in versions[:-KEEP_VERSIONS]:
+        if name != current:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def load_training_data(db, use_views=False):
+    """读取训练数据：评分，以及（可选）浏览记录"""
+    ratings = db.session.query(UserRating.uid, UserRating.mid, UserRating.score).all()
+    views = db.session.query(UserHistory.uid, UserHistory.mid).distinct().all() if use_views else None
+    return ratings, views
+
+
+# ---------------------- 全局模型 ----------------------
+_model = None
+_directory = None
+_watcher = None
+
+
+def get_model():
+    """当前ALS模型（未训练过时返回None）；manage.py train-als 重新训练后自动重新加载"""
+    global _model
+    if _watcher is not None and _watcher.changed():
+        try:
+            model = ALSModel.load(_directory)
+            if model is not None:
+                _model = model
+        except Exception as e:
+            print(f"重新加载ALS模型失败：{str(e)}")
+    return _model
+
+
+def init_app(app):
+    """启动时加载 manage.py train-als 训练好的模型（不在启动时训练）"""
+    global _model, _directory, _watcher
+    _directory = app.config["ALS_MODEL_DIR"]
+    _watcher = FileWatcher(os.path.join(_directory, CURRENT_FILE))  # 指针文件在新版本全部写完后才替换
+    try:
+        _watcher.mark()
+        _model = ALSModel.load(_directory)
+    except Exception as e:
+        print(f"加载ALS模型失败：{str(e)}")
@@ -0,0 +1,225 @@
+# 近似最近邻（ANN）索引：随机投影局部敏感哈希（LSH），按余弦相似度查找最相似的用户/电影
+# 每张哈希表用n_bits个随机超平面把向量编码成一个整数桶号，方向相近的向量大概率落在同一个桶；
+# 查询时只取各表中同桶（以及只差1位的相邻桶）的候选，再用精确余弦相似度重排，代价与候选数有关而与总数无关
+# 向量可以是稠密数组（如ALS隐因子），也可以是稀疏矩阵的行（如评分矩阵的用户行/电影列）
+import os
+import tempfile
+import threading
+import numpy as np
+import scipy.sparse as sp
+from models import db
+from models.rating import UserRating
+from utils.file_watch import FileWatcher
+from .rating_matrix import build_rating_matrix
+from . import als_model
+
+ANN_TABLES = 8  # 哈希表数量（越多召回越高，内存和查询代价也越高）
+ANN_BUCKET_SIZE = 8  # 未指定每张表的超平面数时，按“平均每桶约8个向量”自动选择
+FORMAT_VERSION = 1
+
+
+def _normalize(vectors):
+    """按行归一化为单位向量（零向量保持为零）"""
+    if sp.issparse(vectors):
+        vectors = sp.csr_matrix(vectors, dtype=np.float32)
+        norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sp.csr_matrix(sp.diags(1.0 / norms) @ vectors, dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class LSHIndex:
+    """
+    随机投影LSH索引（构建后只读）
+    - ids: 第i个向量对应的ID（用户ID/电影ID）
+    - vectors: 归一化后的向量，用于候选重排
+    - 每张表的桶：sorted_codes[t] 为排好序的桶号，order[t] 为对应的向量位置，查桶时二分查找
+    """
+
+    def __init__(self, ids, vectors, n_tables=ANN_TABLES, n_bits=None, seed=0, normalized=False):
+        """
+        :param n_bits: 每张表的超平面数（越多桶越细、候选越少），为空时按向量数自动选择
+        :param normalized: vectors已是单位向量时跳过归一化（从磁盘加载时）
+        """
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vectors = vectors if normalized else _normalize(vectors)
+        self.n_tables = n_tables
+        if n_bits is None:
+            n_bits = int(np.clip(np.round(np.log2(max(len(self.ids), 1) / ANN_BUCKET_SIZE)), 1, 24))
+        self.n_bits = n_bits
+        self.seed = seed
+        self._id_pos = {int(id_): pos for pos, id_ in enumerate(self.ids)}
+        # 随机超平面由seed确定，不需要保存到磁盘
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((self.dim, n_tables * n_bits)).astype(np.float32)
+        codes = self._hash(self.vectors)  # 形状：表数 × 向量数
+        self.order = np.argsort(codes, axis=1, kind="stable").astype(np.int32)
+        self.sorted_codes = np.take_along_axis(codes, self.order, axis=1)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    def _hash(self, vectors):
+        """向量 → 每张表的桶号，返回 表数 × 向量数 的int64数组"""
+        projected = vectors @ self.planes
+        bits = (np.asarray(projected) > 0).reshape(-1, self.n_tables, self.n_bits)
+        codes = bits.astype(np.int64) @ (np.int64(1) << np.arange(self.n_bits, dtype=np.int64))
+        return codes.T
+
+    def candidates(self, vector, probe=True):
+        """
+        收集候选向量位置：每张表中同桶的向量；probe=True时再加上只差1位的相邻桶（多探针，提高召回）
+        """
+        codes = self._hash(_normalize(vector.reshape(1, -1) if not sp.issparse(vector) else vector))[:, 0]
+        found = []
+        flips = np.int64(1) << np.arange(self.n_bits, dtype=np.int64)
+        for t, code in enumerate(codes):
+            probes = np.concatenate(([code], code ^ flips)) if probe else np.array([code])
+            lo = np.searchsorted(self.sorted_codes[t], probes, side="left")
+            hi = np.searchsorted(self.sorted_codes[t], probes, side="right")
+            found.extend(self.order[t, a:b] for a, b in zip(lo, hi) if b > a)
+        if not found:
+            return np.array([], dtype=np.int32)
+        return np.unique(np.concatenate(found))
+
+    def query(self, vector, k=10, exclude=None, probe=True):
+        """
+        查找与vector最相似的k个向量
+        :param exclude: 排除的ID（如查询对象自己）
+        :return: [(ID, 余弦相似度), ...]，按相似度降序、ID升序
+        """
+        positions = self.candidates(vector, probe)
+        if exclude is not None:
+            positions = positions[self.ids[positions] != exclude]
+        if not len(positions):
+            return []
+        query = _normalize(vector.reshape(1, -1) if not sp.issparse(vector) else vector)
+        sims = self.vectors[positions] @ query.T
+        sims = np.asarray(sims.toarray() if sp.issparse(sims) else sims).ravel()
+        order = np.lexsort((self.ids[positions], -sims))[:k]
+        return [(int(self.ids[positions[i]]), float(sims[i])) for i in order]
+
+    def query_id(self, id_, k=10, probe=True):
+        """查找与已在索引中的某个ID最相似的k个（不含自己）；ID不在索引中时返回None"""
+        pos = self._id_pos.get(int(id_))
+        if pos is None:
+            return None
+        return self.query(self.vectors[pos], k, exclude=int(id_), probe=probe)
+
+    def save(self, path):
+        """写入磁盘（npz，先写临时文件再改名）；超平面由seed重新生成，不保存"""
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        if sp.issparse(self.vectors):
+            arrays = {"sparse": True, "data": self.vectors.data, "indices": self.vectors.indices,
+                      "indptr": self.vectors.indptr, "shape": np.asarray(self.vectors.shape)}
+        else:
+            arrays = {"sparse": False, "vectors": self.vectors}
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, format=FORMAT_VERSION, ids=self.ids, n_tables=self.n_tables, n_bits=self.n_bits,
+                     seed=self.seed, **arrays)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        """从磁盘加载（重新计算桶），文件不存在或格式不符时返回None"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if int(data["format"]) != FORMAT_VERSION:
+                return None
+            if bool(data["sparse"]):
+                vectors = sp.csr_matrix((data["data"], data["indices"], data["indptr"]), shape=tuple(data["shape"]))
+            else:
+                vectors = data["vectors"]
+            return LSHIndex(data["ids"], vectors, int(data["n_tables"]), int(data["n_bits"]), int(data["seed"]),
+                            normalized=True)
+
+
+def movie_vectors(ratings):
+    """电影向量：评分矩阵的列（各用户对该电影的评分），返回 (电影ID数组, 稀疏矩阵)"""
+    rating_matrix = build_rating_matrix(ratings)
+    return rating_matrix.movies.ids, rating_matrix.matrix.T.tocsr()
+
+
+def user_vectors(ratings):
+    """用户向量：评分矩阵的行，返回 (用户ID数组, 稀疏矩阵)"""
+    rating_matrix = build_rating_matrix(ratings)
+    return rating_matrix.users.ids, rating_matrix.matrix
+
+
+# ---------------------- 全局电影索引（相似电影） ----------------------
+_movie_index = None
+_path = None
+_watcher = None
+
+
+def get_movie_index():
+    """当前电影ANN索引（尚未就绪时返回None）；磁盘上的文件被其他进程重新生成后自动重新加载"""
+    global _movie_index
+    if _watcher is not None and _watcher.changed():
+        try:
+            index = LSHIndex.load(_path)
+            if index is not None:
+                _movie_index = index
+        except Exception as e:
+            print(f"重新加载相似电影索引失败：{str(e)}")
+    return _movie_index
+
+
+def rebuild_movie_index(db, path=None):
+    """
+    构建电影索引，替换当前索引并写入磁盘
+    已训练ALS模型时用电影隐因子（维数低、相似度更平滑），否则用user_rating表的评分列
+    """
+    global _movie_index
+    model = als_model.get_model()
+    if model is not None:
+        index = LSHIndex(model.movies.ids, np.asarray(model.item_factors))
+    else:
+        ratings = db.session.query(UserRating.uid, UserRating.mid, UserRating.score).all()
+        index = LSHIndex(*movie_vectors(ratings))
+    _movie_index = index
+    path = path or _path
+    if path:
+        index.save(path)
+        if _watcher is not None and path == _path:
+            _watcher.mark()
+    return index
+
+
+def init_app(app, build_missing=True):
+    """
+    启动时加载磁盘上的电影索引；不存在（或是空库时生成的空索引）时在后台线程构建
+    :param build_missing: False时只加载，不启动后台构建（离线命令使用）
+    """
+    global _movie_index, _path, _watcher
+    _path = app.config["MOVIE_ANN_PATH"]
+    _watcher = FileWatcher(_path)
+    try:
+        _watcher.mark()
+        _movie_index = LSHIndex.load(_path)
+        if _movie_index is not None and len(_movie_index) > 0:
+            return
+    except Exception as e:
+        print(f"加载相似电影索引失败，将重新构建：{str(e)}")
+    if not build_missing:
+        return
+
+    def run():
+        with app.app_context():
+            try:
+                index = rebuild_movie_index(db)
+                print(f"相似电影索引构建完成：{len(index)}部电影")
+            except Exception as e:
+                print(f"相似电影索引构建失败：{str(e)}")
+
+    threading.Thread(target=run, name="movie-ann-builder", daemon=True).start()
@@ -0,0 +1,179 @@
+# 分类浏览：按类别/演员/导演浏览电影，以及分面计数（每个类别/影人有多少部电影）
+# 数据来自genre/movie_genre、person/movie_person规范化表，由movie.style/actors/director拆分同步而来
+import re
+from sqlalchemy import func, insert
+from models.movie import Movie
+from models.genre import Genre, MovieGenre
+from models.person import Person, MoviePerson
+from utils import cache
+from . import movie_service
+
+ROLE_ACTOR = "actor"  # 演员
+ROLE_DIRECTOR = "director"  # 导演
+FACET_CACHE_TTL = 300  # 全站分面计数缓存时间（秒），电影类别/影人变化时立即失效
+
+
+def _unique(names, max_length):
+    """去空、去重（保留顺序）并截断到字段长度"""
+    return list(dict.fromkeys(name.strip()[:max_length] for name in names if name.strip()))
+
+
+def split_genres(style):
+    """类别按逗号分隔（兼容中文逗号）"""
+    return _unique(re.split(r"[,，]", style or ""), 50)
+
+
+def split_actors(actors):
+    """演员按空格分隔"""
+    return _unique(re.split(r"\s+", actors or ""), 100)
+
+
+def split_directors(director):
+    """多位导演按逗号/顿号/斜杠分隔"""
+    return _unique(re.split(r"[,，、/]", director or ""), 100)
+
+
+def _resolve_ids(db, model, names, cache):
+    """名称 → ID，不存在的先创建；cache在批量回填时跨电影复用"""
+    missing = [name for name in names if name not in cache]
+    if missing:
+        for obj_id, name in db.session.query(model.id, model.name).filter(model.name.in_(missing)):
+            cache[name] = obj_id
+        new_objs = [model(name=name) for name in missing if name not in cache]
+        if new_objs:
+            db.session.add_all(new_objs)
+            db.session.flush()
+            for obj in new_objs:
+                cache[obj.name] = obj.id
+    return [cache[name] for name in names]
+
+
+def sync_movie_facets(db, movie, genre_cache=None, person_cache=None):
+    """
+    根据电影的style/actors/director重建它的类别、影人关联（不提交事务，由调用方提交）
+    :param movie: 已有ID的Movie对象（新增电影需先flush）
+    """
+    genre_cache = {} if genre_cache is None else genre_cache
+    person_cache = {} if person_cache is None else person_cache
+    MovieGenre.query.filter_by(mid=movie.id).delete(synchronize_session=False)
+    MoviePerson.query.filter_by(mid=movie.id).delete(synchronize_session=False)
+
+    genre_ids = _resolve_ids(db, Genre, split_genres(movie.style), genre_cache)
+    if genre_ids:
+        db.session.execute(insert(MovieGenre), [{"gid": gid, "mid": movie.id} for gid in genre_ids])
+
+    links = []
+    for role, names in ((ROLE_DIRECTOR, split_directors(movie.director)), (ROLE_ACTOR, split_actors(movie.actors))):
+        for pid in _resolve_ids(db, Person, names, person_cache):
+            links.append({"pid": pid, "role": role, "mid": movie.id})
+    if links:
+        db.session.execute(insert(MoviePerson), links)
+
+
+def invalidate_facets():
+    """电影的类别/影人关联变化并提交后调用：全站分面计数失效"""
+    cache.invalidate("movie_facets")
+
+
+def rebuild_facets(db, batch_size=500):
+    """
+    从movie表全量回填类别、影人关联（按电影ID分批，每批提交一次）
+    :return: 处理的电影数量
+    """
+    genre_cache, person_cache = {}, {}
+    processed, last_id = 0, 0
+    while True:
+        movies = Movie.query.filter(Movie.id > last_id).order_by(Movie.id).limit(batch_size).all()
+        if not movies:
+            return processed
+        try:
+            for movie in movies:
+                sync_movie_facets(db, movie, genre_cache, person_cache)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        processed += len(movies)
+        last_id = movies[-1].id
+        invalidate_facets()
+
+
+def _genre_counts(db, mid_subquery=None, limit=None):
+    """类别分面计数；传入电影ID子查询时只统计这批电影"""
+    count = func.count(MovieGenre.mid)
+    query = db.session.query(Genre.name, count).join(MovieGenre, MovieGenre.gid == Genre.id)
+    if mid_subquery is not None:
+        query = query.filter(MovieGenre.mid.in_(mid_subquery))
+    query = query.group_by(Genre.id, Genre.name).order_by(count.desc(), Genre.name)
+    if limit:
+        query = query.limit(limit)
+    return [{"name": name, "count": n} for name, n in query.all()]
+
+
+def _person_counts(db, role, limit):
+    count = func.count(MoviePerson.mid)
+    rows = db.session.query(Person.name, count).join(MoviePerson, MoviePerson.pid == Person.id).filter(
+        MoviePerson.role == role
+    ).group_by(Person.id, Person.name).order_by(count.desc(), Person.name).limit(limit).all()
+    return [{"name": name, "count": n} for name, n in rows]
+
+
+@cache.cached("movie_facets", key=lambda limit=50: limit, ttl=FACET_CACHE_TTL)
+def get_facets(db, limit=50):
+    """
+    全站分面计数：每个类别的电影数，以及作品最多的导演/演员（经接口缓存，新增/编辑电影后失效）
+    :param limit: 导演、演员各返回前多少名
+    """
+    try:
+        data = {
+            "genres": _genre_counts(db),
+            "directors": _person_counts(db, ROLE_DIRECTOR, limit),
+            "actors": _person_counts(db, ROLE_ACTOR, limit),
+        }
+        return {"code": 1, "msg": "获取分类统计成功！", "data": data}
+    except Exception as e:
+        return {"code": 0, "msg": f"获取失败：{str(e)}", "data": {}}
+
+
+def _browse(db, mid_subquery, page, page_size):
+    """分页返回子查询中的电影（按发行日期倒序），附带这批电影的类别分面计数"""
+    total = db.session.query(func.count()).select_from(mid_subquery.subquery()).scalar()
+    movie_ids = [movie_id for movie_id, in db.session.query(Movie.id).filter(
+        Movie.id.in_(mid_subquery)
+    ).order_by(Movie.release_date.desc(), Movie.id.desc()).offset((page - 1) * page_size).limit(page_size)]
+    return {
+        "movie_list": movie_service.get_movie_details(db, movie_ids),
+        "total": total,
+        "facets": {"genres": _genre_counts(db, mid_subquery)},
+    }
+
+
+def browse_by_genre(db, name, page=1, page_size=10):
+    """
+    按类别浏览电影
+    :param name: 类别名称
+    :return: 电影列表、总数，以及这些电影的类别分面计数（用于继续筛选）
+    """
+    try:
+        genre = Genre.query.filter_by(name=name).first()
+        if not genre:
+            return {"code": 0, "msg": "未找到该类别！", "data": {"movie_list": [], "total": 0, "facets": {}}}
+        mids = db.session.query(MovieGenre.mid).filter(MovieGenre.gid == genre.id)
+        return {"code": 1, "msg": "获取类别电影成功！", "data": _browse(db, mids, page, page_size)}
+    except Exception as e:
+        return {"code": 0, "msg": f"获取失败：{str(e)}", "data": {"movie_list": [], "total": 0, "facets": {}}}
+
+
+def browse_by_person(db, name, role, page=1, page_size=10):
+    """
+    按演员/导演浏览电影
+    :param role: actor=演员，director=导演
+    """
+    try:
+        person = Person.query.filter_by(name=name).first()
+        if not person:
+            return {"code": 0, "msg": "未找到该影人！", "data": {"movie_list": [], "total": 0, "facets": {}}}
+        mids = db.session.query(MoviePerson.mid).filter(MoviePerson.pid == person.id, MoviePerson.role == role)
+        return {"code": 1, "msg": "获取影人作品成功！", "data": _browse(db, mids, page, page_size)}
+    except Exception as e:
+        return {"code": 0, "msg": f"获取失败：{str(e)}", "data": {"movie_list": [], "total": 0, "facets": {}}}
@@ -0,0 +1,168 @@
+# 浏览记录的异步批量写入（write-behind）：请求只做校验并放入内存队列，后台线程攒批后一次性插入
+# - 攒够HISTORY_BATCH_SIZE条或距本批第一条超过HISTORY_FLUSH_INTERVAL秒就写一批，一批一个事务
+# - 队列有上限：满了以后按HISTORY_BUFFER_POLICY处理（block=最多等待一小会儿，drop=直接丢弃），避免突发流量占满内存
+# - 进程退出时（atexit）把队列中剩余的记录全部写完
+# 浏览时间在入队时记录，写入延迟不影响记录的时间
+import atexit
+import datetime
+import queue
+import threading
+import time
+from sqlalchemy import insert
+from models import db
+from models.history import UserHistory
+
+FLUSH_RETRIES = 3  # 写库失败时的重试次数（之后丢弃这一批并计数）
+
+
+class HistoryBuffer:
+    """浏览记录缓冲队列 + 后台写库线程"""
+
+    def __init__(self, app, max_size=10000, batch_size=500, flush_interval=1.0, policy="block", enqueue_timeout=0.5):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_size)
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0, "dropped": 0, "flushed": 0, "failed": 0, "batches": 0,
+            "last_batch_size": 0, "last_flush_ms": 0.0, "max_flush_ms": 0.0, "total_flush_ms": 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name="history-flusher", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, uid, mid):
+        """
+        放入队列
+        :return: True=已接收；False=队列已满被拒绝（按背压策略）
+        """
+        row = {"uid": uid, "mid": mid, "time": datetime.datetime.now()}
+        try:
+            if self.policy == "block":
+                self._queue.put(row, timeout=self.enqueue_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("enqueued")
+        return True
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    def _next_batch(self):
+        """取一批：等到第一条后，继续收集直到攒满一批或超过刷新间隔"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 and not self._stopping.is_set()
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        """一批记录一条多行INSERT、一个事务写入；失败时重试，仍失败则丢弃并计数"""
+        start = time.perf_counter()
+        for attempt in range(1, FLUSH_RETRIES + 1):
+            with self.app.app_context():
+                try:
+                    db.session.execute(insert(UserHistory), batch)
+                    db.session.commit()
+                    break
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"浏览记录批量写入失败（第{attempt}次）：{str(e)}")
+            if attempt == FLUSH_RETRIES:
+                self._count("failed", len(batch))
+                return
+            time.sleep(0.1 * attempt)
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self._stats["flushed"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["last_batch_size"] = len(batch)
+            self._stats["last_flush_ms"] = elapsed
+            self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"], elapsed)
+            self._stats["total_flush_ms"] += elapsed
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        """立即把队列中已有的记录全部写入（在调用线程中执行）"""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._write(batch)
+
+    def stop(self, timeout=10):
+        """停止后台线程：先把队列写完再退出"""
+        self._stopping.set()
+        self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        batches = stats.pop("batches")
+        total_ms = stats.pop("total_flush_ms")
+        stats.update({
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "batches": batches,
+            "avg_batch_size": round(stats["flushed"] / batches, 1) if batches else 0.0,
+            "avg_flush_ms": round(total_ms / batches, 2) if batches else 0.0,
+            "last_flush_ms": round(stats["last_flush_ms"], 2),
+            "max_flush_ms": round(stats["max_flush_ms"], 2),
+            "policy": self.policy,
+        })
+        return stats
+
+
+# ---------------------- 全局缓冲 ----------------------
+_buffer = None
+
+
+def init_app(app):
+    """按配置启动缓冲写入（HISTORY_BUFFER_ENABLED=False时浏览记录仍逐条同步写入）"""
+    global _buffer
+    if not app.config["HISTORY_BUFFER_ENABLED"]:
+        return
+    _buffer = HistoryBuffer(
+        app,
+        max_size=app.config["HISTORY_BUFFER_MAX_SIZE"],
+        batch_size=app.config["HISTORY_BATCH_SIZE"],
+        flush_interval=app.config["HISTORY_FLUSH_INTERVAL"],
+        policy=app.config["HISTORY_BUFFER_POLICY"],
+        enqueue_timeout=app.config["HISTORY_ENQUEUE_TIMEOUT"],
+    )
+    atexit.register(_buffer.stop)
+
+
+def get_buffer():
+    """当前缓冲（未启用时返回None）"""
+    return _buffer
+
+
+def get_stats():
+    return _buffer.stats() if _buffer is not None else {"enabled": False}
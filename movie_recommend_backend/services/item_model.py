@@ -0,0 +1,195 @@
+# 基于物品（电影）的协同过滤：离线构建每部电影的Top-K相似电影表（item-item）
+# 相似度表以稀疏矩阵的数组形式压缩保存到磁盘；给用户打分时只取出他评过分的电影对应的几行做稀疏累加，
+# 计算量只与该用户的评分条数、K有关，与用户总数无关，评分很少的用户也能得到稳定的结果
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+import scipy.sparse as sp
+from models import db
+from models.rating import UserRating
+from utils.file_watch import FileWatcher
+from .rating_matrix import IndexMap, build_rating_matrix, LIKE_THRESHOLD, SIM_BLOCK_CELLS
+
+ITEM_TOP_K = 50  # 每部电影保留的相似电影数量
+FORMAT_VERSION = 1
+
+
+class ItemNeighbors:
+    """
+    电影相似度表（构建后只读）
+    - movies: 电影ID与行号/列号的映射
+    - neighbors: CSR稀疏矩阵（float32），第i行只保留电影i最相似的K部电影（相似度>0）
+    """
+
+    def __init__(self, movies, neighbors, built_at=None):
+        self.movies = movies
+        self.neighbors = neighbors
+        self.built_at = built_at or time.time()
+
+    @property
+    def n_movies(self):
+        return len(self.movies)
+
+    @classmethod
+    def build(cls, ratings, k=ITEM_TOP_K):
+        """
+        根据评分数据构建相似度表：电影向量为“各用户对它的评分”，按余弦相似度分块计算并逐行截断到Top-K
+        :param ratings: (uid, mid, score) 三元组列表
+        """
+        rating_matrix = build_rating_matrix(ratings)
+        items = rating_matrix.matrix.T.tocsr()  # 行=电影，列=用户
+        norms = np.sqrt(np.asarray(items.multiply(items).sum(axis=1)).ravel())
+        n_items = items.shape[0]
+        k = max(0, min(k, n_items - 1))
+
+        rows, cols, values = [], [], []
+        block = max(1, SIM_BLOCK_CELLS // max(n_items, 1))
+        for start in range(0, n_items, block):
+            row_ids = np.arange(start, min(start + block, n_items))
+            sims = (items[row_ids] @ items.T).toarray()
+            denom = np.outer(norms[row_ids], norms)
+            denom[denom == 0] = 1.0
+            sims = (sims / denom).astype(np.float32)
+            sims[np.arange(len(row_ids)), row_ids] = 0.0  # 排除自己
+            if k == 0:
+                continue
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            top_sims = np.take_along_axis(sims, top, axis=1)
+            keep = top_sims > 0
+            rows.append(np.repeat(row_ids, k)[keep.ravel()])
+            cols.append(top[keep])
+            values.append(top_sims[keep])
+
+        if rows:
+            rows, cols, values = np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+        neighbors = sp.csr_matrix(
+            (np.asarray(values, dtype=np.float32), (np.asarray(rows, dtype=np.int32), np.asarray(cols, dtype=np.int32))),
+            shape=(n_items, n_items),
+        )
+        return cls(rating_matrix.movies, neighbors)
+
+    def recommend(self, rated, limit=10):
+        """
+        为一个用户打分：电影j的得分 = Σ 相似度(i, j) × 评分i，i为该用户喜欢（评分≥3.5）的电影；
+        没有喜欢的电影时用全部评过分的电影。结果排除已评分电影，按得分降序、电影ID升序
+        :param rated: 该用户的 (mid, score) 列表
+        :return: 电影ID列表（评过分的电影都不在表中时为空列表）
+        """
+        liked = [(mid, score) for mid, score in rated if score >= LIKE_THRESHOLD] or list(rated)
+        cols, weights = [], []
+        for mid, score in liked:
+            col = self.movies.get(int(mid))
+            if col is not None:
+                cols.append(col)
+                weights.append(float(score))
+        if not cols:
+            return []
+
+        # 稀疏累加：只涉及这几行的非零元素
+        scores = np.asarray(self.neighbors[cols].T @ np.asarray(weights, dtype=np.float32)).ravel()
+        for mid, _ in rated:
+            col = self.movies.get(int(mid))
+            if col is not None:
+                scores[col] = 0.0
+        # 候选最多为 喜欢的电影数×K 部，直接排序即可
+        candidates = np.nonzero(scores > 0)[0]
+        mids = self.movies.ids[candidates]
+        order = np.lexsort((mids, -scores[candidates]))[:limit]
+        return [int(mid) for mid in mids[order]]
+
+    def save(self, path):
+        """写入磁盘（压缩的npz，先写临时文件再改名）"""
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez_compressed(
+                f,
+                format=FORMAT_VERSION,
+                built_at=self.built_at,
+                movie_ids=self.movies.ids,
+                indptr=self.neighbors.indptr,
+                indices=self.neighbors.indices,
+                data=self.neighbors.data,
+            )
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        """从磁盘加载，文件不存在或格式不符时返回None"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if int(data["format"]) != FORMAT_VERSION:
+                return None
+            n_items = len(data["movie_ids"])
+            neighbors = sp.csr_matrix((data["data"], data["indices"], data["indptr"]), shape=(n_items, n_items))
+            return ItemNeighbors(IndexMap(data["movie_ids"]), neighbors, float(data["built_at"]))
+
+
+# ---------------------- 全局相似度表 ----------------------
+_model = None
+_path = None
+_watcher = None
+
+
+def get_model():
+    """当前相似度表（尚未就绪时返回None）；磁盘上的文件被其他进程重新生成后自动重新加载"""
+    global _model
+    if _watcher is not None and _watcher.changed():
+        try:
+            model = ItemNeighbors.load(_path)
+            if model is not None:
+                _model = model
+        except Exception as e:
+            print(f"重新加载电影相似度表失败：{str(e)}")
+    return _model
+
+
+def rebuild(db, k=ITEM_TOP_K, path=None):
+    """
+    从user_rating表全量构建相似度表，替换当前表并写入磁盘
+    :param path: 保存路径，为空时使用init_app配置的路径
+    """
+    global _model
+    ratings = db.session.query(UserRating.uid, UserRating.mid, UserRating.score).all()
+    model = ItemNeighbors.build(ratings, k=k)
+    _model = model
+    path = path or _path
+    if path:
+        model.save(path)
+        if _watcher is not None and path == _path:
+            _watcher.mark()
+    return model
+
+
+def init_app(app, build_missing=True):
+    """
+    启动时加载磁盘上的相似度表；文件不存在（或是空库时生成的空表）时在后台线程构建一次
+    （之后由 manage.py build-item-neighbors 离线更新，各进程在get_model时发现文件变化并重新加载）
+    :param build_missing: False时只加载，不启动后台构建（离线命令使用）
+    """
+    global _model, _path, _watcher
+    _path = app.config["ITEM_NEIGHBORS_PATH"]
+    _watcher = FileWatcher(_path)
+    try:
+        _watcher.mark()
+        _model = ItemNeighbors.load(_path)
+        if _model is not None and _model.n_movies > 0:
+            return
+    except Exception as e:
+        print(f"加载电影相似度表失败，将重新构建：{str(e)}")
+    if not build_missing:
+        return
+
+    def run():
+        with app.app_context():
+            try:
+                model = rebuild(db)
+                print(f"电影相似度表构建完成：{model.n_movies}部电影")
+            except Exception as e:
+                print(f"电影相似度表构建失败：{str(e)}")
+
+    threading.Thread(target=run, name="item-neighbors-builder", daemon=True).start()
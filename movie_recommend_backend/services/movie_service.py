@@ -1,65 +1,91 @@
-from models.movie import Movie
+from models.movie import Movie, MOVIE_PROJECTIONS, movie_row_to_dict
 from models.rating import UserRating
 from models import db
-from sqlalchemy import func
-import base64  # 新增：导入Base64编码模块
+from sqlalchemy import func, and_, or_
+from utils.poster import content_hash
+from utils import cache
+from . import poster_cache, search_index, browse_service
+import base64
+import datetime
 
-def get_movie_list(db, page=1, page_size=10):
+MOVIE_COUNT_TTL = 60  # 电影总数缓存时间（秒），新增电影时立即失效
+
+@cache.cached("movie_count", key=lambda: "all", ttl=MOVIE_COUNT_TTL)
+def get_movie_count(db):
+    """电影总数（经接口缓存，避免每次翻页都执行一次全表count）"""
+    return db.session.query(func.count(Movie.id)).scalar()
+
+def invalidate_movie_count():
+    cache.invalidate("movie_count")
+
+def encode_list_cursor(movie):
+    """列表游标：最后一条记录的 (发行日期, ID)，编码为URL安全的字符串"""
+    release_date = movie.release_date.strftime("%Y-%m-%d") if movie.release_date else ""
+    return base64.urlsafe_b64encode(f"{release_date}|{movie.id}".encode("utf-8")).decode("ascii")
+
+def decode_list_cursor(cursor):
+    """解析列表游标，返回 (发行日期或None, ID)；格式不对时抛出ValueError"""
+    try:
+        release_date, movie_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        release_date = datetime.datetime.strptime(release_date, "%Y-%m-%d").date() if release_date else None
+        return release_date, int(movie_id)
+    except Exception:
+        raise ValueError("无效的分页游标")
+
+@cache.cached("movie_list", key=lambda page=1, page_size=10, cursor=None: f"{page}:{page_size}:{cursor}")
+def get_movie_list(db, page=1, page_size=10, cursor=None):
     """
     获取电影列表（支持分页）
+    两种分页方式：
+    - 页码分页（默认）：按page计算偏移量，兼容原有前端
+    - 游标分页：传入cursor（首页传空字符串），按上一页最后一条的 (发行日期, ID) 定位，
+      翻到多深都只扫描一页数据；返回的next_cursor用于请求下一页，为None表示没有更多
     :param db: 数据库对象
     :param page: 当前页码（默认1）
     :param page_size: 每页显示数量（默认10）
+    :param cursor: 游标（为None时使用页码分页）
     :return: 电影列表和总数量
     """
     try:
-        # 计算分页偏移量
-        offset = (page - 1) * page_size
-        
-        # 查询电影列表（按发行日期倒序，最新的在前）
-        movies = Movie.query.order_by(Movie.release_date.desc()).offset(offset).limit(page_size).all()
-        
-        # 查询电影总数量（用于分页）
-        total = Movie.query.count()
-        
-        # 格式化电影数据（手动处理，确保海报Base64转换）
-        movie_list = []
-        for movie in movies:
-            # 计算电影的平均评分
-            avg_score = db.session.query(func.avg(UserRating.score)).filter_by(mid=movie.id).scalar()
-            avg_score = round(avg_score, 1) if avg_score else 0.0  # 无评分时显示0.0
-            
-            # 处理海报：二进制→Base64字符串（兼容空值）
-            picture_base64 = ""
-            if movie.picture:
-                if isinstance(movie.picture, bytes):
-                    # 二进制海报转Base64
-                    picture_base64 = base64.b64encode(movie.picture).decode("utf-8")
-                elif isinstance(movie.picture, str):
-                    # 已存储Base64字符串，直接使用
-                    picture_base64 = movie.picture
-            
-            # 构造统一的返回格式
-            movie_dict = {
-                "id": movie.id,
-                "name": movie.name,
-                "director": movie.director,
-                "actors": movie.actors,
-                "language": movie.language,
-                "company": movie.company,
-                "style": movie.style,
-                "release_date": movie.release_date.strftime("%Y-%m-%d") if movie.release_date else "",
-                "duration": movie.duration,
-                "description": movie.description[:80] + "..." if movie.description and len(movie.description) > 80 else movie.description or "",
-                "picture": picture_base64,  # 确保返回Base64格式
-                "avg_score": avg_score
-            }
-            movie_list.append(movie_dict)
+        # 查询电影列表（按发行日期倒序，最新的在前；发行日期为空的排在最后，同一天按ID倒序）
+        # 只查卡片需要的列，简介在SQL中截取
+        query = db.session.query(*MOVIE_PROJECTIONS["card"]).order_by(Movie.release_date.desc(), Movie.id.desc())
+        next_cursor = None
+        if cursor is None:
+            # 计算分页偏移量
+            offset = (page - 1) * page_size
+            movies = query.offset(offset).limit(page_size).all()
+        else:
+            if cursor:
+                last_date, last_id = decode_list_cursor(cursor)
+                if last_date is None:
+                    query = query.filter(Movie.release_date.is_(None), Movie.id < last_id)
+                else:
+                    query = query.filter(or_(
+                        Movie.release_date < last_date,
+                        and_(Movie.release_date == last_date, Movie.id < last_id),
+                        Movie.release_date.is_(None)
+                    ))
+            # 多取一条判断是否还有下一页
+            movies = query.limit(page_size + 1).all()
+            if len(movies) > page_size:
+                movies = movies[:page_size]
+                next_cursor = encode_list_cursor(movies[-1])
+
+        # 查询电影总数量（用于分页，取缓存值）
+        total = get_movie_count(db)
+
+        # 格式化电影数据（海报以URL返回，列表不内嵌Base64）
+        movie_list = [movie_row_to_dict(row) for row in movies]
         
-        return {"code": 1, "msg": "获取电影列表成功！", "data": {"movie_list": movie_list, "total": total}}
+        data = {"movie_list": movie_list, "total": total}
+        if cursor is not None:
+            data["next_cursor"] = next_cursor
+        return {"code": 1, "msg": "获取电影列表成功！", "data": data}
     except Exception as e:
         return {"code": 0, "msg": f"获取失败：{str(e)}", "data": {"movie_list": [], "total": 0}}
 
+@cache.cached("movie_detail", key=lambda movie_id: int(movie_id))
 def get_movie_detail(db, movie_id):
     """
     获取电影详情（根据电影ID）
@@ -68,120 +94,122 @@ def get_movie_detail(db, movie_id):
     :return: 电影详情
     """
     try:
-        # 根据ID查询电影
-        movie = Movie.query.get(movie_id)
-        if not movie:
+        # 根据ID查询电影（平均评分和评分数量直接取电影表上的评分统计字段，不读取海报二进制）
+        row = db.session.query(*MOVIE_PROJECTIONS["detail"]).filter(Movie.id == movie_id).first()
+        if not row:
             return {"code": 0, "msg": "未找到该电影！", "data": {}}
-        
-        # 计算平均评分和评分数量
-        avg_score = db.session.query(func.avg(UserRating.score)).filter_by(mid=movie_id).scalar()
-        avg_score = round(avg_score, 1) if avg_score else 0.0
-        rating_count = db.session.query(func.count(UserRating.id)).filter_by(mid=movie_id).scalar() or 0
-        
-        # 处理海报：二进制→Base64字符串
-        picture_base64 = ""
-        if movie.picture:
-            if isinstance(movie.picture, bytes):
-                picture_base64 = base64.b64encode(movie.picture).decode("utf-8")
-            elif isinstance(movie.picture, str):
-                picture_base64 = movie.picture
-        
-        # 构造详情数据
-        movie_detail = {
-            "id": movie.id,
-            "name": movie.name,
-            "director": movie.director,
-            "actors": movie.actors.split(" ") if movie.actors else [],
-            "language": movie.language,
-            "company": movie.company,
-            "style": movie.style.split(",") if movie.style else [],
-            "release_date": movie.release_date.strftime("%Y-%m-%d") if movie.release_date else "",
-            "duration": movie.duration,
-            "description": movie.description or "",
-            "picture": picture_base64,  # 确保返回Base64格式
-            "avg_score": avg_score,
-            "rating_count": rating_count
-        }
+
+        # 构造详情数据（演员、类别拆成列表）
+        movie_detail = movie_row_to_dict(row, "detail", split_lists=True)
         
         return {"code": 1, "msg": "获取电影详情成功！", "data": movie_detail}
     except Exception as e:
         return {"code": 0, "msg": f"获取失败：{str(e)}", "data": {}}
 
+@cache.cached("movie_hot", key=lambda limit=10: limit, cache_if=bool)
 def get_hot_movies(db, limit=10):
-    """获取热门电影（补充海报字段）"""
+    """获取热门电影（海报以URL返回）"""
     try:
-        # 关联查询：按电影的评分次数排序
-        hot_movie_ids = db.session.query(
-            UserRating.mid, func.count(UserRating.id).label("rating_count")
-        ).group_by(UserRating.mid).order_by(func.desc("rating_count")).limit(limit).all()
-        
-        # 提取电影ID列表
-        movie_ids = [mid for mid, _ in hot_movie_ids]
-        
-        # 查询电影详情（带海报）
-        hot_movies = []
-        for movie_id in movie_ids:
-            movie = Movie.query.get(movie_id)
-            if movie:
-                avg_score = db.session.query(func.avg(UserRating.score)).filter_by(mid=movie_id).scalar()
-                avg_score = round(avg_score, 1) if avg_score else 0.0
-                
-                # 处理海报
-                picture_base64 = ""
-                if movie.picture:
-                    if isinstance(movie.picture, bytes):
-                        picture_base64 = base64.b64encode(movie.picture).decode("utf-8")
-                    elif isinstance(movie.picture, str):
-                        picture_base64 = movie.picture
-                
-                hot_movies.append({
-                    "id": movie.id,
-                    "name": movie.name,
-                    "director": movie.director,
-                    "style": movie.style,
-                    "picture": picture_base64,  # 新增：返回海报
-                    "avg_score": avg_score,
-                    "description": movie.description[:80] + "..." if len(movie.description) > 80 else movie.description
-                })
-        
-        return hot_movies
+        # 按电影的评分次数排序（走rating_count索引），排名和电影详情（带海报）在同一条SQL中取出
+        rows = db.session.query(*MOVIE_PROJECTIONS["card"]).filter(Movie.rating_count > 0).order_by(
+            Movie.rating_count.desc(), Movie.id
+        ).limit(limit).all()
+        return [movie_row_to_dict(row) for row in rows]
     except Exception as e:
         print(f"获取热门电影失败：{str(e)}")
         return []
 
 def get_movie_details(db, movie_ids):
-    """获取电影详情列表（补充海报字段）"""
+    """获取电影详情列表（海报以URL返回，按传入的movie_ids顺序返回）"""
     try:
-        movies = Movie.query.filter(Movie.id.in_(movie_ids)).all()
-        movie_details = []
-        for movie in movies:
-            avg_score = db.session.query(func.avg(UserRating.score)).filter_by(mid=movie.id).scalar()
-            avg_score = round(avg_score, 1) if avg_score else 0.0
-            
-            # 处理海报
-            picture_base64 = ""
-            if movie.picture:
-                if isinstance(movie.picture, bytes):
-                    picture_base64 = base64.b64encode(movie.picture).decode("utf-8")
-                elif isinstance(movie.picture, str):
-                    picture_base64 = movie.picture
-            
-            movie_details.append({
-                "id": movie.id,
-                "name": movie.name,
-                "director": movie.director,
-                "actors": movie.actors.split(" ") if movie.actors else [],
-                "style": movie.style.split(",") if movie.style else [],
-                "picture": picture_base64,  # 新增：返回海报
-                "avg_score": avg_score,
-                "duration": movie.duration,
-                "description": movie.description
-            })
-        return movie_details
+        if not movie_ids:
+            return []
+        rows = db.session.query(*MOVIE_PROJECTIONS["card"]).filter(Movie.id.in_(movie_ids)).all()
+        position = {movie_id: i for i, movie_id in enumerate(movie_ids)}
+        rows.sort(key=lambda row: position.get(row.id, len(position)))
+        return [movie_row_to_dict(row, split_lists=True) for row in rows]
     except Exception as e:
         print(f"获取电影详情列表失败：{str(e)}")
         return []
 
+def get_admin_movie_list(db, page=1, page_size=10):
+    """
+    管理员电影列表（不缓存；完整简介用于编辑表单回显，公共列表中的简介是截断的）
+    :return: 电影列表和总数量
+    """
+    try:
+        page = max(1, int(page))
+        page_size = max(1, min(int(page_size), 100))
+        rows = db.session.query(*MOVIE_PROJECTIONS["admin"]).order_by(
+            Movie.release_date.desc(), Movie.id.desc()
+        ).offset((page - 1) * page_size).limit(page_size).all()
+        data = {"movie_list": [movie_row_to_dict(row, "admin") for row in rows], "total": get_movie_count(db)}
+        return {"code": 1, "msg": "获取电影列表成功！", "data": data}
+    except Exception as e:
+        return {"code": 0, "msg": f"获取失败：{str(e)}", "data": {"movie_list": [], "total": 0}}
+
+def search_movies(db, keyword, style=None, language=None, year=None, page=1, page_size=10):
+    """
+    电影全文搜索（基于内存倒排索引，按相关度排序）
+    :param db: 数据库对象
+    :param keyword: 关键词（匹配电影名、导演、演员、类别、简介）
+    :param style: 按类别过滤
+    :param language: 按语言过滤
+    :param year: 按发行年份过滤
+    :param page: 当前页码
+    :param page_size: 每页显示数量
+    :return: 当前页的电影列表和匹配总数
+    """
+    try:
+        index = search_index.get_index()
+        if index is None:
+            return {"code": 0, "msg": "搜索索引正在构建，请稍后再试", "data": {"movie_list": [], "total": 0}}
+        if not (keyword or "").strip() and not any([style, language, year]):
+            return {"code": 0, "msg": "请输入搜索关键词或筛选条件", "data": {"movie_list": [], "total": 0}}
+        
+        movie_ids = index.search(keyword, style=style, language=language, year=year)
+        offset = (page - 1) * page_size
+        movie_list = get_movie_details(db, movie_ids[offset:offset + page_size])
+        return {"code": 1, "msg": "搜索成功！", "data": {"movie_list": movie_list, "total": len(movie_ids)}}
+    except Exception as e:
+        return {"code": 0, "msg": f"搜索失败：{str(e)}", "data": {"movie_list": [], "total": 0}}
+
+def get_poster_meta(db, movie_id):
+    """
+    获取海报的版本信息（不读取海报二进制，用于协商缓存）
+    :param db: 数据库对象
+    :param movie_id: 电影ID
+    :return: (海报摘要, 最后修改时间)；电影不存在或无海报时返回None
+    """
+    row = db.session.query(Movie.picture_hash, Movie.update_time).filter(Movie.id == movie_id).first()
+    if not row or not row.picture_hash:
+        return None
+    return row.picture_hash, row.update_time
+
+def get_poster_data(db, movie_id):
+    """读取海报二进制（只查picture一列）"""
+    return db.session.query(Movie.picture).filter(Movie.id == movie_id).scalar()
+
+def backfill_picture_hashes(db, batch_size=100):
+    """
+    为已有海报补齐picture_hash（迁移后执行一次；之后由新增/编辑电影维护）
+    按批读取，每批只加载这一批的海报二进制
+    :return: 补齐的电影数量
+    """
+    updated = 0
+    while True:
+        rows = db.session.query(Movie.id, Movie.picture).filter(
+            Movie.picture_hash.is_(None), func.length(Movie.picture) > 0
+        ).limit(batch_size).all()
+        if not rows:
+            return updated
+        for movie_id, picture in rows:
+            db.session.query(Movie).filter(Movie.id == movie_id).update(
+                {Movie.picture_hash: content_hash(picture)}, synchronize_session=False
+            )
+        db.session.commit()
+        updated += len(rows)
+
 def add_movie(db, movie_data):
     """
     新增电影（优化空值处理+海报二进制存储）
@@ -208,12 +236,22 @@ def add_movie(db, movie_data):
             release_date=movie_data.get('release_date'),  # 日期格式已由前端处理为YYYY-MM-DD
             duration=movie_data.get('duration', "").strip(),
             description=movie_data.get('description', "").strip(),
-            picture=movie_data.get('picture', b"")  # 接收二进制海报数据
+            picture=movie_data.get('picture', b""),  # 接收二进制海报数据
+            picture_hash=content_hash(movie_data['picture']) if movie_data.get('picture') else None
         )
         
         # 写入数据库
         db.session.add(new_movie)
+        db.session.flush()  # 先拿到电影ID，再同步类别/影人关联（同一事务）
+        browse_service.sync_movie_facets(db, new_movie)
         db.session.commit()
+        invalidate_movie_count()
+        browse_service.invalidate_facets()
+        cache.invalidate("movie_list")
+        search_index.index_movie(db, new_movie)
+        
+        # 后台生成海报缩略图
+        poster_cache.submit(new_movie.picture_hash, movie_data.get('picture'))
         
         return {"code": 1, "msg": "电影添加成功！", "data": {"movie_id": new_movie.id}}
     except Exception as e:
@@ -256,11 +294,46 @@ def update_movie(db, movie_id, movie_data):
         new_picture = movie_data.get('picture')
         if new_picture is not None:  # 允许空二进制（清空海报）
             movie.picture = new_picture
+            movie.picture_hash = content_hash(new_picture) if new_picture else None
         
-        # 提交更新
+        # 同步类别/影人关联，与电影字段一起提交
+        browse_service.sync_movie_facets(db, movie)
         db.session.commit()
+        browse_service.invalidate_facets()
+        cache.invalidate("movie_list")
+        cache.invalidate("movie_hot")
+        cache.invalidate("movie_detail", movie.id)
+        search_index.index_movie(db, movie)
+        
+        # 换了新海报：后台生成缩略图
+        if new_picture:
+            poster_cache.submit(movie.picture_hash, new_picture)
         
         return {"code": 1, "msg": "电影更新成功！", "data": {}}
     except Exception as e:
         db.session.rollback()  # 异常回滚
-        return {"code": 0, "msg": f"更新电影失败：{str(e)}", "data": {}}
\ No newline at end of file
+        return {"code": 0, "msg": f"更新电影失败：{str(e)}", "data": {}}
+
+def rebuild_rating_stats(db):
+    """
+    根据user_rating表全量重算所有电影的评分统计字段（rating_sum / rating_count）
+    一条UPDATE完成，用于初始化、数据修复或批量导入评分之后
+    :param db: 数据库对象
+    :return: 更新的电影数量
+    """
+    try:
+        rating_sum = db.session.query(func.coalesce(func.sum(UserRating.score), 0)).filter(
+            UserRating.mid == Movie.id
+        ).scalar_subquery()
+        rating_count = db.session.query(func.count(UserRating.id)).filter(
+            UserRating.mid == Movie.id
+        ).scalar_subquery()
+        updated = db.session.query(Movie).update(
+            {Movie.rating_sum: rating_sum, Movie.rating_count: rating_count, Movie.update_time: Movie.update_time},
+            synchronize_session=False
+        )
+        db.session.commit()
+        return updated
+    except Exception:
+        db.session.rollback()
+        raise
@@ -0,0 +1,135 @@
+# 海报缩略图：上传海报后在后台线程池中生成固定尺寸的缩略图，
+# 按海报内容摘要存放在磁盘缓存目录（内容寻址：相同海报只存一份，海报更新后自然换成新文件）
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from models.movie import Movie
+
+try:
+    from PIL import Image
+except ImportError:  # 未安装Pillow时不生成缩略图，海报接口直接返回原图
+    Image = None
+
+# 缩略图尺寸（最大宽, 最大高），按原图比例缩放
+POSTER_SIZES = {
+    "card": (300, 450),  # 列表卡片
+    "detail": (600, 900),  # 详情页
+}
+THUMBNAIL_QUALITY = 85
+FALLBACK_MAX_AGE = 60  # 缩略图还没生成、先返回原图时的浏览器缓存秒数
+
+_cache_dir = None
+_executor = None
+_inflight = set()  # 已提交、尚未完成的海报摘要
+_inflight_lock = threading.Lock()
+
+
+def init_app(app):
+    """根据配置初始化缓存目录和缩略图线程池"""
+    global _cache_dir, _executor
+    _cache_dir = app.config["POSTER_CACHE_DIR"]
+    os.makedirs(_cache_dir, exist_ok=True)
+    _executor = ThreadPoolExecutor(max_workers=app.config["POSTER_WORKERS"], thread_name_prefix="poster-thumbnail")
+
+
+def enabled():
+    return Image is not None and _cache_dir is not None
+
+
+def variant_path(picture_hash, size):
+    """缩略图文件路径：<缓存目录>/<摘要前2位>/<摘要>_<尺寸>.jpg"""
+    return os.path.join(_cache_dir, picture_hash[:2], f"{picture_hash}_{size}.jpg")
+
+
+def find_variant(picture_hash, size):
+    """已生成的缩略图路径，不存在时返回None"""
+    if not enabled() or size not in POSTER_SIZES:
+        return None
+    path = variant_path(picture_hash, size)
+    return path if os.path.exists(path) else None
+
+
+def make_thumbnail(data, size):
+    """按比例缩放海报，输出JPEG二进制"""
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGB")
+        image.thumbnail(POSTER_SIZES[size], Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+        return output.getvalue()
+
+
+def generate_variants(picture_hash, data):
+    """
+    生成该海报缺失的所有尺寸缩略图（先写临时文件再改名，读者不会读到写了一半的文件）
+    :return: 新生成的尺寸列表
+    """
+    generated = []
+    for size in POSTER_SIZES:
+        path = variant_path(picture_hash, size)
+        if os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        thumbnail = make_thumbnail(data, size)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(thumbnail)
+        os.replace(tmp_path, path)
+        generated.append(size)
+    return generated
+
+
+def _generate_quietly(picture_hash, data):
+    try:
+        return generate_variants(picture_hash, data)
+    except Exception as e:
+        print(f"生成海报缩略图失败（{picture_hash}）：{str(e)}")
+        return []
+    finally:
+        with _inflight_lock:
+            _inflight.discard(picture_hash)
+
+
+def submit(picture_hash, data):
+    """
+    把缩略图生成任务交给后台线程池（不阻塞当前请求）
+    :return: Future；该海报已在生成中（或无法生成）时返回None
+    """
+    if not (enabled() and picture_hash and data):
+        return None
+    with _inflight_lock:
+        if picture_hash in _inflight:
+            return None
+        _inflight.add(picture_hash)
+    try:
+        return _executor.submit(_generate_quietly, picture_hash, data)
+    except RuntimeError:  # 线程池已关闭（进程退出中）
+        with _inflight_lock:
+            _inflight.discard(picture_hash)
+        return None
+
+
+def backfill(db, batch_size=50):
+    """
+    为已有海报批量生成缩略图：按电影ID分批读取，每批只加载缺少缩略图的海报
+    :return: 生成了缩略图的海报数量
+    """
+    if not enabled():
+        raise RuntimeError("未安装Pillow或未初始化缓存目录，无法生成缩略图")
+    processed, last_id = 0, 0
+    while True:
+        rows = db.session.query(Movie.id, Movie.picture_hash).filter(
+            Movie.id > last_id, Movie.picture_hash.isnot(None)
+        ).order_by(Movie.id).limit(batch_size).all()
+        if not rows:
+            return processed
+        last_id = rows[-1].id
+        missing = [row.id for row in rows if any(
+            find_variant(row.picture_hash, size) is None for size in POSTER_SIZES
+        )]
+        if missing:
+            pictures = db.session.query(Movie.picture_hash, Movie.picture).filter(Movie.id.in_(missing)).all()
+            futures = [submit(picture_hash, picture) for picture_hash, picture in pictures]
+            processed += sum(1 for future in futures if future and future.result())
@@ -0,0 +1,175 @@
+# 稀疏用户-电影评分矩阵：内存只与评分条数成正比，与“用户数×电影数”无关
+# 协同过滤的实时计算、常驻内存模型共用这里的矩阵构建和相似度计算
+import numpy as np
+import scipy.sparse as sp
+
+LIKE_THRESHOLD = 3.5  # 邻居评分≥3.5认为是喜欢
+SIM_BLOCK_CELLS = 4_000_000  # 分块计算相似度时每块最多的矩阵单元数（控制内存峰值）
+
+
+class IndexMap:
+    """
+    ID（用户ID/电影ID）与矩阵行号/列号的映射
+    用两个int32数组代替dict：ids[位置]=ID，再按ID排序做二分查找，每个ID只占8字节
+    """
+
+    def __init__(self, ids):
+        self.ids = np.asarray(ids, dtype=np.int32)  # 位置 → ID
+        self._order = np.argsort(self.ids, kind="stable").astype(np.int32)  # 按ID排序后的位置
+        self._sorted_ids = self.ids[self._order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get(self, id_, default=None):
+        """ID → 位置，不存在时返回default"""
+        i = np.searchsorted(self._sorted_ids, id_)
+        if i < len(self._sorted_ids) and self._sorted_ids[i] == id_:
+            return int(self._order[i])
+        return default
+
+    def get_many(self, ids):
+        """批量 ID → 位置，不存在的为-1"""
+        ids = np.asarray(ids, dtype=np.int64)
+        i = np.minimum(np.searchsorted(self._sorted_ids, ids), max(len(self._sorted_ids) - 1, 0))
+        found = (self._sorted_ids[i] == ids) if len(self._sorted_ids) else np.zeros(len(ids), dtype=bool)
+        return np.where(found, self._order[i] if len(self._order) else -1, -1)
+
+    def append(self, id_):
+        """返回追加一个新ID后的新映射（新ID的位置为原长度）"""
+        return IndexMap(np.append(self.ids, np.int32(id_)))
+
+
+class RatingMatrix:
+    """
+    评分矩阵（构建后只读）
+    - matrix: CSR稀疏矩阵（float32），行=用户，列=电影，值=评分
+    - users / movies: 用户ID、电影ID与行号、列号的映射
+    """
+
+    def __init__(self, matrix, users, movies):
+        self.matrix = matrix
+        self.users = users
+        self.movies = movies
+        self.norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+
+    @property
+    def n_users(self):
+        return self.matrix.shape[0]
+
+    def row_items(self, row):
+        """某个用户评过分的 (列号数组, 评分数组)"""
+        start, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+        return self.matrix.indices[start:end], self.matrix.data[start:end]
+
+    def has_rating(self, uid, mid):
+        row, col = self.users.get(int(uid)), self.movies.get(int(mid))
+        return row is not None and col is not None and self.matrix[row, col] != 0
+
+    def similarity_rows(self, row_ids):
+        """
+        计算指定用户与所有用户的余弦相似度（只算这几行，不做全量两两计算）
+        :return: 稠密的 len(row_ids)×用户数 数组
+        """
+        row_ids = np.asarray(row_ids)
+        dots = (self.matrix[row_ids] @ self.matrix.T).toarray()
+        denom = np.outer(self.norms[row_ids], self.norms)
+        denom[denom == 0] = 1.0
+        return (dots / denom).astype(np.float32)
+
+    def iter_similarity_blocks(self):
+        """按块遍历所有用户的相似度行，每块最多 SIM_BLOCK_CELLS 个单元：yield (行号数组, 相似度块)"""
+        block = max(1, SIM_BLOCK_CELLS // max(self.n_users, 1))
+        for start in range(0, self.n_users, block):
+            row_ids = np.arange(start, min(start + block, self.n_users))
+            yield row_ids, self.similarity_rows(row_ids)
+
+    def with_rating(self, uid, mid, score):
+        """
+        返回写入一条评分后的新矩阵（当前矩阵保持不变）
+        :return: (新矩阵, 用户行号, 电影列号)
+        """
+        rating_matrix, rows, cols = self.with_ratings([(uid, mid, score)])
+        return rating_matrix, int(rows[0]), int(cols[0])
+
+    def with_ratings(self, ratings):
+        """
+        返回写入多条评分后的新矩阵（当前矩阵保持不变，整批只复制一次矩阵）
+        同一用户对同一电影出现多次时以最后一条为准
+        :param ratings: (uid, mid, score) 三元组列表
+        :return: (新矩阵, 每条评分的用户行号数组, 电影列号数组)
+        """
+        uid_col, mid_col, score_col = (np.asarray(col) for col in zip(*ratings))
+        users, movies = self.users, self.movies
+        new_uids = np.unique(uid_col[users.get_many(uid_col) < 0])
+        new_mids = np.unique(mid_col[movies.get_many(mid_col) < 0])
+        if len(new_uids):
+            users = IndexMap(np.concatenate((users.ids, new_uids.astype(np.int32))))
+        if len(new_mids):
+            movies = IndexMap(np.concatenate((movies.ids, new_mids.astype(np.int32))))
+        rows, cols = users.get_many(uid_col), movies.get_many(mid_col)
+
+        shape = (len(users), len(movies))
+        matrix = self.matrix.copy()
+        matrix.resize(shape)
+        # 去重（保留最后一条），再按“新值-旧值”叠加，效果等同于逐条覆盖
+        cells = rows.astype(np.int64) * shape[1] + cols
+        _, last = np.unique(cells[::-1], return_index=True)
+        keep = len(cells) - 1 - last
+        delta = score_col[keep].astype(np.float32) - np.asarray(matrix[rows[keep], cols[keep]]).ravel()
+        matrix = (matrix + sp.csr_matrix((delta, (rows[keep], cols[keep])), shape=shape, dtype=np.float32)).tocsr()
+        return RatingMatrix(matrix, users, movies), rows, cols
+
+
+def build_rating_matrix(ratings):
+    """
+    由评分数据构建稀疏评分矩阵
+    :param ratings: (uid, mid, score) 三元组列表
+    :return: RatingMatrix
+    """
+    if len(ratings):
+        uid_col, mid_col, score_col = (np.asarray(col) for col in zip(*ratings))
+    else:
+        uid_col = mid_col = np.array([], dtype=np.int32)
+        score_col = np.array([], dtype=np.float32)
+    uids, rows = np.unique(uid_col.astype(np.int32), return_inverse=True)
+    mids, cols = np.unique(mid_col.astype(np.int32), return_inverse=True)
+    matrix = sp.csr_matrix(
+        (score_col.astype(np.float32), (rows.astype(np.int32), cols.astype(np.int32))),
+        shape=(len(uids), len(mids)),
+    )
+    return RatingMatrix(matrix, IndexMap(uids), IndexMap(mids))
+
+
+def top_neighbors(sims, row_ids, k):
+    """
+    取每行相似度最高的k个邻居（排除自己）
+    排序规则与原 pivot_table + cosine_similarity + sort_values 的算法一致：相似度降序，
+    相似度相同时按行号（即用户ID）升序，相似度为0的用户同样可以成为邻居
+    :return: (邻居行号, 邻居相似度)，列数为 min(k, 用户数-1)
+    """
+    sims = sims.copy()
+    row_ids = np.asarray(row_ids)
+    sims[np.arange(len(row_ids)), row_ids] = -np.inf
+    k = max(0, min(k, sims.shape[1] - 1))
+    order = np.argsort(-sims, axis=1, kind="stable")[:, :k]
+    return order.astype(np.int32), np.take_along_axis(sims, order, axis=1)
+
+
+def recommend_from_neighbors(rating_matrix, row, neighbor_rows, neighbor_sims, limit):
+    """
+    邻居喜欢（评分≥3.5）且目标用户未评分的电影，按邻居相似度之和降序、电影ID升序取前limit部
+    :return: 电影ID列表
+    """
+    rated = set(rating_matrix.row_items(row)[0])
+    scores = {}
+    for neighbor, sim in zip(neighbor_rows, neighbor_sims):
+        if neighbor < 0:
+            continue
+        cols, values = rating_matrix.row_items(neighbor)
+        for col, score in zip(cols, values):
+            if score >= LIKE_THRESHOLD and col not in rated:
+                scores[col] = scores.get(col, 0.0) + float(sim)
+    mids = rating_matrix.movies.ids
+    ranked = sorted(scores, key=lambda col: (-scores[col], mids[col]))
+    return [int(mids[col]) for col in ranked[:limit]]
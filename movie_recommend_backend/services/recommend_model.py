@@ -0,0 +1,252 @@
+# 常驻内存的推荐模型：稀疏用户-电影评分矩阵 + 每个用户的Top-K相似邻居
+# 模型在启动时（后台线程）构建一次，之后随新评分增量更新：新评分先登记为待处理，由后台线程攒一小段时间合并成一次更新；
+# 每次更新都生成新的快照并整体替换，读请求拿到的始终是完整的某个版本
+# 多进程部署时每个进程各有一份模型：后台线程定期按评分ID从数据库补上其他进程写入的新评分
+import threading
+import time
+import numpy as np
+from sqlalchemy import func
+from models import db
+from models.rating import UserRating
+from .rating_matrix import build_rating_matrix, top_neighbors, recommend_from_neighbors
+
+TOP_K = 5  # 每个用户保留的邻居数量（与原算法取前5个邻居一致）
+RECOMMEND_LIMIT = 10  # 最多推荐10部
+
+
+class RecommendModel:
+    """
+    推荐模型快照（构建后只读）
+    - ratings: rating_matrix.RatingMatrix 稀疏评分矩阵
+    - neighbor_rows / neighbor_sims: 每个用户Top-K邻居的行号和相似度（不足K个用-1填充）
+    - version: 快照版本号，每次更新+1
+    """
+
+    def __init__(self, ratings, neighbor_rows, neighbor_sims, version=1):
+        self.ratings = ratings
+        self.neighbor_rows = neighbor_rows
+        self.neighbor_sims = neighbor_sims
+        self.version = version
+        self.built_at = time.time()
+
+    @property
+    def n_users(self):
+        return self.ratings.n_users
+
+    @classmethod
+    def build(cls, ratings, version=1, k=TOP_K):
+        """
+        根据评分数据构建模型
+        :param ratings: (uid, mid, score) 三元组列表
+        :param version: 快照版本号
+        :param k: 每个用户保留的邻居数量
+        """
+        rating_matrix = build_rating_matrix(ratings)
+        neighbor_rows = np.full((rating_matrix.n_users, k), -1, dtype=np.int32)
+        neighbor_sims = np.full((rating_matrix.n_users, k), -np.inf, dtype=np.float32)
+        for row_ids, sims in rating_matrix.iter_similarity_blocks():
+            top_rows, top_sims = top_neighbors(sims, row_ids, k)
+            neighbor_rows[row_ids, :top_rows.shape[1]] = top_rows
+            neighbor_sims[row_ids, :top_sims.shape[1]] = top_sims
+        return cls(rating_matrix, neighbor_rows, neighbor_sims, version)
+
+    def has_rating(self, uid, mid):
+        return self.ratings.has_rating(uid, mid)
+
+    def recommend(self, user_id, limit=RECOMMEND_LIMIT):
+        """
+        为用户生成推荐（规则见 rating_matrix.recommend_from_neighbors）
+        :return: 电影ID列表；用户不在模型中（无评分记录）时返回None
+        """
+        row = self.ratings.users.get(int(user_id))
+        if row is None:
+            return None
+        return recommend_from_neighbors(
+            self.ratings, row, self.neighbor_rows[row], self.neighbor_sims[row], limit
+        )
+
+    def with_rating(self, uid, mid, score):
+        """增量更新：返回加入一条新评分后的新快照（当前快照保持不变）"""
+        return self.with_ratings([(uid, mid, score)])
+
+    def with_ratings(self, new_ratings):
+        """
+        批量增量更新：返回加入一批新评分后的新快照（当前快照保持不变，整批只生成一个新版本）
+        - 评分有变化的用户：一次矩阵乘法重新计算他们与所有用户的相似度，更新其Top-K邻居
+        - 其他用户的邻居列表中，只调整与这些用户相关的项；
+          相似度下降导致的“本应换掉的邻居”不在此处修正，由定期全量重建兜底
+        """
+        ratings, rows, _ = self.ratings.with_ratings(new_ratings)
+        changed = np.unique(rows)
+
+        k = self.neighbor_rows.shape[1]
+        neighbor_rows = np.full((ratings.n_users, k), -1, dtype=np.int32)
+        neighbor_sims = np.full((ratings.n_users, k), -np.inf, dtype=np.float32)
+        neighbor_rows[:self.n_users] = self.neighbor_rows
+        neighbor_sims[:self.n_users] = self.neighbor_sims
+
+        sims = ratings.similarity_rows(changed)
+        top_rows, top_sims = top_neighbors(sims, changed, k)
+        neighbor_rows[changed] = -1
+        neighbor_sims[changed] = -np.inf
+        neighbor_rows[changed, :top_rows.shape[1]] = top_rows
+        neighbor_sims[changed, :top_sims.shape[1]] = top_sims
+
+        # 其他用户：已是邻居的更新相似度，不是邻居但超过第K名的替换第K名
+        # （评分有变化的用户本身已整行重算，跳过）
+        is_changed = np.zeros(ratings.n_users, dtype=bool)
+        is_changed[changed] = True
+        for row, new_sims in zip(changed, sims):
+            contains = neighbor_rows == row
+            in_list = contains.any(axis=1) & ~is_changed
+            beats_last = (new_sims > neighbor_sims[:, -1]) & ~is_changed
+            for v in np.nonzero(in_list | beats_last)[0]:
+                if in_list[v]:
+                    neighbor_sims[v, contains[v]] = new_sims[v]
+                else:
+                    neighbor_rows[v, -1] = row
+                    neighbor_sims[v, -1] = new_sims[v]
+                # 按相似度降序、行号升序重新排列（填充位相似度为-inf，自然排在最后）
+                order = np.lexsort((neighbor_rows[v], -neighbor_sims[v]))
+                neighbor_rows[v] = neighbor_rows[v, order]
+                neighbor_sims[v] = neighbor_sims[v, order]
+
+        return RecommendModel(ratings, neighbor_rows, neighbor_sims, self.version + 1)
+
+
+# ---------------------- 模型快照的发布与更新 ----------------------
+_model = None  # 当前快照（读者直接取引用，无需加锁）
+_write_lock = threading.Lock()  # 写者锁：全量重建、补同步、应用新评分互斥，同一时刻只有一个写者生成新快照
+_pending_lock = threading.Lock()  # 保护_pending（请求线程只在追加时短暂持有）
+_pending = []  # 已落库、尚未加入模型的新评分，由后台线程合并成一次增量更新
+_wake = threading.Event()  # 有新评分时唤醒后台线程
+_background = False  # 后台线程是否在运行；未运行时（离线命令、基准测试）新评分立即应用
+_synced_id = 0  # 模型已包含的最大评分ID（sync从它之后补）
+
+
+def get_model():
+    """获取当前模型快照（尚未构建完成时返回None）"""
+    return _model
+
+
+def rebuild(db):
+    """从user_rating表全量重建模型，并原子替换当前快照（重建期间到达的新评分留在待处理列表中，之后补上）"""
+    global _model, _synced_id
+    with _write_lock:
+        max_id = db.session.query(func.max(UserRating.id)).scalar() or 0
+        ratings = db.session.query(UserRating.uid, UserRating.mid, UserRating.score) \
+            .filter(UserRating.id <= max_id).all()
+        version = (_model.version + 1) if _model is not None else 1
+        model = RecommendModel.build(ratings, version=version)
+        _model = model
+        _synced_id = max(_synced_id, max_id)
+    return model
+
+
+def apply_pending():
+    """
+    把待处理的新评分合并成一次增量更新（只生成一个新快照），并失效这些用户的推荐缓存
+    :return: 加入模型的评分条数
+    """
+    global _model, _pending
+    with _write_lock:
+        with _pending_lock:
+            batch, _pending = _pending, []
+        model = _model
+        if not batch or model is None:
+            return 0  # 模型尚未构建：构建时会从数据库读到这些评分
+        new_ratings = [r for r in batch if not model.has_rating(r[0], r[1])]
+        if not new_ratings:
+            return 0
+        _model = model.with_ratings(new_ratings)
+    # 评分写入到应用之间，这些用户可能按旧快照缓存了推荐结果
+    from . import recommend_service
+    for uid in {r[0] for r in new_ratings}:
+        recommend_service.invalidate_user_cache(uid)
+    return len(new_ratings)
+
+
+def sync(db):
+    """
+    从数据库补上模型中还没有的新评分（多进程部署时其他worker写入的评分，或本进程应用失败的评分），
+    整批一次增量更新；模型中已有的评分按has_rating跳过
+    :return: 补上的评分条数
+    """
+    global _model, _synced_id
+    with _write_lock:
+        if _model is None:
+            return 0  # 全量重建会读到这些评分
+        rows = db.session.query(UserRating.id, UserRating.uid, UserRating.mid, UserRating.score) \
+            .filter(UserRating.id > _synced_id).order_by(UserRating.id).all()
+        if not rows:
+            return 0
+        new_ratings = [(uid, mid, score) for _, uid, mid, score in rows if not _model.has_rating(uid, mid)]
+        if new_ratings:
+            _model = _model.with_ratings(new_ratings)
+        _synced_id = max(_synced_id, rows[-1][0])
+    return len(new_ratings)
+
+
+def on_rating_added(uid, mid, score):
+    """新评分写入数据库后调用：登记为待处理"""
+    on_ratings_added([(uid, mid, score)])
+
+
+def on_ratings_added(ratings):
+    """
+    一批新评分写入数据库后调用：只登记为待处理并唤醒后台线程，由后台线程合并成一次增量更新
+    （请求线程不复制评分矩阵，也不等待写者锁）；没有后台线程时立即应用
+    """
+    if not ratings:
+        return
+    with _pending_lock:
+        _pending.extend(ratings)
+    if _background:
+        _wake.set()
+    else:
+        apply_pending()
+
+
+def start_background_build(app, interval=None, sync_interval=None, apply_delay=1.0):
+    """
+    在后台线程中构建模型（不阻塞启动），之后由该线程负责所有模型更新
+    :param interval: 定期全量重建的间隔秒数，为空时只构建一次
+    :param sync_interval: 两次全量重建之间，每隔多少秒从数据库补上其他进程写入的新评分，为空时不补
+    :param apply_delay: 有新评分时先等待的秒数，把这段时间内的评分合并成一次增量更新
+    """
+    global _background
+
+    def run():
+        next_rebuild = next_sync = 0.0
+        while True:
+            now = time.time()
+            with app.app_context():
+                if now >= next_rebuild:
+                    try:
+                        model = rebuild(db)
+                        print(f"推荐模型构建完成：版本{model.version}，{model.n_users}个用户")
+                    except Exception as e:
+                        print(f"推荐模型构建失败：{str(e)}")
+                    next_rebuild = time.time() + interval if interval else float("inf")
+                    next_sync = time.time() + sync_interval if sync_interval else float("inf")
+                elif now >= next_sync:
+                    try:
+                        sync(db)
+                    except Exception as e:
+                        print(f"推荐模型同步新评分失败：{str(e)}")
+                    next_sync = time.time() + sync_interval
+            try:
+                apply_pending()
+            except Exception as e:
+                print(f"推荐模型增量更新失败：{str(e)}")
+
+            wait_until = min(next_rebuild, next_sync)
+            timeout = None if wait_until == float("inf") else max(wait_until - time.time(), 0)
+            if _wake.wait(timeout):
+                _wake.clear()
+                time.sleep(apply_delay)
+
+    _background = True
+    thread = threading.Thread(target=run, name="recommend-model-builder", daemon=True)
+    thread.start()
+    return thread
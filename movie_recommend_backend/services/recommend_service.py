@@ -1,86 +1,208 @@
 # 协同过滤推荐算法核心逻辑
-import pandas as pd
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity  # 余弦相似度计算
 from models.rating import UserRating
+from models.recommendation import UserRecommendation
 from .movie_service import get_hot_movies, get_movie_details
+from .rating_matrix import build_rating_matrix, top_neighbors, recommend_from_neighbors
+from utils import cache, metrics
+from . import recommend_model, item_model, als_model, ann_index
+
+RECOMMEND_MODES = ("user", "item", "als")  # user=基于用户的协同过滤（默认），item=基于物品的协同过滤，als=矩阵分解
+
+@cache.cached("recommend", key=lambda user_id, mode="user": f"{int(user_id)}:{mode}",
+              cache_if=lambda result: result["code"] == 1 and "fallback" not in result)
+def recommend(db, user_id, mode="user"):
+    """
+    推荐接口入口（结果按 用户+模式 缓存，该用户评分后失效；模型未训练时的回退结果不缓存）
+    :param mode: user=基于用户（优先读离线预计算结果），item=基于物品，als=矩阵分解
+    :return: 推荐电影列表
+    """
+    if mode == "item":
+        return get_item_recommend(db, user_id)
+    if mode == "als":
+        return get_als_recommend(db, user_id)
+    # 优先读取离线预计算的推荐结果，没有时再实时计算
+    result = get_stored_recommend(db, user_id)
+    if result is None:
+        result = get_recommend_movies(db, user_id)
+    return result
+
+def invalidate_user_cache(user_id):
+    """用户评分后失效其各模式的推荐缓存"""
+    for mode in RECOMMEND_MODES:
+        cache.invalidate("recommend", f"{int(user_id)}:{mode}")
 
 def get_recommend_movies(db, user_id):
     """
     基于用户的协同过滤推荐算法（核心函数）
-    步骤：1. 构建用户-电影评分矩阵 → 2. 计算用户相似度 → 3. 找到最近邻居 → 4. 生成推荐
+    步骤：1. 构建用户-电影稀疏评分矩阵 → 2. 计算目标用户与其他用户的相似度 → 3. 找到最近邻居 → 4. 生成推荐
     :param db: 数据库对象
     :param user_id: 目标用户ID（给谁推荐）
     :return: 推荐电影列表
     """
     try:
+        # 0. 优先使用常驻内存的推荐模型（毫秒级响应）；模型尚未构建完成时走下面的实时计算
+        # 各阶段耗时记入监控指标（service_stage_duration_seconds{operation="recommend"}）
+        model = recommend_model.get_model()
+        if model is not None:
+            return recommend_from_model(db, model, user_id)
+
         # 1. 读取数据库中的评分数据
-        ratings = db.session.query(
-            UserRating.uid,  # 用户ID
-            UserRating.mid,  # 电影ID
-            UserRating.score  # 评分
-        ).all()
+        with metrics.stage("recommend", "load_ratings"):
+            ratings = db.session.query(
+                UserRating.uid,  # 用户ID
+                UserRating.mid,  # 电影ID
+                UserRating.score  # 评分
+            ).all()
         
         # 如果没有评分数据，直接返回热门电影
         if not ratings:
             return {"code": 0, "msg": "暂无评分数据，为你推荐热门电影", "data": get_hot_movies(db)}
         
-        # 2. 构建用户-电影评分矩阵（关键步骤）
-        # 将评分数据转为DataFrame（类似Excel表格）
-        rating_df = pd.DataFrame(ratings, columns=["uid", "mid", "score"])
-        # 构建矩阵：行=用户ID，列=电影ID，值=评分（无评分的位置填0）
-        user_movie_matrix = rating_df.pivot_table(
-            index="uid",  # 行索引：用户ID
-            columns="mid",  # 列索引：电影ID
-            values="score",  # 单元格值：评分
-            fill_value=0  # 无评分的位置填0
-        )
+        # 2. 构建用户-电影稀疏评分矩阵（只存有评分的位置，内存与评分条数成正比）
+        with metrics.stage("recommend", "build_matrix"):
+            rating_matrix = build_rating_matrix(ratings)
         
-        # 3. 计算用户相似度（使用余弦相似度）
-        # 余弦相似度：值越接近1，两个用户兴趣越相似；越接近0，兴趣越不相似
-        user_similarity = cosine_similarity(user_movie_matrix)
-        # 将相似度矩阵转为DataFrame，方便查询
-        user_similarity_df = pd.DataFrame(
-            user_similarity,
-            index=user_movie_matrix.index,  # 行=用户ID
-            columns=user_movie_matrix.index  # 列=用户ID
-        )
-        
-        # 4. 检查目标用户是否有评分记录
-        if user_id not in user_similarity_df.index:
+        # 3. 检查目标用户是否有评分记录
+        target_row = rating_matrix.users.get(user_id)
+        if target_row is None:
             # 目标用户无评分，返回热门电影
             return {"code": 0, "msg": "你暂无评分记录，为你推荐热门电影", "data": get_hot_movies(db)}
         
-        # 5. 找到目标用户的最近邻居（取相似度最高的前5个用户，排除自己）
-        # 对目标用户的相似度排序（从高到低）
-        target_user_similarity = user_similarity_df[user_id].sort_values(ascending=False)
-        # 取前5个邻居（iloc[1:6]：排除第一个自己）
-        nearest_neighbors = target_user_similarity.iloc[1:6].index
-        
-        # 6. 生成推荐电影：邻居喜欢且目标用户未看过的电影
-        # 第一步：获取目标用户已经评分过的电影（即已经看过的）
-        target_user_rated_movies = user_movie_matrix.loc[user_id][user_movie_matrix.loc[user_id] > 0].index
+        # 4. 只计算目标用户与所有用户的余弦相似度（一行，而不是全量两两相似度矩阵）
+        # 余弦相似度：值越接近1，两个用户兴趣越相似；越接近0，兴趣越不相似
+        with metrics.stage("recommend", "similarity"):
+            target_similarity = rating_matrix.similarity_rows([target_row])
         
-        # 第二步：收集邻居喜欢的电影（邻居评分≥3.5的电影，认为是喜欢的）
-        recommend_movie_ids = []
-        for neighbor in nearest_neighbors:
-            # 获取邻居评分≥3.5的电影ID
-            neighbor_liked_movies = user_movie_matrix.loc[neighbor][user_movie_matrix.loc[neighbor] >= 3.5].index
-            # 筛选出目标用户未看过的电影
-            unrated_movies = set(neighbor_liked_movies) - set(target_user_rated_movies)
-            # 添加到推荐列表
-            recommend_movie_ids.extend(unrated_movies)
+        # 5. 找到目标用户的最近邻居（取相似度最高的前5个用户，排除自己）
+        # 6. 生成推荐电影：邻居喜欢（评分≥3.5）且目标用户未看过的电影，最多推荐10部
+        with metrics.stage("recommend", "neighbors"):
+            neighbor_rows, neighbor_sims = top_neighbors(target_similarity, [target_row], recommend_model.TOP_K)
+            recommend_movie_ids = recommend_from_neighbors(
+                rating_matrix, target_row, neighbor_rows[0], neighbor_sims[0], recommend_model.RECOMMEND_LIMIT
+            )
         
-        # 7. 去重并限制推荐数量（最多推荐10部）
-        recommend_movie_ids = list(set(recommend_movie_ids))[:10]  # 去重，取前10部
+        # 7. 获取推荐电影的详情
+        with metrics.stage("recommend", "details"):
+            recommend_movies = get_movie_details(db, recommend_movie_ids)
         
-        # 8. 获取推荐电影的详情
-        recommend_movies = get_movie_details(db, recommend_movie_ids)
-        
-        # 9. 返回推荐结果
+        # 8. 返回推荐结果
         return {"code": 1, "msg": "为你推荐以下电影", "data": recommend_movies}
     
     except Exception as e:
         # 捕获异常，返回热门电影
         print(f"推荐算法执行失败：{str(e)}")
-        return {"code": 0, "msg": "推荐服务暂时异常，为你推荐热门电影", "data": get_hot_movies(db)}
\ No newline at end of file
+        return {"code": 0, "msg": "推荐服务暂时异常，为你推荐热门电影", "data": get_hot_movies(db)}
+
+def recommend_from_model(db, model, user_id):
+    """
+    使用推荐模型快照生成推荐（快照只读，调用期间模型被更新也不受影响）
+    :param db: 数据库对象
+    :param model: recommend_model.RecommendModel 快照
+    :param user_id: 目标用户ID
+    :return: 推荐电影列表
+    """
+    if model.n_users == 0:
+        return {"code": 0, "msg": "暂无评分数据，为你推荐热门电影", "data": get_hot_movies(db)}
+    # 模型中邻居已预先算好：只有“邻居选取+生成推荐”和“读取详情”两个阶段
+    with metrics.stage("recommend", "neighbors"):
+        recommend_movie_ids = model.recommend(user_id)
+    if recommend_movie_ids is None:
+        return {"code": 0, "msg": "你暂无评分记录，为你推荐热门电影", "data": get_hot_movies(db)}
+    with metrics.stage("recommend", "details"):
+        recommend_movies = get_movie_details(db, recommend_movie_ids)
+    return {"code": 1, "msg": "为你推荐以下电影", "data": recommend_movies}
+
+def get_stored_recommend(db, user_id):
+    """
+    读取离线批量任务预先算好的推荐结果（manage.py precompute-recommend）
+    :param db: 数据库对象
+    :param user_id: 目标用户ID
+    :return: 推荐电影列表；该用户没有预计算结果时返回None
+    """
+    try:
+        stored = db.session.get(UserRecommendation, user_id)
+        if stored is None:
+            return None
+        return {"code": 1, "msg": "为你推荐以下电影", "data": get_movie_details(db, stored.movie_ids())}
+    except Exception as e:
+        print(f"读取预计算推荐失败：{str(e)}")
+        return None
+
+def fallback_recommend(db, user_id):
+    """
+    所选模式的模型尚未生成：改用基于用户的推荐，结果带fallback字段并在msg中注明
+    :return: 推荐电影列表
+    """
+    result = dict(get_recommend_movies(db, user_id), fallback="user")
+    if result["code"] == 1:
+        result["msg"] = "模型未训练，已回退为基于用户的推荐"
+    else:
+        result["msg"] = f"模型未训练，已回退为基于用户的推荐；{result['msg']}"
+    return result
+
+def get_item_recommend(db, user_id):
+    """
+    基于物品的协同过滤推荐：用户评过分的电影 → 离线相似度表中的相似电影 → 按加权相似度之和排序
+    :param db: 数据库对象
+    :param user_id: 目标用户ID
+    :return: 推荐电影列表
+    """
+    try:
+        model = item_model.get_model()
+        if model is None:
+            # 相似度表尚未生成：退回基于用户的推荐
+            return fallback_recommend(db, user_id)
+        rated = db.session.query(UserRating.mid, UserRating.score).filter(UserRating.uid == user_id).all()
+        if not rated:
+            return {"code": 0, "msg": "你暂无评分记录，为你推荐热门电影", "data": get_hot_movies(db)}
+        recommend_movie_ids = model.recommend(rated, recommend_model.RECOMMEND_LIMIT)
+        if not recommend_movie_ids:
+            return {"code": 0, "msg": "暂无相似电影，为你推荐热门电影", "data": get_hot_movies(db)}
+        return {"code": 1, "msg": "为你推荐以下电影", "data": get_movie_details(db, recommend_movie_ids)}
+    except Exception as e:
+        print(f"物品推荐执行失败：{str(e)}")
+        return {"code": 0, "msg": "推荐服务暂时异常，为你推荐热门电影", "data": get_hot_movies(db)}
+
+def get_als_recommend(db, user_id):
+    """
+    矩阵分解（ALS）推荐：用户因子 × 全部电影因子打分，排除已评分电影后取Top-N
+    :param db: 数据库对象
+    :param user_id: 目标用户ID
+    :return: 推荐电影列表
+    """
+    try:
+        model = als_model.get_model()
+        if model is None:
+            # 尚未训练ALS模型：退回基于用户的推荐
+            return fallback_recommend(db, user_id)
+        # 训练之后新评分的电影同样需要排除
+        rated_mids = [mid for mid, in db.session.query(UserRating.mid).filter(UserRating.uid == user_id)]
+        recommend_movie_ids = model.recommend(user_id, recommend_model.RECOMMEND_LIMIT, exclude=rated_mids)
+        if not recommend_movie_ids:
+            return {"code": 0, "msg": "你暂无评分记录，为你推荐热门电影", "data": get_hot_movies(db)}
+        return {"code": 1, "msg": "为你推荐以下电影", "data": get_movie_details(db, recommend_movie_ids)}
+    except Exception as e:
+        print(f"ALS推荐执行失败：{str(e)}")
+        return {"code": 0, "msg": "推荐服务暂时异常，为你推荐热门电影", "data": get_hot_movies(db)}
+
+def get_similar_movies(db, movie_id, limit=10):
+    """
+    相似电影：在电影近似最近邻索引中查找与该电影最相似的电影
+    :param db: 数据库对象
+    :param movie_id: 电影ID
+    :param limit: 最多返回数量
+    :return: 相似电影列表（每部附带相似度similarity）
+    """
+    try:
+        index = ann_index.get_movie_index()
+        neighbors = index.query_id(movie_id, limit) if index is not None else None
+        if not neighbors:
+            return {"code": 0, "msg": "暂无相似电影", "data": []}
+        movies = get_movie_details(db, [mid for mid, _ in neighbors])
+        similarity = dict(neighbors)
+        for movie in movies:
+            movie["similarity"] = round(similarity[movie["id"]], 4)
+        return {"code": 1, "msg": "获取相似电影成功", "data": movies}
+    except Exception as e:
+        print(f"获取相似电影失败：{str(e)}")
+        return {"code": 0, "msg": "获取相似电影失败", "data": []}
@@ -0,0 +1,323 @@
+# 电影全文搜索：常驻内存的倒排索引（电影名、导演、演员、类别、简介）
+# 中文按单字+二元组（bigram）切分，英文/数字按单词切分；结果按BM25打分排序
+# 启动时优先从磁盘加载索引文件，数据库有变化时才在后台重建；新增/编辑电影时增量更新，
+# 稍后在后台线程中写回磁盘（SEARCH_INDEX_SAVE_DELAY秒内的多次编辑只写一次）
+# 多进程部署时，其他worker写回的索引文件在get_index时通过修改时间发现并重新加载
+import math
+import os
+import pickle
+import re
+import tempfile
+import threading
+from types import SimpleNamespace
+from sqlalchemy import func
+from models import db
+from models.movie import Movie
+from utils.file_watch import FileWatcher
+
+INDEX_FORMAT_VERSION = 1
+# 各字段的权重：命中电影名比命中简介更重要
+FIELD_WEIGHTS = {"name": 3.0, "director": 2.0, "actors": 1.5, "style": 1.5, "description": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_CJK_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_WORD = re.compile(r"[0-9a-z]+")
+
+
+def tokenize(text, for_query=False):
+    """
+    切词：连续的中文切成二元组（索引时额外保留单字，便于单字查询），英文/数字按单词
+    :param for_query: 查询切词时，长度≥2的中文只用二元组（更精确）
+    """
+    tokens = []
+    text = (text or "").lower()
+    for run in _CJK_RUN.findall(text):
+        bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+        if for_query and bigrams:
+            tokens.extend(bigrams)
+        else:
+            tokens.extend(run)
+            tokens.extend(bigrams)
+    tokens.extend(_WORD.findall(_CJK_RUN.sub(" ", text)))
+    return tokens
+
+
+def movie_fields(movie):
+    """电影中参与搜索的字段（演员按空格、类别按逗号分隔）"""
+    return {
+        "name": movie.name or "",
+        "director": movie.director or "",
+        "actors": movie.actors or "",
+        "style": (movie.style or "").replace(",", " "),
+        "description": movie.description or "",
+    }
+
+
+class SearchIndex:
+    """倒排索引：token → {电影ID: 加权词频}，另存每部电影的过滤字段"""
+
+    def __init__(self):
+        self.postings = {}
+        self.docs = {}  # 电影ID → {"tokens": {token: 加权词频}, "length": 加权长度, "styles", "language", "year"}
+        self.total_length = 0.0
+        self.signature = None
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, movie):
+        """加入或更新一部电影（先删除旧的倒排项）"""
+        weighted = {}
+        for field, text in movie_fields(movie).items():
+            for token in tokenize(text):
+                weighted[token] = weighted.get(token, 0.0) + FIELD_WEIGHTS[field]
+        doc = {
+            "tokens": weighted,
+            "length": sum(weighted.values()),
+            "styles": {style.strip() for style in (movie.style or "").split(",") if style.strip()},
+            "language": (movie.language or "").strip(),
+            "year": movie.release_date.year if movie.release_date else None,
+        }
+        with self._lock:
+            self.remove(movie.id)
+            for token, tf in weighted.items():
+                self.postings.setdefault(token, {})[movie.id] = tf
+            self.docs[movie.id] = doc
+            self.total_length += doc["length"]
+
+    def remove(self, movie_id):
+        with self._lock:
+            doc = self.docs.pop(movie_id, None)
+            if doc is None:
+                return
+            self.total_length -= doc["length"]
+            for token in doc["tokens"]:
+                posting = self.postings.get(token)
+                if posting is not None:
+                    posting.pop(movie_id, None)
+                    if not posting:
+                        del self.postings[token]
+
+    def _matches_filters(self, doc, style, language, year):
+        return (not style or style in doc["styles"]) \
+            and (not language or doc["language"] == language) \
+            and (not year or doc["year"] == year)
+
+    def search(self, query, style=None, language=None, year=None):
+        """
+        搜索并按相关度排序
+        :return: 电影ID列表（关键词为空时返回满足过滤条件的全部电影，按年份倒序）
+        """
+        tokens = list(dict.fromkeys(tokenize(query, for_query=True)))
+        with self._lock:
+            if not tokens:
+                matched = [(movie_id, doc) for movie_id, doc in self.docs.items()
+                           if self._matches_filters(doc, style, language, year)]
+                matched.sort(key=lambda item: (-(item[1]["year"] or 0), -item[0]))
+                return [movie_id for movie_id, _ in matched]
+
+            n_docs = len(self.docs)
+            avg_length = self.total_length / n_docs if n_docs else 1.0
+            scores = {}
+            for token in tokens:
+                posting = self.postings.get(token)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for movie_id, tf in posting.items():
+                    doc = self.docs[movie_id]
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * doc["length"] / avg_length)
+                    scores[movie_id] = scores.get(movie_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+            results = [movie_id for movie_id in scores
+                       if self._matches_filters(self.docs[movie_id], style, language, year)]
+        results.sort(key=lambda movie_id: (-scores[movie_id], movie_id))
+        return results
+
+    def save(self, path):
+        """写入磁盘（先写临时文件再改名，避免留下写了一半的索引）"""
+        with self._lock:
+            data = pickle.dumps({"format": INDEX_FORMAT_VERSION, "index": self}, protocol=pickle.HIGHEST_PROTOCOL)
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        """从磁盘加载索引，文件不存在或格式不符时返回None"""
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        if data.get("format") != INDEX_FORMAT_VERSION:
+            return None
+        return data["index"]
+
+
+def movie_table_signature(db):
+    """电影表的签名（数量+最大ID+最后修改时间），用于判断磁盘上的索引是否还能用（编辑电影也会让签名变化）"""
+    count, max_id, max_update_time = db.session.query(
+        func.count(Movie.id), func.max(Movie.id), func.max(Movie.update_time)
+    ).one()
+    return count, max_id, str(max_update_time) if max_update_time is not None else None
+
+
+def build(db, batch_size=500):
+    """从movie表全量构建索引（分批读取，不加载海报）"""
+    index = SearchIndex()
+    # 先取签名再读数据：构建期间新增的电影会让签名对不上，下次启动时自动重建
+    index.signature = movie_table_signature(db)
+    for movie in Movie.query.order_by(Movie.id).yield_per(batch_size):
+        index.add(movie)
+    return index
+
+
+# ---------------------- 全局索引 ----------------------
+_index = None
+_index_path = None
+_watcher = None
+_save_delay = 5
+_save_lock = threading.Lock()
+_save_timer = None
+_unsaved = {}  # 已加入内存索引、尚未写回磁盘的电影：电影ID → 搜索字段快照
+
+
+def get_index(force_check=False):
+    """
+    当前索引（尚未就绪时返回None）；磁盘上的索引被其他进程写回后自动重新加载
+    :param force_check: 立即检查磁盘上的文件（不受检查间隔限制）
+    """
+    global _index
+    if _watcher is not None and _watcher.changed(force=force_check):
+        try:
+            index = SearchIndex.load(_index_path)
+            if index is not None:
+                with _save_lock:
+                    for movie in _unsaved.values():  # 本进程还没写回的编辑不能丢
+                        index.add(movie)
+                    _index = index
+        except Exception as e:
+            print(f"重新加载搜索索引失败：{str(e)}")
+    return _index
+
+
+def _save(index):
+    index.save(_index_path)
+    if _watcher is not None:
+        _watcher.mark()
+
+
+def _save_later():
+    """安排一次延迟写回；已有待执行的写回时不重复安排（到时写入的是最新的索引）"""
+    global _save_timer
+    if _save_timer is None:
+        _save_timer = threading.Timer(_save_delay, flush)
+        _save_timer.daemon = True
+        _save_timer.start()
+
+
+def flush():
+    """把尚未写回的增量更新写入磁盘（延迟写回的定时器、进程退出前调用）"""
+    global _save_timer
+    with _save_lock:
+        if _save_timer is not None:
+            _save_timer.cancel()
+            _save_timer = None
+        if not _unsaved:
+            return
+        unsaved = dict(_unsaved)
+        _unsaved.clear()
+        index = _index
+    if index is None or not _index_path:
+        return
+    try:
+        _save(index)
+    except Exception as e:
+        print(f"写回搜索索引失败：{str(e)}")
+        with _save_lock:
+            for movie_id, movie in unsaved.items():
+                _unsaved.setdefault(movie_id, movie)
+
+
+def rebuild(db):
+    """全量重建索引，替换当前索引并写入磁盘"""
+    global _index
+    index = build(db)
+    with _save_lock:
+        _index = index
+        _unsaved.clear()
+    if _index_path:
+        _save(index)
+    return index
+
+
+def init_app(app, build_missing=True):
+    """
+    启动时准备索引：磁盘上的索引与数据库一致则直接加载，否则在后台线程重建
+    :param build_missing: False时只加载一致的索引，不启动后台重建（离线命令使用）
+    """
+    global _index, _index_path, _watcher, _save_delay
+    _index_path = app.config["SEARCH_INDEX_PATH"]
+    _save_delay = app.config["SEARCH_INDEX_SAVE_DELAY"]
+    _watcher = FileWatcher(_index_path)
+    with app.app_context():
+        try:
+            _watcher.mark()
+            index = SearchIndex.load(_index_path)
+            if index is not None and index.signature == movie_table_signature(db):
+                _index = index
+                return
+        except Exception as e:
+            print(f"加载搜索索引失败，将重新构建：{str(e)}")
+    if not build_missing:
+        return
+
+    def run():
+        with app.app_context():
+            try:
+                index = rebuild(db)
+                print(f"搜索索引构建完成：{len(index)}部电影")
+            except Exception as e:
+                print(f"搜索索引构建失败：{str(e)}")
+
+    threading.Thread(target=run, name="search-index-builder", daemon=True).start()
+
+
+def _snapshot(movie):
+    """电影中建索引用到的字段（提交后ORM对象的属性会过期，延迟写回和重新加载时用快照）"""
+    return SimpleNamespace(id=movie.id, name=movie.name, director=movie.director, actors=movie.actors,
+                           style=movie.style, description=movie.description, language=movie.language,
+                           release_date=movie.release_date)
+
+
+def index_movie(db, movie):
+    """
+    新增/编辑电影后增量更新内存中的索引，延迟在后台写回磁盘
+    （先加载其他进程已写回的索引，避免写回时覆盖掉它们的修改）
+    """
+    index = get_index(force_check=True)
+    if index is None:
+        return
+    try:
+        movie = _snapshot(movie)
+        index.add(movie)
+        index.signature = movie_table_signature(db)
+        if _index_path:
+            with _save_lock:
+                _unsaved[movie.id] = movie
+                _save_later()
+    except Exception as e:
+        print(f"更新搜索索引失败：{str(e)}")
@@ -2,8 +2,19 @@
 from models.user import User
 from models.history import UserHistory
 from models.rating import UserRating
+from models.movie import Movie
+from models.recommendation import UserRecommendation
 from models import db
+from sqlalchemy import insert, update, bindparam, and_, or_
 from sqlalchemy.exc import IntegrityError  # 用于捕获数据库唯一约束错误
+from utils import cache
+from utils.auth import issue_token, revoke_user
+from . import recommend_model, recommend_service, history_buffer
+import base64
+import csv
+import datetime
+import io
+import json
 
 def register(db, data):
     """
@@ -72,12 +83,38 @@ def login(db, data):
         if not user:
             return {"code": 0, "msg": "邮箱或密码错误！", "data": {}}
         
-        # 5. 返回成功结果（包含用户ID和用户名，供前端存储）
-        return {"code": 1, "msg": "登录成功！", "data": {"user_id": user.id, "username": user.name}}
+        # 5. 返回成功结果（包含用户ID、用户名和登录令牌，供前端存储；之后请求头Authorization传令牌）
+        return {"code": 1, "msg": "登录成功！", "data": {
+            "user_id": user.id,
+            "username": user.name,
+            "is_admin": bool(user.is_admin),
+            "token": issue_token(user),
+        }}
     
     except Exception as e:
         return {"code": 0, "msg": f"登录失败：{str(e)}", "data": {}}
 
+def set_admin(db, user_id, is_admin, operator_id=None):
+    """
+    设置/取消管理员身份，并撤销该用户已签发的登录令牌（令牌里的管理员标记已过期，需重新登录）
+    :param operator_id: 操作的管理员ID（不能修改自己的身份）
+    :return: 修改结果
+    """
+    try:
+        if operator_id is not None and int(user_id) == int(operator_id):
+            return {"code": 0, "msg": "不能修改自己的管理员身份！", "data": {}}
+        user = db.session.get(User, int(user_id))
+        if not user:
+            return {"code": 0, "msg": "用户不存在！", "data": {}}
+        if bool(user.is_admin) != bool(is_admin):
+            user.is_admin = bool(is_admin)
+            db.session.commit()
+            revoke_user(db, user.id)
+        return {"code": 1, "msg": "修改成功！", "data": {"id": user.id, "is_admin": bool(user.is_admin)}}
+    except Exception as e:
+        db.session.rollback()
+        return {"code": 0, "msg": f"修改失败：{str(e)}", "data": {}}
+
 def add_history(db, data):
     """
     添加用户浏览记录
@@ -91,6 +128,17 @@ def add_history(db, data):
         
         if not all([uid, mid]):
             return {"code": 0, "msg": "用户ID和电影ID不能为空！", "data": {}}
+        try:
+            uid, mid = int(uid), int(mid)
+        except (TypeError, ValueError):
+            return {"code": 0, "msg": "用户ID和电影ID必须为整数！", "data": {}}
+        
+        # 启用了缓冲写入时只入队，由后台线程批量写库
+        buffer = history_buffer.get_buffer()
+        if buffer is not None:
+            if not buffer.enqueue(uid, mid):
+                return {"code": 0, "msg": "系统繁忙，浏览记录未保存", "data": {}}
+            return {"code": 1, "msg": "浏览记录添加成功！", "data": {}}
         
         # 创建历史记录对象
         new_history = UserHistory(uid=uid, mid=mid)
@@ -135,12 +183,329 @@ def add_rating(db, data):
             description=description
         )
         db.session.add(new_rating)
+        # 同一事务内维护电影表上的评分统计（数据库端原子累加，并发评分不会丢失）
+        Movie.query.filter_by(id=mid).update({
+            Movie.rating_sum: Movie.rating_sum + float(score),
+            Movie.rating_count: Movie.rating_count + 1,
+            Movie.update_time: Movie.update_time,  # 评分统计不算修改电影信息，不更新修改时间
+        }, synchronize_session=False)
+        # 该用户的预计算推荐已过期，删除后由推荐模型实时生成
+        UserRecommendation.query.filter_by(uid=uid).delete()
         db.session.commit()
-        
-        return {"code": 1, "msg": "评分成功！", "data": {}}
     except IntegrityError:
         db.session.rollback()
         return {"code": 0, "msg": "已对该电影评分，不可重复！", "data": {}}
     except Exception as e:
         db.session.rollback()
-        return {"code": 0, "msg": f"评分失败：{str(e)}", "data": {}}
\ No newline at end of file
+        return {"code": 0, "msg": f"评分失败：{str(e)}", "data": {}}
+
+    # 评分已落库：后续步骤失败也返回成功
+    _after_ratings_added(int(uid), [(int(mid), float(score))])
+    return {"code": 1, "msg": "评分成功！", "data": {}}
+
+
+def _after_ratings_added(uid, ratings):
+    """
+    评分提交后的收尾：失效相关缓存、把新评分交给推荐模型
+    评分已经落库，这里的失败只打印日志（推荐模型会在定期同步/重建时补上）
+    :param ratings: (电影ID, 评分) 列表
+    """
+    try:
+        # 这些电影的平均分、热门排行、该用户的推荐结果已变化
+        for mid, _ in ratings:
+            cache.invalidate("movie_detail", mid)
+        cache.invalidate("movie_hot")
+        recommend_service.invalidate_user_cache(uid)
+    except Exception as e:
+        print(f"评分后失效缓存失败（用户{uid}）：{str(e)}")
+    try:
+        recommend_model.on_ratings_added([(uid, mid, score) for mid, score in ratings])
+    except Exception as e:
+        print(f"评分后更新推荐模型失败（用户{uid}）：{str(e)}")
+
+
+RATING_BATCH_MAX = 100  # 一次批量评分最多的条数
+
+
+def add_ratings(db, data):
+    """
+    批量添加用户评分（新用户引导页一次提交多部电影的评分）
+    校验全部条目后，一次查询检查重复评分和电影是否存在，合格的条目在一个事务中批量写入；
+    推荐模型按整批做一次增量更新
+    :param db: 数据库对象
+    :param data: 前端传入的数据（uid, ratings: [{mid, score, description}, ...]）
+    :return: 添加结果，data.results为每一条的结果（与请求顺序一致）
+    """
+    try:
+        uid = data.get("uid")
+        items = data.get("ratings")
+        if not uid:
+            return {"code": 0, "msg": "用户ID不能为空！", "data": {}}
+        if not isinstance(items, list) or not items:
+            return {"code": 0, "msg": "评分列表不能为空！", "data": {}}
+        if len(items) > RATING_BATCH_MAX:
+            return {"code": 0, "msg": f"一次最多提交{RATING_BATCH_MAX}条评分！", "data": {}}
+        uid = int(uid)
+
+        # 1. 逐条校验格式（不访问数据库）
+        results, valid, seen = [], {}, set()
+        for i, item in enumerate(items):
+            item = item if isinstance(item, dict) else {}
+            mid, score = item.get("mid"), item.get("score")
+            result = {"mid": mid, "code": 0, "msg": ""}
+            results.append(result)
+            try:
+                mid, score = int(mid), float(score)
+            except (TypeError, ValueError):
+                result["msg"] = "电影ID、评分不能为空！"
+                continue
+            if not (1.0 <= score <= 5.0):
+                result["msg"] = "评分必须在1.0-5.0之间！"
+            elif mid in seen:
+                result["msg"] = "同一部电影重复提交！"
+            else:
+                seen.add(mid)
+                valid[i] = {"uid": uid, "mid": mid, "score": score, "description": item.get("description", "")}
+
+        # 2. 一次查询已评过分的电影、一次查询存在的电影
+        mids = [row["mid"] for row in valid.values()]
+        rated, exists = set(), set()
+        if mids:
+            rated = {mid for mid, in db.session.query(UserRating.mid).filter(UserRating.uid == uid, UserRating.mid.in_(mids))}
+            exists = {mid for mid, in db.session.query(Movie.id).filter(Movie.id.in_(mids))}
+        rows = []
+        for i, row in valid.items():
+            if row["mid"] in rated:
+                results[i]["msg"] = "你已对该电影评过分，不可重复评分！"
+            elif row["mid"] not in exists:
+                results[i]["msg"] = "电影不存在！"
+            else:
+                rows.append(row)
+                results[i].update(code=1, msg="评分成功！")
+        if not rows:
+            return {"code": 0, "msg": "没有可添加的评分！", "data": {"added": 0, "results": results}}
+
+        # 3. 一个事务：批量插入评分 + 批量累加电影评分统计 + 删除该用户的预计算推荐
+        db.session.execute(insert(UserRating), rows)
+        movie_table = Movie.__table__
+        db.session.execute(
+            update(movie_table).where(movie_table.c.id == bindparam("b_mid")).values(
+                rating_sum=movie_table.c.rating_sum + bindparam("b_score"),
+                rating_count=movie_table.c.rating_count + 1,
+                update_time=movie_table.c.update_time,
+            ),
+            [{"b_mid": row["mid"], "b_score": row["score"]} for row in rows],
+        )
+        UserRecommendation.query.filter_by(uid=uid).delete()
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return {"code": 0, "msg": "部分电影已评分，请刷新后重试！", "data": {}}
+    except Exception as e:
+        db.session.rollback()
+        return {"code": 0, "msg": f"批量评分失败：{str(e)}", "data": {}}
+
+    # 评分已落库：推荐模型整批增量更新一次；后续步骤失败也返回成功
+    _after_ratings_added(uid, [(row["mid"], row["score"]) for row in rows])
+    return {"code": 1, "msg": f"成功评分{len(rows)}部电影！", "data": {"added": len(rows), "results": results}}
+
+
+BEHAVIOR_PAGE_SIZE = 50  # 行为记录每页默认条数
+BEHAVIOR_PAGE_MAX = 200
+# 浏览、评分两个来源合并成一条时间线；时间相同时评分排在浏览前面，再按记录ID倒序
+_BEHAVIOR_SOURCES = (
+    ("rating", 1, UserRating),
+    ("history", 0, UserHistory),
+)
+
+
+def encode_behavior_cursor(item):
+    """行为记录游标：最后一条的 (时间, 来源, 记录ID)，编码为URL安全的字符串"""
+    raw = f"{item['_time'].isoformat()}|{item['source']}|{item['id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_behavior_cursor(cursor):
+    """解析行为记录游标，返回 (时间, 来源排序值, 记录ID)；格式不对时抛出ValueError"""
+    try:
+        time, source, record_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        rank = {name: rank for name, rank, _ in _BEHAVIOR_SOURCES}[source]
+        return datetime.datetime.fromisoformat(time), rank, int(record_id)
+    except Exception:
+        raise ValueError("无效的分页游标")
+
+
+def get_user_behavior(db, user_id, page_size=BEHAVIOR_PAGE_SIZE, cursor=None):
+    """
+    获取用户行为记录（浏览+评分合并，按时间倒序，游标分页）
+    每页固定3条SQL，与用户的记录总数无关：
+    - 浏览、评分各取一页（走 (uid, time) 索引，从游标位置往后取page_size+1条）
+    - 本页涉及的电影名称用一条IN查询取出（只查名称，不读海报）
+    :param cursor: 上一页返回的next_cursor，首页为空
+    :return: 本页记录和next_cursor（为None表示没有更多）
+    """
+    try:
+        page_size = max(1, min(int(page_size), BEHAVIOR_PAGE_MAX))
+        position = decode_behavior_cursor(cursor) if cursor else None
+
+        items = []
+        for source, rank, model in _BEHAVIOR_SOURCES:
+            query = model.query.filter(model.uid == user_id)
+            if position:
+                # 合并顺序是 (时间, 来源, ID) 倒序：取排在游标之后的记录
+                last_time, last_rank, last_id = position
+                if rank < last_rank:
+                    query = query.filter(model.time <= last_time)
+                elif rank > last_rank:
+                    query = query.filter(model.time < last_time)
+                else:
+                    query = query.filter(or_(model.time < last_time, and_(model.time == last_time, model.id < last_id)))
+            for record in query.order_by(model.time.desc(), model.id.desc()).limit(page_size + 1):
+                items.append({
+                    "id": record.id,
+                    "source": source,
+                    "mid": record.mid,
+                    "score": getattr(record, "score", None),
+                    "_time": record.time,
+                    "_rank": rank,
+                })
+
+        items.sort(key=lambda item: (item["_time"], item["_rank"], item["id"]), reverse=True)
+        next_cursor = None
+        if len(items) > page_size:
+            items = items[:page_size]
+            next_cursor = encode_behavior_cursor(items[-1])
+
+        mids = {item["mid"] for item in items}
+        names = dict(db.session.query(Movie.id, Movie.name).filter(Movie.id.in_(mids))) if mids else {}
+        behavior_list = []
+        for item in items:
+            row = {
+                "mid": item["mid"],
+                "movie_name": names.get(item["mid"], "未知电影"),
+                "time": item["_time"].strftime("%Y-%m-%d %H:%M:%S"),
+                "type": "评分" if item["source"] == "rating" else "浏览",
+            }
+            if item["source"] == "rating":
+                row["score"] = item["score"]
+            behavior_list.append(row)
+        return {"code": 1, "msg": "获取行为记录成功", "data": {"behavior_list": behavior_list, "next_cursor": next_cursor}}
+    except ValueError as e:
+        return {"code": 0, "msg": str(e), "data": {"behavior_list": [], "next_cursor": None}}
+    except Exception as e:
+        return {"code": 0, "msg": f"获取失败：{str(e)}", "data": {"behavior_list": [], "next_cursor": None}}
+
+
+USER_PAGE_SIZE = 20  # 用户列表每页默认条数
+USER_PAGE_MAX = 100
+EXPORT_BATCH_SIZE = 1000  # 导出时每次从数据库游标取的行数
+EXPORT_FLUSH_BYTES = 64 * 1024  # 导出时攒够这么多字节再发送一次
+USER_EXPORT_FIELDS = ["id", "name", "email", "sex", "create_time", "is_admin"]
+# 列表/导出只读这些字段（不读密码）
+_USER_COLUMNS = (User.id, User.name, User.email, User.sex, User.create_time, User.is_admin)
+
+
+def user_filters(args):
+    """
+    把查询参数转换成过滤条件（列表和导出共用）
+    :param args: is_admin（1/0）、start_date / end_date（注册日期，YYYY-MM-DD，含当天）、email（邮箱前缀）
+    :return: SQLAlchemy条件列表；参数格式不对时抛出ValueError
+    """
+    conditions = []
+    is_admin = args.get("is_admin")
+    if is_admin not in (None, ""):
+        if is_admin not in ("0", "1", "true", "false"):
+            raise ValueError("is_admin只能为1或0")
+        if is_admin in ("1", "true"):
+            conditions.append(User.is_admin.is_(True))
+        else:
+            # is_admin为NULL的老数据也算非管理员（与user_row_to_dict的bool()一致）
+            conditions.append(or_(User.is_admin.is_(False), User.is_admin.is_(None)))
+    try:
+        if args.get("start_date"):
+            start = datetime.datetime.strptime(args["start_date"], "%Y-%m-%d")
+            conditions.append(User.create_time >= start)
+        if args.get("end_date"):
+            end = datetime.datetime.strptime(args["end_date"], "%Y-%m-%d") + datetime.timedelta(days=1)
+            conditions.append(User.create_time < end)
+    except ValueError:
+        raise ValueError("日期格式应为YYYY-MM-DD")
+    email = (args.get("email") or "").strip()
+    if email:
+        # 前缀匹配可以走email的唯一索引；转义LIKE通配符
+        escaped = email.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conditions.append(User.email.like(escaped + "%", escape="\\"))
+    return conditions
+
+
+def user_row_to_dict(row):
+    """用户列表/导出的统一格式"""
+    return {
+        "id": row.id,
+        "name": row.name,
+        "email": row.email,
+        "sex": "男" if row.sex else "女" if row.sex is not None else "未设置",
+        "create_time": row.create_time.strftime("%Y-%m-%d %H:%M:%S") if row.create_time else "",
+        "is_admin": bool(row.is_admin),
+    }
+
+
+def _csv_safe(row):
+    """防CSV注入：以= + - @开头的文本单元格前加单引号，Excel不会把它当公式执行"""
+    return {key: "'" + value if isinstance(value, str) and value[:1] in ("=", "+", "-", "@") else value
+            for key, value in row.items()}
+
+
+def get_user_list(db, args, page=1, page_size=USER_PAGE_SIZE):
+    """
+    管理员分页查询用户（按用户ID排序）
+    :param args: 过滤参数，见user_filters
+    :return: 本页用户和符合条件的总数
+    """
+    try:
+        conditions = user_filters(args)
+        page = max(1, int(page))
+        page_size = max(1, min(int(page_size), USER_PAGE_MAX))
+        total = db.session.query(db.func.count(User.id)).filter(*conditions).scalar()
+        rows = db.session.query(*_USER_COLUMNS).filter(*conditions).order_by(User.id) \
+            .offset((page - 1) * page_size).limit(page_size).all()
+        data = {"user_list": [user_row_to_dict(row) for row in rows], "total": total, "page": page, "page_size": page_size}
+        return {"code": 1, "msg": "获取用户列表成功", "data": data}
+    except ValueError as e:
+        return {"code": 0, "msg": str(e), "data": {"user_list": [], "total": 0}}
+    except Exception as e:
+        return {"code": 0, "msg": f"获取失败：{str(e)}", "data": {"user_list": [], "total": 0}}
+
+
+def export_users(db, args, fmt="csv"):
+    """
+    流式导出用户（CSV或NDJSON）：服务端游标按批读取，边读边发送，内存占用与用户总数无关
+    过滤参数在调用时立即校验（格式不对时抛出ValueError），数据在迭代返回的生成器时才读取
+    :param fmt: csv / ndjson
+    :return: 逐段产生文本的生成器
+    """
+    if fmt not in ("csv", "ndjson"):
+        raise ValueError("导出格式只能为csv或ndjson")
+    conditions = user_filters(args)
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=USER_EXPORT_FIELDS) if fmt == "csv" else None
+        if writer:
+            buffer.write("\ufeff")  # BOM：Excel打开时按UTF-8识别中文
+            writer.writeheader()
+        query = db.session.query(*_USER_COLUMNS).filter(*conditions).order_by(User.id) \
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        for row in query:
+            if writer:
+                writer.writerow(_csv_safe(user_row_to_dict(row)))
+            else:
+                buffer.write(json.dumps(user_row_to_dict(row), ensure_ascii=False) + "\n")
+            if buffer.tell() >= EXPORT_FLUSH_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    return generate()
@@ -1,21 +1,106 @@
-# 权限验证工具：检查用户是否为管理员
+# 权限验证工具：登录令牌的签发/校验，检查用户是否为管理员
+# - 登录时签发带签名和过期时间的令牌（itsdangerous），令牌里带用户ID和管理员标记，校验时不查数据库
+# - 令牌里还带该用户的令牌版本号（user.token_version）：修改管理员身份时版本号+1，之前签发的令牌全部失效
+#   （版本号存在数据库中，重启不丢；校验时经接口缓存读取，按AUTH_USER_CACHE_TTL秒过期，撤销时立即失效）
+# - 兼容旧前端（AUTH_ALLOW_USER_ID=True时）：Authorization直接传用户ID时查库确认身份，同样经接口缓存
 from functools import wraps
-from flask import jsonify, request
+from flask import jsonify, request, current_app, g
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from models.user import User
+from utils import cache
+
+TOKEN_SALT = "auth-token"
+CACHE_NAMESPACE = "auth_user"
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config["SECRET_KEY"], salt=TOKEN_SALT)
+
+
+def issue_token(user):
+    """为登录用户签发令牌（包含用户ID、管理员标记、令牌版本号，签发时间由签名自带）"""
+    return _serializer().dumps({
+        "uid": user.id,
+        "adm": bool(user.is_admin),
+        "ver": user.token_version or 0,
+    })
+
+
+def _lookup_user(user_id):
+    """
+    按用户ID查身份（经接口缓存，只查id、is_admin、token_version三个字段）
+    :return: (用户ID, 是否管理员, 令牌版本号)，用户不存在时返回None
+    """
+    def query():
+        row = User.query.with_entities(User.id, User.is_admin, User.token_version) \
+            .filter(User.id == user_id).first()
+        return (row.id, bool(row.is_admin), row.token_version or 0) if row else None
+    return cache.get_or_compute(cache.make_key(CACHE_NAMESPACE, user_id), query,
+                                current_app.config["AUTH_USER_CACHE_TTL"])
+
+
+def verify_token(token):
+    """
+    校验令牌（令牌版本号经缓存读取，通常不查数据库）
+    :return: (用户ID, 是否管理员)；签名不对、已过期、已撤销或用户不存在时返回None
+    """
+    try:
+        data = _serializer().loads(token, max_age=current_app.config["AUTH_TOKEN_MAX_AGE"])
+    except (SignatureExpired, BadSignature):
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("uid"), int):
+        return None
+    user = _lookup_user(data["uid"])
+    if user is None or data.get("ver") != user[2]:
+        return None
+    return data["uid"], bool(data["adm"])
+
+
+def get_identity(credential=None):
+    """
+    解析当前请求的身份
+    :param credential: 默认取Authorization请求头（“Bearer 令牌”、令牌本身，或旧前端直接传的用户ID）
+    :return: (用户ID, 是否管理员)，无法识别时返回None
+    """
+    credential = (credential if credential is not None else request.headers.get("Authorization", "")).strip()
+    if credential.startswith("Bearer "):
+        credential = credential[len("Bearer "):].strip()
+    if not credential:
+        return None
+    if credential.isdigit():
+        if not current_app.config["AUTH_ALLOW_USER_ID"]:
+            return None
+        user = _lookup_user(int(credential))
+        return user[:2] if user else None
+    return verify_token(credential)
+
+
+def revoke_user(db, user_id):
+    """
+    撤销该用户已签发的全部令牌：令牌版本号+1并提交，再清除身份缓存（修改管理员身份、禁用账号时调用）
+    :param db: 数据库对象
+    :param user_id: 用户ID
+    """
+    db.session.query(User).filter(User.id == user_id) \
+        .update({User.token_version: User.token_version + 1}, synchronize_session=False)
+    db.session.commit()
+    cache.invalidate(CACHE_NAMESPACE, user_id)
+
 
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # 从请求头获取用户ID（假设前端登录后将user_id存入Authorization头）
-        user_id = request.headers.get("Authorization")
-        if not user_id:
+        # 从请求头获取登录令牌（旧前端直接传user_id）
+        if not request.headers.get("Authorization"):
             return jsonify({"code": 0, "msg": "请先登录", "data": {}})
-        
+
         # 验证用户是否为管理员
-        user = User.query.get(int(user_id))
-        if not user or not user.is_admin:
+        identity = get_identity()
+        if identity is None:
+            return jsonify({"code": 0, "msg": "登录已失效，请重新登录", "data": {}})
+        if not identity[1]:
             return jsonify({"code": 0, "msg": "权限不足：仅管理员可操作", "data": {}})
-        
+
+        g.user_id = identity[0]
         return f(*args, **kwargs)
     return decorated_function
-
@@ -0,0 +1,283 @@
+# 接口结果缓存：包装movie_service / recommend_service中的读函数，数据变化时按命名空间/键精确失效
+# - 默认后端为进程内LRU（条目数上限 + TTL），可换成Redis（配置CACHE_REDIS_URL，多进程部署时共享）
+# - 每个命名空间有一个“代号”计数器，整体失效时代号+1，旧代号的条目不再被读到，随LRU/TTL自然淘汰
+# - 防击穿：同一个键同时未命中时只有一个线程计算，其余线程等待并直接使用它的结果
+# 注意：内存后端直接返回缓存的对象本身，调用方不要修改返回值
+import functools
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # 未安装redis时只能使用进程内缓存
+    redis = None
+
+MISSING = object()
+
+
+class CacheBackend:
+    """
+    缓存后端接口：
+    - get(key) → 值，不存在或已过期时返回MISSING
+    - set(key, value, ttl) / delete(key) / clear()
+    - incr(key) / counter(key)：整数计数器（用于命名空间代号），不受TTL和容量淘汰影响
+    - stats() → 命中/未命中/淘汰等统计
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def incr(self, key):
+        raise NotImplementedError
+
+    def counter(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class MemoryCache(CacheBackend):
+    """进程内LRU缓存：超过max_entries时淘汰最久未使用的条目，读到过期条目时删除"""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # 键 → (过期时间, 值)
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return MISSING
+            if entry[0] <= time.monotonic():
+                del self._data[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def counter(self, key):
+        return self._counters.get(key, 0)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._data), max_entries=self.max_entries)
+
+
+class RedisCache(CacheBackend):
+    """Redis后端（需安装redis），值用pickle序列化；命中统计取自服务端INFO"""
+
+    def __init__(self, url, prefix="movie:"):
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        data = self.client.get(self.prefix + key)
+        return MISSING if data is None else pickle.loads(data)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + "counter:" + key)
+
+    def counter(self, key):
+        return int(self.client.get(self.prefix + "counter:" + key) or 0)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            if not key.decode().startswith(self.prefix + "counter:"):
+                self.client.delete(key)
+
+    def stats(self):
+        info = self.client.info("stats")
+        return {"hits": info.get("keyspace_hits"), "misses": info.get("keyspace_misses"),
+                "evictions": info.get("evicted_keys"), "expirations": info.get("expired_keys")}
+
+
+class NullCache(CacheBackend):
+    """不缓存（CACHE_ENABLED=False时使用）"""
+
+    def get(self, key):
+        return MISSING
+
+    def set(self, key, value, ttl):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def incr(self, key):
+        return 0
+
+    def counter(self, key):
+        return 0
+
+    def clear(self):
+        pass
+
+
+# ---------------------- 全局缓存 ----------------------
+_backend = MemoryCache()
+_default_ttl = 60
+_inflight = {}  # 正在计算的键 → _Flight
+_inflight_lock = threading.Lock()
+_layer_stats = {"coalesced": 0, "invalidations": 0}
+
+
+class _Flight:
+    """一次正在进行的计算，等待者通过event拿到结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = MISSING
+        self.stale = False  # 计算期间该键被单独失效：结果可能是旧数据，不写入缓存
+
+
+def init_app(app):
+    """根据配置选择缓存后端"""
+    global _backend, _default_ttl
+    _default_ttl = app.config["CACHE_DEFAULT_TTL"]
+    if not app.config["CACHE_ENABLED"]:
+        _backend = NullCache()
+    elif app.config.get("CACHE_REDIS_URL"):
+        if redis is None:
+            raise RuntimeError("配置了CACHE_REDIS_URL，但未安装redis（pip install redis）")
+        _backend = RedisCache(app.config["CACHE_REDIS_URL"])
+    else:
+        _backend = MemoryCache(app.config["CACHE_MAX_ENTRIES"])
+
+
+def _default_cache_if(result):
+    """只缓存成功的结果：接口返回格式看code，其余看是否为空"""
+    if isinstance(result, dict) and "code" in result:
+        return result["code"] == 1
+    return result is not None
+
+
+def make_key(namespace, key):
+    return f"{namespace}:{_backend.counter(namespace)}:{key}"
+
+
+def get_or_compute(full_key, compute, ttl=None, cache_if=_default_cache_if):
+    """读取缓存，未命中时计算并写入；同一个键并发未命中时只计算一次"""
+    value = _backend.get(full_key)
+    if value is not MISSING:
+        return value
+
+    with _inflight_lock:
+        flight = _inflight.get(full_key)
+        leader = flight is None
+        if leader:
+            flight = _inflight[full_key] = _Flight()
+    if not leader:
+        flight.event.wait()
+        if flight.value is not MISSING:
+            with _inflight_lock:
+                _layer_stats["coalesced"] += 1
+            return flight.value
+        return compute()  # 计算者失败了，自己再算一次
+
+    # 整个命名空间失效时计数器变化，新请求用的是新键，这里写入的旧键不会再被读到；
+    # 只有单个键的删除需要按flight.stale判断。写入后再检查一次：失效恰好发生在检查和写入之间时删掉刚写入的值
+    try:
+        value = compute()
+        if cache_if(value) and not flight.stale:
+            _backend.set(full_key, value, ttl or _default_ttl)
+            if flight.stale:
+                _backend.delete(full_key)
+        flight.value = value
+        return value
+    finally:
+        with _inflight_lock:
+            _inflight.pop(full_key, None)
+        flight.event.set()
+
+
+def cached(namespace, key=None, ttl=None, cache_if=_default_cache_if):
+    """
+    缓存服务函数的结果（函数第一个参数为db，不参与缓存键）
+    :param namespace: 命名空间，失效时使用
+    :param key: 由其余参数生成缓存键的函数，默认用全部参数的repr
+    :param ttl: 过期秒数，默认CACHE_DEFAULT_TTL
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(db, *args, **kwargs):
+            key_part = key(*args, **kwargs) if key else repr((args, sorted(kwargs.items())))
+            return get_or_compute(make_key(namespace, key_part), lambda: func(db, *args, **kwargs), ttl, cache_if)
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+
+def invalidate(namespace, key=MISSING):
+    """
+    失效缓存：传key时只删除这一个条目（键与@cached的key函数返回值一致），否则整个命名空间失效
+    """
+    if key is MISSING:
+        with _inflight_lock:
+            _layer_stats["invalidations"] += 1
+        _backend.incr(namespace)
+        return
+    full_key = make_key(namespace, key)
+    with _inflight_lock:
+        _layer_stats["invalidations"] += 1
+        flight = _inflight.get(full_key)
+        if flight is not None:
+            flight.stale = True
+    _backend.delete(full_key)
+
+
+def clear():
+    _backend.clear()
+
+
+def get_stats():
+    """缓存统计：命中/未命中/淘汰/过期/防击穿合并次数/失效次数"""
+    stats = dict(_backend.stats(), **_layer_stats)
+    lookups = (stats.get("hits") or 0) + (stats.get("misses") or 0)
+    stats["hit_rate"] = round((stats.get("hits") or 0) / lookups, 4) if lookups else 0.0
+    stats["backend"] = type(_backend).__name__
+    return stats
@@ -0,0 +1,48 @@
+# 模型/索引文件的变化检测：多进程部署时各worker各自在内存中加载同一份文件，
+# 某个worker（或manage.py离线命令）重新生成文件后，其他进程通过修改时间发现变化并重新加载
+import os
+import threading
+import time
+
+CHECK_SECONDS = 30  # 两次检查（stat）之间的最短间隔
+
+
+class FileWatcher:
+    """记录文件上次加载/保存时的修改时间，changed()在文件被其他进程替换后返回True（同一次变化只返回一次）"""
+
+    def __init__(self, path, check_seconds=CHECK_SECONDS):
+        self.path = path
+        self.check_seconds = check_seconds
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current_mtime(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def mark(self):
+        """本进程刚加载或保存了该文件：记下当前修改时间，之后不再视为变化"""
+        with self._lock:
+            self._mtime = self._current_mtime()
+            self._checked_at = time.monotonic()
+
+    def changed(self, force=False):
+        """
+        距上次检查超过check_seconds时stat一次；文件存在且修改时间与记录的不同则返回True
+        :param force: 忽略检查间隔，立即stat（写回文件前先合并其他进程的修改时使用）
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_seconds:
+            return False
+        with self._lock:
+            if not force and now - self._checked_at < self.check_seconds:
+                return False
+            self._checked_at = now
+            mtime = self._current_mtime()
+            if mtime is None or mtime == self._mtime:
+                return False
+            self._mtime = mtime
+            return True
@@ -0,0 +1,225 @@
+# 请求监控指标：每个接口的延迟分布、每个请求的SQL条数/数据库耗时、响应字节数，以及推荐等服务的分阶段耗时
+# - 指标保存在进程内（多进程部署时每个worker各自统计，/metrics返回的是处理本次抓取的那个worker的数据）
+# - /metrics 接口输出Prometheus文本格式
+# - 超过SLOW_REQUEST_MS的请求打印一行日志；按PROFILE_SAMPLE_RATE抽样对请求做cProfile，慢请求的结果保存到PROFILE_DIR
+import cProfile
+import datetime
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_lock = threading.Lock()  # 所有指标共用一把锁（每次更新只是几次加法）
+
+
+class Counter:
+    """计数器：按标签值分别累加"""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}  # 标签值元组 → 累计值
+
+    def inc(self, *label_values, amount=1):
+        with _lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with _lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """直方图：固定分桶（上界），按标签值分别统计各桶计数、总和、总数"""
+
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        self._series = {}  # 标签值元组 → [各桶计数（非累计）..., 超出最大上界的计数, 总和]
+
+    def observe(self, value, *label_values):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with _lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                labels = _format_labels(self.labels + ("le",), label_values + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pairs.append(f"{name}=\"{value}\"")
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+# ---------------------- 指标定义 ----------------------
+REQUESTS = Counter("http_requests_total", "处理的请求数", ("endpoint", "method", "status"))
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "请求处理耗时（秒，流式响应不含发送时间）",
+                            LATENCY_BUCKETS, ("endpoint", "method"))
+REQUEST_QUERIES = Histogram("http_request_sql_queries", "每个请求执行的SQL条数", QUERY_BUCKETS, ("endpoint",))
+REQUEST_DB_TIME = Histogram("http_request_sql_seconds", "每个请求的数据库耗时（秒）", LATENCY_BUCKETS, ("endpoint",))
+RESPONSE_BYTES = Histogram("http_response_bytes", "响应体字节数（流式响应不计）", BYTES_BUCKETS, ("endpoint",))
+STAGE_LATENCY = Histogram("service_stage_duration_seconds", "服务内部各阶段耗时（秒）",
+                          LATENCY_BUCKETS, ("operation", "stage"))
+DB_QUERIES = Counter("db_queries_total", "执行的SQL条数（含后台线程）")
+DB_TIME = Counter("db_query_seconds_total", "SQL累计耗时（秒，含后台线程）")
+PROFILES = Counter("profiles_saved_total", "保存的慢请求cProfile结果数")
+REGISTRY = [REQUESTS, REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_DB_TIME, RESPONSE_BYTES, STAGE_LATENCY,
+            DB_QUERIES, DB_TIME, PROFILES]
+
+_slow_request_ms = 1000
+_profile_sample_rate = 0.0
+_profile_dir = None
+_profile_lock = threading.Lock()  # 同一时刻只对一个请求做cProfile（cProfile不能在多个线程同时启用）
+
+
+def init_app(app):
+    """注册请求钩子和SQL事件（需在db.init_app之后调用）；METRICS_ENABLED=False时不统计"""
+    global _slow_request_ms, _profile_sample_rate, _profile_dir
+    if not app.config["METRICS_ENABLED"]:
+        return
+    _slow_request_ms = app.config["SLOW_REQUEST_MS"]
+    _profile_sample_rate = app.config["PROFILE_SAMPLE_RATE"]
+    _profile_dir = app.config["PROFILE_DIR"]
+    with app.app_context():
+        from models import db
+        event.listen(db.engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(db.engine, "after_cursor_execute", _after_cursor_execute)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_stop_profiler)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_query_start"].pop()
+    DB_QUERIES.inc()
+    DB_TIME.inc(amount=elapsed)
+    if has_request_context() and "metrics" in g:
+        g.metrics["queries"] += 1
+        g.metrics["db_time"] += elapsed
+
+
+def _start_request():
+    g.metrics = {"start": time.perf_counter(), "queries": 0, "db_time": 0.0, "stages": {}}
+    if _profile_sample_rate and random.random() < _profile_sample_rate and _profile_lock.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def _finish_request(response):
+    stats = g.get("metrics")
+    if stats is None:
+        return response
+    elapsed = time.perf_counter() - stats["start"]
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"  # 用路由规则而非实际路径，避免标签无限增长
+    REQUESTS.inc(endpoint, request.method, response.status_code)
+    REQUEST_LATENCY.observe(elapsed, endpoint, request.method)
+    REQUEST_QUERIES.observe(stats["queries"], endpoint)
+    REQUEST_DB_TIME.observe(stats["db_time"], endpoint)
+    if not response.is_streamed:
+        RESPONSE_BYTES.observe(response.calculate_content_length() or 0, endpoint)
+
+    elapsed_ms = elapsed * 1000
+    profiler = _stop_profiler()
+    if elapsed_ms >= _slow_request_ms:
+        stages = "，".join(f"{name}={ms:.1f}ms" for name, ms in stats["stages"].items())
+        print(f"慢请求：{request.method} {request.full_path.rstrip('?')} 耗时{elapsed_ms:.0f}ms，"
+              f"SQL {stats['queries']}条/{stats['db_time'] * 1000:.0f}ms" + (f"，{stages}" if stages else ""))
+        if profiler is not None:
+            _save_profile(profiler, endpoint, elapsed_ms)
+    return response
+
+
+def _stop_profiler(exc=None):
+    """停止本请求的cProfile（after_request和teardown都会调用，只生效一次）"""
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        _profile_lock.release()
+    return profiler
+
+
+def _save_profile(profiler, endpoint, elapsed_ms):
+    """保存为 PROFILE_DIR/时间-接口-耗时.prof（用 python -m pstats 或 snakeviz 查看）"""
+    try:
+        os.makedirs(_profile_dir, exist_ok=True)
+        name = endpoint.strip("/").replace("/", "_").replace("<", "").replace(">", "").replace(":", "-") or "root"
+        path = os.path.join(_profile_dir, f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{name}-{elapsed_ms:.0f}ms.prof")
+        profiler.dump_stats(path)
+        PROFILES.inc()
+    except OSError as e:
+        print(f"保存性能分析结果失败：{str(e)}")
+
+
+@contextmanager
+def stage(operation, name):
+    """
+    统计服务内部一个阶段的耗时（记入service_stage_duration_seconds，并附在慢请求日志中）
+    用法：with metrics.stage("recommend", "load_ratings"): ...
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.observe(elapsed, operation, name)
+        if has_request_context() and "metrics" in g:
+            stages = g.metrics["stages"]
+            key = f"{operation}.{name}"
+            stages[key] = stages.get(key, 0.0) + elapsed * 1000
+
+
+def render():
+    """全部指标的Prometheus文本格式"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
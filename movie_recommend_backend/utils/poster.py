@@ -0,0 +1,25 @@
+# 海报工具：内容摘要（ETag / 缓存键）和图片格式识别
+import hashlib
+
+# 常见图片格式的文件头
+_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+
+def content_hash(data):
+    """海报内容的SHA-256摘要（十六进制），内容不变则摘要不变"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def sniff_mimetype(data):
+    """根据文件头识别图片类型，识别不了时按JPEG处理（与前端上传格式一致）"""
+    for signature, mimetype in _SIGNATURES:
+        if data.startswith(signature):
+            return mimetype
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
@@ -0,0 +1,148 @@
+# 数据库结构迁移工具：给已存在的表补齐模型中新增的字段和索引
+# db.create_all() 只会创建不存在的表，不会修改已有表，因此模型新增字段后需要执行 manage.py migrate
+# 另外提供启动时的索引检查、唯一索引前的重复数据清理、以及用EXPLAIN检查查询是否走索引
+from sqlalchemy import inspect, text, func, select
+
+
+def add_missing_columns(db, model):
+    """
+    给模型对应的表补齐缺失的字段（ALTER TABLE ... ADD COLUMN）
+    :param db: 数据库对象
+    :param model: 模型类
+    :return: 新增的字段名列表
+    """
+    table = model.__table__
+    existing = {column["name"] for column in inspect(db.engine).get_columns(table.name)}
+    dialect = db.engine.dialect
+    added = []
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        ddl = f"ALTER TABLE {dialect.identifier_preparer.quote(table.name)} " \
+              f"ADD COLUMN {dialect.identifier_preparer.quote(column.name)} {column.type.compile(dialect=dialect)}"
+        if column.server_default is not None:
+            ddl += f" DEFAULT {column.server_default.arg}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+        db.session.execute(text(ddl))
+        added.append(column.name)
+    db.session.commit()
+    return added
+
+
+def count_duplicates(db, index):
+    """唯一索引的列上已有多少组重复数据（建唯一索引前检查，有重复时建索引会失败）"""
+    columns = list(index.columns)
+    groups = select(*columns).group_by(*columns).having(func.count() > 1).subquery()
+    return db.session.execute(select(func.count()).select_from(groups)).scalar()
+
+
+def delete_duplicates(db, model, columns):
+    """
+    删除columns上重复的行，每组只保留ID最大（最新写入）的一行
+    :return: 删除的行数
+    """
+    table = model.__table__
+    group_columns = [table.c[name] for name in columns]
+    keep = select(func.max(table.c.id)).group_by(*group_columns).subquery()
+    # MySQL不允许DELETE的子查询直接引用被删除的表，外面再包一层派生表
+    keep_ids = select(keep.c[0]).subquery()
+    result = db.session.execute(table.delete().where(table.c.id.not_in(select(keep_ids))))
+    db.session.commit()
+    return result.rowcount
+
+
+def add_missing_indexes(db, model):
+    """
+    给模型对应的表补齐模型中声明、但数据库中还没有的索引
+    已有重复数据的唯一索引不创建，在返回值中注明跳过原因（先用 manage.py migrate --dedupe 清理）
+    :return: 新增的索引名列表
+    """
+    table = model.__table__
+    existing = {index["name"] for index in inspect(db.engine).get_indexes(table.name)}
+    added = []
+    for index in table.indexes:
+        if index.name in existing:
+            continue
+        if index.unique:
+            duplicates = count_duplicates(db, index)
+            if duplicates:
+                added.append(f"{index.name}（跳过：{duplicates}组重复数据）")
+                continue
+        index.create(bind=db.engine)
+        added.append(index.name)
+    return added
+
+
+def missing_columns(db, models):
+    """
+    模型中声明、但数据库中还没有的字段（只检查已存在的表）；缺字段时相关查询会直接报错
+    :return: {表名: [缺失的字段名]}
+    """
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    missing = {}
+    for model in models:
+        table = model.__table__
+        if table.name not in tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        names = [column.name for column in table.columns if column.name not in existing]
+        if names:
+            missing[table.name] = names
+    return missing
+
+
+def missing_indexes(db, models):
+    """
+    模型中声明、但数据库中还没有的索引（只检查已存在的表）
+    :return: {表名: [缺失的索引名]}
+    """
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    missing = {}
+    for model in models:
+        table = model.__table__
+        if table.name not in tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        names = [index.name for index in table.indexes if index.name not in existing]
+        if names:
+            missing[table.name] = names
+    return missing
+
+
+def explain(db, statement):
+    """
+    查看查询的执行计划（支持SQLite和MySQL）
+    :param statement: SQLAlchemy查询语句（select(...)）
+    :return: (是否走索引, 执行计划的文本行列表)
+    全表扫描、或需要额外排序（SQLite的TEMP B-TREE、MySQL的filesort）都算没有走索引；
+    SQLite的“RIGHT PART OF ORDER BY”表示主排序列已由索引给出，只对并列项排序，不算
+    """
+    dialect = db.engine.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    if dialect.name == "sqlite":
+        rows = db.session.execute(text("EXPLAIN QUERY PLAN " + sql)).mappings().all()
+        plan = [row["detail"] for row in rows]
+        ok = bool(plan) and not any(line.startswith("SCAN") or "TEMP B-TREE FOR ORDER BY" in line for line in plan)
+    else:
+        rows = db.session.execute(text("EXPLAIN " + sql)).mappings().all()
+        plan = [f"table={row['table']} type={row['type']} key={row['key']} rows={row['rows']} extra={row['Extra']}"
+                for row in rows]
+        ok = bool(rows) and all(row["type"] != "ALL" and "filesort" not in (row["Extra"] or "") for row in rows)
+    return ok, plan
+
+
+def migrate(db, models):
+    """
+    依次创建缺失的表、补齐字段和索引
+    :return: {表名: [新增的字段/索引名]}
+    """
+    db.create_all()
+    report = {}
+    for model in models:
+        changes = add_missing_columns(db, model) + add_missing_indexes(db, model)
+        if changes:
+            report[model.__tablename__] = changes
+    return report
@@ -0,0 +1,5 @@
+# 生产环境WSGI入口：gunicorn -c gunicorn.conf.py wsgi:app
+# 每个worker进程导入本模块时创建一次应用（不使用preload：推荐模型等后台线程要在worker进程中启动）
+from app import create_app
+
+app = create_app()